@@ -0,0 +1,305 @@
+"""
+Benchmarks for the preprocessing pipeline and the usage guard.
+
+    python benchmark.py pipeline [--sizes 10k,1m,10m] [--formats dmesg,nginx]
+                                 [--json results.json] [--compare old.json]
+    python benchmark.py classify [--lines 200000]
+    python benchmark.py parallel [--lines 200000] [--workers 4] [--file app.log]
+    python benchmark.py usage [--requests 10000] [--identities 500]
+
+`pipeline` times _categorize_line, _compress_repetitive, preprocess_log and
+split_into_chunks on synthetic logs (synthetic_logs.py). Every case runs in
+a fresh process so peak RSS is per case; results go to --json as a
+machine-readable document that --compare can diff against a previous run.
+`parallel` checks that preprocess_parallel gives the same result as
+preprocess_log, with small shards so the marker probe crosses them.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from multiprocessing import get_context
+
+from log_processor import (
+    _categorize_line, _compress_repetitive, preprocess_log, preprocess_parallel,
+    split_into_chunks, SeverityClassifier,
+)
+from synthetic_logs import GENERATORS, generate
+
+
+STAGES = ("categorize", "compress", "preprocess", "chunk")
+
+
+def _timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+# ─── Peak RSS ───────────────────────────────────────────────────────────────
+
+def _reset_peak_rss() -> bool:
+    """Reset VmHWM (Linux); False if the kernel doesn't allow it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# ─── Pipeline suite ─────────────────────────────────────────────────────────
+
+def _run_case(stage: str, fmt: str, lines: int, error_ratio: float, repetition_ratio: float) -> dict:
+    """Runs in a fresh worker process: generate input, then time one stage."""
+    log_lines = generate(fmt, lines, error_ratio, repetition_ratio)
+    text = "\n".join(log_lines)
+    size = len(text.encode("utf-8"))
+
+    if stage == "categorize":
+        fn, args = (lambda ls: [_categorize_line(l) for l in ls]), (log_lines,)
+    elif stage == "compress":
+        fn, args = _compress_repetitive, (log_lines,)
+    elif stage == "preprocess":
+        fn, args = preprocess_log, (text,)
+        del log_lines
+    else:
+        fn, args = split_into_chunks, (preprocess_log(text).processed_text,)
+        del log_lines
+
+    exact = _reset_peak_rss()
+    seconds = _timed(fn, *args)
+    return {
+        "stage": stage,
+        "format": fmt,
+        "lines": lines,
+        "bytes": size,
+        "seconds": round(seconds, 4),
+        "lines_per_s": round(lines / seconds) if seconds else None,
+        "mb_per_s": round(size / 1e6 / seconds, 2) if seconds else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        # Without a VmHWM reset the peak includes input generation
+        "peak_rss_stage_only": exact,
+    }
+
+
+def _parse_size(value: str) -> int:
+    value = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _compare(results: list[dict], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["stage"], r["format"], r["lines"]): r for r in baseline["results"]}
+    print(f"\ncompared with {baseline.get('commit') or baseline_path}:")
+    for r in results:
+        before = old.get((r["stage"], r["format"], r["lines"]))
+        if not before or not before["seconds"] or not r["seconds"]:
+            continue
+        speed = before["seconds"] / r["seconds"]
+        rss = r["peak_rss_mb"] - before["peak_rss_mb"]
+        flag = "  REGRESSION" if speed < 0.9 else ""
+        print(f"  {r['stage']:<10} {r['format']:<8} {r['lines']:>10}  {speed:5.2f}x speed  {rss:+8.1f} MB rss{flag}")
+
+
+def bench_pipeline(args) -> None:
+    sizes = [_parse_size(s) for s in args.sizes.split(",")]
+    formats = args.formats.split(",")
+    stages = args.stages.split(",")
+    results = []
+
+    ctx = get_context("spawn")
+    for lines in sizes:
+        for fmt in formats:
+            for stage in stages:
+                with ctx.Pool(1, maxtasksperchild=1) as pool:
+                    r = pool.apply(_run_case, (stage, fmt, lines, args.error_ratio, args.repetition_ratio))
+                results.append(r)
+                print(
+                    f"{stage:<10} {fmt:<8} {lines:>10} lines  {r['seconds']:9.3f}s  "
+                    f"{r['lines_per_s'] or 0:>12,} lines/s  {r['mb_per_s'] or 0:8.2f} MB/s  "
+                    f"{r['peak_rss_mb']:8.1f} MB peak"
+                )
+
+    document = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "params": {"error_ratio": args.error_ratio, "repetition_ratio": args.repetition_ratio},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.compare:
+        _compare(results, args.compare)
+
+
+# ─── Classifier comparison ──────────────────────────────────────────────────
+
+def bench_classifier(args) -> None:
+    lines = [line for fmt in GENERATORS for line in generate(fmt, args.lines // len(GENERATORS))]
+    classifier = SeverityClassifier()
+
+    assert classifier.classify_lines(lines) == [_categorize_line(l) for l in lines]
+
+    per_line = _timed(lambda: [_categorize_line(l) for l in lines])
+    batch = _timed(classifier.classify_lines, lines)
+
+    n = len(lines)
+    print(f"classify {n} lines")
+    print(f"  _categorize_line loop : {per_line:.3f}s  {n / per_line:,.0f} lines/s")
+    print(f"  classify_lines batch  : {batch:.3f}s  {n / batch:,.0f} lines/s")
+    print(f"  speedup               : {per_line / batch:.2f}x")
+
+
+# ─── Parallel equivalence ───────────────────────────────────────────────────
+
+def _stored(processed) -> tuple:
+    store = processed.lines
+    return store.lines(), list(store.codes), list(store.line_numbers)
+
+
+def check_parallel(args) -> None:
+    """Serial vs parallel preprocessing; exits 1 if any output differs."""
+    if args.file:
+        with open(args.file, "rb") as f:
+            cases = {os.path.basename(args.file): f.read()}
+    else:
+        cases = {fmt: "\n".join(generate(fmt, args.lines)).encode() for fmt in GENERATORS}
+
+    failed = False
+    for name, data in cases.items():
+        serial = preprocess_log(data.decode("utf-8", errors="ignore"))
+        start = time.perf_counter()
+        blocks = (data[n:n + 65536] for n in range(0, len(data), 65536))
+        parallel = preprocess_parallel(blocks, args.workers, shard_bytes=args.shard_bytes)
+        seconds = time.perf_counter() - start
+        differences = [
+            what for what, same in (
+                ("summary_stats", serial.summary_stats == parallel.summary_stats),
+                ("processed_text", serial.processed_text == parallel.processed_text),
+                ("lines", _stored(serial) == _stored(parallel)),
+            ) if not same
+        ]
+        failed = failed or bool(differences)
+        print(
+            f"{name:<12} {parallel.perf['shards']:>4} shards  {seconds:8.3f}s  "
+            + ("identical" if not differences else "DIFFERS: " + ", ".join(differences))
+        )
+    if failed:
+        sys.exit(1)
+
+
+# ─── Usage guard load test ──────────────────────────────────────────────────
+
+class _FakeRequest:
+    def __init__(self, anon_id: str):
+        self.headers = {"x-anon-id": anon_id}
+        self.client = None
+
+
+def bench_usage_guard(args) -> None:
+    """Concurrent anonymous requests against FakeSupabase with network-like latency."""
+    from fastapi import HTTPException
+    from fake_supabase import FakeSupabase
+    from usage_guard import usage_guard, UsageCounters
+    import usage_guard as guard_module
+
+    requests, identities, latency = args.requests, args.identities, args.latency
+    db = FakeSupabase(latency=latency)
+    guard_module.usage_counters = UsageCounters(flush_interval=0.5)
+    rng = random.Random(0)
+    ids = [f"anon-{rng.randrange(identities)}" for _ in range(requests)]
+
+    async def one(anon_id: str) -> bool:
+        try:
+            await usage_guard(_FakeRequest(anon_id), None, db)
+            return True
+        except HTTPException:
+            return False
+
+    async def run():
+        start = time.perf_counter()
+        allowed = sum(await asyncio.gather(*(one(i) for i in ids)))
+        elapsed = time.perf_counter() - start
+        await guard_module.usage_counters.close()
+        return allowed, elapsed
+
+    allowed, elapsed = asyncio.run(run())
+    stored = sum(r["request_count"] for r in db.tables.get("anonymous_usage", []))
+    print(f"usage guard: {requests} requests, {identities} identities, {latency * 1000:.0f}ms db latency")
+    print(f"  {elapsed:.3f}s  {requests / elapsed:,.0f} req/s  allowed={allowed}  persisted={stored}")
+    print(f"  db calls: {dict(db.calls)}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("pipeline", help="time pipeline stages on synthetic logs")
+    p.add_argument("--sizes", default="10k,1m,10m", help="line counts, e.g. 10k,1m,10m")
+    p.add_argument("--formats", default=",".join(GENERATORS))
+    p.add_argument("--stages", default=",".join(STAGES))
+    p.add_argument("--error-ratio", type=float, default=0.05)
+    p.add_argument("--repetition-ratio", type=float, default=0.8)
+    p.add_argument("--json", help="write results document here")
+    p.add_argument("--compare", help="previous results document to compare against")
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("classify", help="SeverityClassifier vs _categorize_line")
+    p.add_argument("--lines", type=int, default=200_000)
+    p.set_defaults(func=bench_classifier)
+
+    p = sub.add_parser("parallel", help="check preprocess_parallel against preprocess_log")
+    p.add_argument("--lines", type=int, default=200_000, help="lines per synthetic format")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--shard-bytes", type=int, default=256 * 1024)
+    p.add_argument("--file", help="check this log instead of the synthetic ones")
+    p.set_defaults(func=check_parallel)
+
+    p = sub.add_parser("usage", help="usage guard load test against FakeSupabase")
+    p.add_argument("--requests", type=int, default=10_000)
+    p.add_argument("--identities", type=int, default=500)
+    p.add_argument("--latency", type=float, default=0.05, help="simulated db latency in seconds")
+    p.set_defaults(func=bench_usage_guard)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Offline preprocessing CLI.
+Runs the same preprocess + chunk pipeline as /analyze-stream on local
+files, so logs can be pre-filtered on the hosts that produce them.
+
+    python cli.py /var/log/kern.log 'archive/*.log' --out processed/
+    python cli.py big.log --workers 8 --max-chunks 16
+
+Inputs are memory-mapped and fed to the preprocessor in blocks, so
+multi-GB files never need to fit in memory. For every input NAME the
+output directory gets NAME.processed.txt and NAME.chunk-NN.txt, where NAME
+keeps the input's path relative to the inputs' common directory (a/app.log
+and b/app.log go to OUT/a/ and OUT/b/); a JSON stats document for the whole
+run is written to stats.json (or --stats).
+"""
+
+import argparse
+import glob
+import json
+import mmap
+import os
+import sys
+import time
+
+from log_processor import (
+    CHUNK_TOKEN_BUDGET, MAX_CHUNKS, LogPreprocessor, plan_chunks, preprocess_parallel, shutdown_pool,
+)
+
+
+BLOCK_BYTES = 4 * 1024 * 1024
+
+
+def _expand(patterns: list[str]) -> list[str]:
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        paths.extend(p for p in matches if p not in paths)
+    return paths
+
+
+def _output_names(paths: list[str]) -> dict[str, str]:
+    """Output name per input: its path relative to the inputs' common directory."""
+    absolute = [os.path.abspath(p) for p in paths]
+    common = os.path.commonpath([os.path.dirname(p) for p in absolute])
+    return {path: os.path.relpath(full, common) for path, full in zip(paths, absolute)}
+
+
+def _mapped_blocks(mapped, block_bytes: int = BLOCK_BYTES):
+    for start in range(0, len(mapped), block_bytes):
+        yield mapped[start:start + block_bytes]
+
+
+def _rate(amount: float, seconds: float) -> float:
+    return amount / seconds if seconds > 0 else 0.0
+
+
+def process_file(path: str, name: str, out_dir: str, workers: int, token_budget: int, max_chunks: int) -> dict:
+    size = os.path.getsize(path)
+    started = time.perf_counter()
+
+    with open(path, "rb") as f:
+        if size == 0:
+            processed = LogPreprocessor().finish()
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if workers > 1:
+                    processed = preprocess_parallel(_mapped_blocks(mapped), workers)
+                else:
+                    preprocessor = LogPreprocessor()
+                    for block in _mapped_blocks(mapped):
+                        preprocessor.feed_bytes(block)
+                    processed = preprocessor.finish()
+    preprocess_s = time.perf_counter() - started
+    if not processed.perf:
+        processed.perf = {"mode": "serial", "seconds": round(preprocess_s, 3)}
+
+    started = time.perf_counter()
+    text = processed.processed_text
+    chunks = plan_chunks(text, token_budget, max_chunks)
+    chunk_s = time.perf_counter() - started
+
+    os.makedirs(os.path.join(out_dir, os.path.dirname(name)), exist_ok=True)
+    with open(os.path.join(out_dir, f"{name}.processed.txt"), "w", encoding="utf-8") as f:
+        f.write(text)
+    for n, chunk in enumerate(chunks, 1):
+        with open(os.path.join(out_dir, f"{name}.chunk-{n:02d}.txt"), "w", encoding="utf-8") as f:
+            f.write(chunk.text(text))
+
+    lines = processed.original_line_count
+    processed_lines = text.count("\n")
+    return {
+        "file": path,
+        "output": name,
+        "bytes": size,
+        "lines": lines,
+        "processed_chars": len(text),
+        "chunks": len(chunks),
+        "summary_stats": processed.summary_stats,
+        "preprocessing": processed.perf,
+        "stages": {
+            "preprocess": {
+                "seconds": round(preprocess_s, 4),
+                "mb_per_s": round(_rate(size / 1e6, preprocess_s), 2),
+                "lines_per_s": round(_rate(lines, preprocess_s)),
+            },
+            "chunk": {
+                "seconds": round(chunk_s, 4),
+                "mb_per_s": round(_rate(len(text) / 1e6, chunk_s), 2),
+                "lines_per_s": round(_rate(processed_lines, chunk_s)),  # processed-text lines
+            },
+        },
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Preprocess and chunk log files offline.")
+    parser.add_argument("inputs", nargs="+", help="log files or glob patterns")
+    parser.add_argument("--out", default="processed", help="output directory (default: processed)")
+    parser.add_argument("--stats", help="JSON stats path (default: OUT/stats.json)")
+    parser.add_argument("--workers", type=int, default=1, help="process pool size (default: 1, serial)")
+    parser.add_argument("--token-budget", type=int, default=CHUNK_TOKEN_BUDGET)
+    parser.add_argument("--max-chunks", type=int, default=MAX_CHUNKS)
+    args = parser.parse_args(argv)
+
+    paths = _expand(args.inputs)
+    missing = [p for p in paths if not os.path.isfile(p)]
+    if missing:
+        parser.error(f"no such file: {', '.join(missing)}")
+
+    names = _output_names(paths)
+    if len(set(names.values())) < len(names):
+        parser.error("the same file is listed more than once")
+    os.makedirs(args.out, exist_ok=True)
+    results = []
+    try:
+        for path in paths:
+            result = process_file(path, names[path], args.out, args.workers, args.token_budget, args.max_chunks)
+            results.append(result)
+            pre, chunk = result["stages"]["preprocess"], result["stages"]["chunk"]
+            print(
+                f"{path}: {result['lines']} lines, {result['bytes'] / 1e6:.1f} MB -> {result['chunks']} chunks\n"
+                f"  preprocess {pre['seconds']:.3f}s  {pre['mb_per_s']:.1f} MB/s  {pre['lines_per_s']:,} lines/s\n"
+                f"  chunk      {chunk['seconds']:.3f}s  {chunk['mb_per_s']:.1f} MB/s  {chunk['lines_per_s']:,} lines/s"
+            )
+    finally:
+        shutdown_pool()
+
+    stats_path = args.stats or os.path.join(args.out, "stats.json")
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump({"files": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+In-memory stand-in for the Supabase client.
+Implements the subset of the query builder this app uses, so the usage
+guard and history code can be exercised and load-tested offline.
+
+    from fake_supabase import FakeSupabase
+    supabase_admin = FakeSupabase(latency=0.05)
+"""
+
+import itertools
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeSupabaseError(Exception):
+    pass
+
+
+class _Query:
+    def __init__(self, client, table: str):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._payload = None
+        self._on_conflict = ""
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._single = False
+
+    # ─── Operations ─────────────────────────────────────────────────────────
+
+    def select(self, columns: str = "*"):
+        self._op, self._columns = "select", columns
+        return self
+
+    def insert(self, rows):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def update(self, values: dict):
+        self._op, self._payload = "update", values
+        return self
+
+    def upsert(self, rows, on_conflict: str = ""):
+        self._op, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    # ─── Modifiers ──────────────────────────────────────────────────────────
+
+    def _filter(self, column, op, value):
+        self._filters.append((column, op, value))
+        return self
+
+    def _compare(self, column, op, value):
+        # PostgREST receives every value as text and casts it to the column type
+        return self._filter(column, lambda a, b: _OPERATORS[op](a, _coerce(a, b) if isinstance(b, str) else b), value)
+
+    def eq(self, column, value):
+        return self._compare(column, "eq", value)
+
+    def lt(self, column, value):
+        return self._compare(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._compare(column, "lte", value)
+
+    def gt(self, column, value):
+        return self._compare(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._compare(column, "gte", value)
+
+    def in_(self, column, values):
+        return self._filter(column, lambda a, b: a in b, list(values))
+
+    def or_(self, filters: str):
+        """PostgREST logic tree, e.g. 'a.lt.1,and(a.eq.1,b.lt.2)' (eq/lt/lte/gt/gte)."""
+        tree = _parse_logic(filters)
+        self._filters.append((None, lambda row, _: _evaluate(tree, row), None))
+        return self
+
+    def order(self, column, desc: bool = False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    # ─── Execution ──────────────────────────────────────────────────────────
+
+    def _matches(self, row) -> bool:
+        for column, op, value in self._filters:
+            if not op(row if column is None else row.get(column), value):
+                return False
+        return True
+
+    def _project(self, row) -> dict:
+        if self._columns.strip() == "*":
+            return dict(row)
+        return {c.strip(): row.get(c.strip()) for c in self._columns.split(",")}
+
+    def execute(self) -> FakeResponse:
+        return self._client._execute(self)
+
+
+_OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+}
+
+
+def _split_top(text: str) -> list[str]:
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(text):
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _parse_logic(text: str, kind: str = "or"):
+    nodes = []
+    for part in _split_top(text):
+        for group in ("and", "or"):
+            if part.startswith(group + "(") and part.endswith(")"):
+                nodes.append(_parse_logic(part[len(group) + 1:-1], group))
+                break
+        else:
+            column, op, value = part.split(".", 2)
+            if value.startswith('"') and value.endswith('"'):
+                value = value[1:-1]
+            nodes.append((column, op, value))
+    return (kind, nodes)
+
+
+def _coerce(stored, value: str):
+    try:
+        if isinstance(stored, bool) or stored is None:
+            return value
+        if isinstance(stored, int):
+            return int(value)
+        if isinstance(stored, float):
+            return float(value)
+    except ValueError:
+        pass
+    return value
+
+
+def _evaluate(node, row) -> bool:
+    if isinstance(node[1], list):
+        kind, children = node
+        results = (_evaluate(child, row) for child in children)
+        return any(results) if kind == "or" else all(results)
+    column, op, value = node
+    stored = row.get(column)
+    return _OPERATORS[op](stored, _coerce(stored, value))
+
+
+class FakeSupabase:
+    """
+    Thread-safe in-memory tables. ``latency`` seconds are slept per
+    execute() to mimic a network round-trip; ``calls`` counts executes per
+    (table, operation) and ``fail`` makes every execute raise.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: dict[str, list[dict]] = {}
+        self.calls: dict[tuple, int] = {}
+        self.fail = False
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def _new_row(self, row: dict) -> dict:
+        row = dict(row)
+        row.setdefault("id", next(self._ids))
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        return row
+
+    def _execute(self, query: _Query) -> FakeResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            key = (query._table, query._op)
+            self.calls[key] = self.calls.get(key, 0) + 1
+            if self.fail:
+                raise FakeSupabaseError("Supabase unavailable")
+
+            rows = self.tables.setdefault(query._table, [])
+            payload = query._payload
+            if isinstance(payload, dict):
+                payload = [payload]
+
+            if query._op == "insert":
+                inserted = [self._new_row(r) for r in payload]
+                rows.extend(inserted)
+                return FakeResponse(inserted)
+
+            if query._op == "upsert":
+                result = []
+                for r in payload:
+                    existing = next(
+                        (row for row in rows if row.get(query._on_conflict) == r.get(query._on_conflict)),
+                        None,
+                    )
+                    if existing is None:
+                        existing = self._new_row(r)
+                        rows.append(existing)
+                    else:
+                        existing.update(r)
+                    result.append(dict(existing))
+                return FakeResponse(result)
+
+            matched = [row for row in rows if query._matches(row)]
+
+            if query._op == "update":
+                for row in matched:
+                    row.update(payload[0])
+                return FakeResponse([dict(r) for r in matched])
+
+            if query._op == "delete":
+                self.tables[query._table] = [r for r in rows if r not in matched]
+                return FakeResponse([dict(r) for r in matched])
+
+            for column, desc in reversed(query._order):
+                matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+            if query._limit is not None:
+                matched = matched[:query._limit]
+            data = [query._project(r) for r in matched]
+
+            if query._single:
+                if len(data) != 1:
+                    raise FakeSupabaseError(f"Expected 1 row, got {len(data)}")
+                return FakeResponse(data[0])
+            return FakeResponse(data)
@@ -27,6 +27,13 @@ const historySkeleton = document.getElementById("historySkeleton");
 const historyEmpty = document.getElementById("historyEmpty");
 const historyList = document.getElementById("historyList");
 const historyCount = document.getElementById("historyCount");
+const historyMore = document.getElementById("historyMore");
+
+const API_BASE = "https://loganalyzer-4vu8.onrender.com";
+const HISTORY_PAGE_SIZE = 20;
+
+let nextCursor = null;
+let loadedCount = 0;
 
 async function getAccessToken() {
     const { data, error } = await supabaseClient.auth.getSession();
@@ -89,44 +96,62 @@ logoutBtn.addEventListener("click", async () => {
 async function fetchHistory() {
     historySkeleton.classList.remove("hidden");
     historyEmpty.classList.add("hidden");
+    historyMore.classList.add("hidden");
     historyList.innerHTML = "";
     historyCount.textContent = "";
+    nextCursor = null;
+    loadedCount = 0;
 
-    let token;
-    try {
-        token = await getAccessToken();
-    } catch {
-        historySkeleton.classList.add("hidden");
-        historyList.innerHTML = `<p style="color:#ef4444;font-size:13px;">Auth error — please sign in again.</p>`;
-        return;
-    }
+    await loadHistoryPage();
+}
 
-    try {
-        const res = await fetch("https://loganalyzer-4vu8.onrender.com/history", {
-            headers: { "Authorization": `Bearer ${token}` }
-        });
+async function authFetch(path) {
+    const token = await getAccessToken();
+    const res = await fetch(`${API_BASE}${path}`, {
+        headers: { "Authorization": `Bearer ${token}` }
+    });
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    return res.json();
+}
 
-        if (!res.ok) throw new Error(`HTTP ${res.status}`);
-        const items = await res.json();
+// Appends the next page (newest first); summaries are fetched per item on demand
+async function loadHistoryPage() {
+    historyMore.disabled = true;
+    try {
+        const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+        if (nextCursor) params.set("cursor", nextCursor);
+        const page = await authFetch(`/history?${params}`);
 
         historySkeleton.classList.add("hidden");
 
-        if (!items || items.length === 0) {
+        page.items.forEach(item => {
+            historyList.appendChild(renderHistoryItem(item));
+        });
+        loadedCount += page.items.length;
+        nextCursor = page.next_cursor;
+
+        if (loadedCount === 0) {
             historyEmpty.classList.remove("hidden");
             return;
         }
 
-        historyCount.textContent = `${items.length} ${items.length === 1 ? "analysis" : "analyses"}`;
-        items.forEach(item => {
-            historyList.appendChild(renderHistoryItem(item));
-        });
+        const noun = loadedCount === 1 && !nextCursor ? "analysis" : "analyses";
+        historyCount.textContent = `${loadedCount}${nextCursor ? "+" : ""} ${noun}`;
+        historyMore.classList.toggle("hidden", !nextCursor);
 
     } catch (err) {
         historySkeleton.classList.add("hidden");
-        historyList.innerHTML = `<p style="color:#ef4444;font-size:13px;">Failed to load history: ${err.message}</p>`;
+        const message = err.message === "Not authenticated."
+            ? "Auth error — please sign in again."
+            : `Failed to load history: ${err.message}`;
+        historyList.insertAdjacentHTML("beforeend", `<p style="color:#ef4444;font-size:13px;">${message}</p>`);
+    } finally {
+        historyMore.disabled = false;
     }
 }
 
+historyMore.addEventListener("click", loadHistoryPage);
+
 // #9 — Client-side search filter
 document.getElementById("historySearch").addEventListener("input", (e) => {
     const query = e.target.value.toLowerCase();
@@ -153,7 +178,6 @@ function renderHistoryItem(item) {
     const errors = item.errors ?? 0;
     const warnings = item.warnings ?? 0;
     const fileName = item.file_name || "Untitled";
-    const summary = item.summary || "_No summary stored._";
 
     el.innerHTML = `
         <!-- ── Header row ── -->
@@ -248,7 +272,7 @@ function renderHistoryItem(item) {
 
             <!-- Full rendered report -->
             <div class="detail-report-body markdown-body" id="report-${item.id}">
-                ${marked.parse(summary)}
+                <p style="color:#64748b;font-size:13px;">Loading report...</p>
             </div>
         </div>
     `;
@@ -256,9 +280,24 @@ function renderHistoryItem(item) {
     const toggleBtn = el.querySelector(`#toggle-${item.id}`);
     const detailPanel = el.querySelector(`#detail-${item.id}`);
 
+    let reportLoaded = false;
+
+    async function loadReport() {
+        reportLoaded = true;
+        const reportEl = el.querySelector(`#report-${item.id}`);
+        try {
+            const detail = await authFetch(`/history/${encodeURIComponent(item.id)}`);
+            reportEl.innerHTML = marked.parse(detail.summary || "_No summary stored._");
+        } catch (err) {
+            reportLoaded = false;
+            reportEl.innerHTML = `<p style="color:#ef4444;font-size:13px;">Failed to load report: ${err.message}</p>`;
+        }
+    }
+
     toggleBtn.addEventListener("click", (e) => {
         e.stopPropagation();
         const isOpen = detailPanel.classList.contains("open");
+        if (!isOpen && !reportLoaded) loadReport();
         detailPanel.classList.toggle("open", !isOpen);
         toggleBtn.classList.toggle("open", !isOpen);
         toggleBtn.childNodes[0].textContent = isOpen ? "View full report" : "Hide report";
@@ -0,0 +1,92 @@
+"""
+Short-lived per-user cache for /history responses.
+Entries hold the serialized (and gzip-compressed) body, so a repeated
+page load costs neither a Supabase query nor a json.dumps. A user's
+entries are dropped as soon as a new analysis of theirs is saved.
+"""
+
+import gzip
+import json
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+from static_assets import accepts_encoding
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+HISTORY_CACHE_TTL = 30          # seconds
+HISTORY_CACHE_USERS = 1024      # users kept (LRU)
+GZIP_MIN_BYTES = 1024
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class CachedJSON:
+    """A JSON body serialized once, with a gzip variant when worthwhile."""
+
+    def __init__(self, data):
+        self.body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        self.gzip = None
+        if len(self.body) >= GZIP_MIN_BYTES:
+            self.gzip = gzip.compress(self.body, compresslevel=6)
+
+    def response(self, request: Request) -> Response:
+        headers = {"Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+        if self.gzip is not None and accepts_encoding(request, "gzip"):
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzip, media_type="application/json", headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+class HistoryCache:
+    """
+    Per-user LRU of CachedJSON bodies with a TTL. ``invalidate`` bumps the
+    user's generation, and ``put`` ignores results of queries that started
+    under an older generation, so a slow read can't re-cache stale rows.
+    """
+
+    def __init__(self, ttl: float = HISTORY_CACHE_TTL, max_users: int = HISTORY_CACHE_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        # user_id -> [generation, {key: (expires, CachedJSON)}]
+        self._users: OrderedDict[str, list] = OrderedDict()
+
+    def _user(self, user_id: str) -> list:
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = [0, {}]
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return user
+
+    def generation(self, user_id: str) -> int:
+        return self._user(user_id)[0]
+
+    def get(self, user_id: str, key: tuple):
+        user = self._users.get(user_id)
+        entry = user[1].get(key) if user else None
+        if entry is None or entry[0] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id: str, key: tuple, value: CachedJSON, generation: int):
+        user = self._user(user_id)
+        if user[0] != generation:
+            return
+        now = time.monotonic()
+        entries = user[1]
+        for stale in [k for k, (expires, _) in entries.items() if expires <= now]:
+            del entries[stale]
+        entries[key] = (now + self.ttl, value)
+
+    def invalidate(self, user_id: str):
+        user = self._user(user_id)
+        user[0] += 1
+        user[1].clear()
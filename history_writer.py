@@ -0,0 +1,205 @@
+"""
+Write-behind persistence for analysis history.
+Finished analyses are queued in memory and inserted into Supabase in
+batches by a background task, so the final report is sent without
+waiting on a database round-trip. Batches that keep failing are appended
+to a local JSON-lines spill file and replayed once Supabase is reachable
+again; close() drains everything on shutdown.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import threading
+from itertools import islice
+from collections import deque
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+HISTORY_FLUSH_INTERVAL = 1.0    # seconds between flushes when idle
+HISTORY_BATCH_SIZE = 100        # rows per insert
+HISTORY_MAX_PENDING = 10_000    # queued rows before new ones go to the spill file
+HISTORY_MAX_ATTEMPTS = 4        # failed inserts of a batch before it is spilled
+HISTORY_MAX_BACKOFF = 30.0      # seconds
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class HistoryWriter:
+    """
+    Bounded queue of rows for one table. ``on_saved(rows)`` is called after
+    each successful insert (e.g. to invalidate per-user caches).
+    """
+
+    def __init__(
+        self,
+        table: str = "analyses",
+        spill_path: str = None,
+        on_saved=None,
+        flush_interval: float = HISTORY_FLUSH_INTERVAL,
+        batch_size: int = HISTORY_BATCH_SIZE,
+        max_pending: int = HISTORY_MAX_PENDING,
+        max_attempts: int = HISTORY_MAX_ATTEMPTS,
+    ):
+        self.table = table
+        self.spill_path = spill_path
+        self.on_saved = on_saved
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.saved = 0
+        self.spilled = 0
+        self.dropped = 0
+        self._pending: deque = deque()
+        self._client = None
+        self._failures = 0
+        self._wake = None
+        self._lock = None
+        self._flusher = None
+        self._file_lock = threading.Lock()
+
+    # ─── Queueing ───────────────────────────────────────────────────────────
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start(self, client):
+        """Begin flushing (and replaying any spill file from an earlier run)."""
+        self._client = client
+        self._ensure_flusher()
+
+    def enqueue(self, client, row: dict):
+        """Queue one row; never blocks or raises."""
+        self._client = client
+        self._ensure_flusher()
+        if len(self._pending) >= self.max_pending:
+            self._spill_later([row])
+            return
+        self._pending.append(row)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._wake = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            delay = self.flush_interval
+            if self._failures:
+                delay = min(HISTORY_MAX_BACKOFF, self.flush_interval * 2 ** min(self._failures, 10))
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    # ─── Flushing ───────────────────────────────────────────────────────────
+
+    def _insert(self, rows: list):
+        self._client.table(self.table).insert(rows).execute()
+
+    async def flush(self, drain: bool = False):
+        """
+        Insert queued rows in batches. On failure the batch goes back to the
+        front of the queue; after max_attempts failures (or when ``drain``
+        is set) it is spilled to disk instead.
+        """
+        if self._client is None:
+            return
+        async with self._lock:
+            if not drain:
+                await self._replay_spill()
+
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                try:
+                    await asyncio.to_thread(self._insert, batch)
+                except Exception as e:
+                    self._failures += 1
+                    print(f"[HISTORY] Insert of {len(batch)} rows failed ({self._failures}): {e}")
+                    if drain or self._failures >= self.max_attempts:
+                        await asyncio.to_thread(self._spill, batch)
+                        if not drain:
+                            return
+                        continue
+                    self._pending.extendleft(reversed(batch))
+                    return
+
+                self._failures = 0
+                self.saved += len(batch)
+                if self.on_saved is not None:
+                    self.on_saved(batch)
+
+    # ─── Spill file ─────────────────────────────────────────────────────────
+
+    def _spill(self, rows: list):
+        if not self.spill_path:
+            self.dropped += len(rows)
+            print(f"[HISTORY] Dropped {len(rows)} rows (no spill file configured)")
+            return
+        try:
+            with self._file_lock, open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+            self.spilled += len(rows)
+        except OSError as e:
+            self.dropped += len(rows)
+            print(f"[HISTORY] Could not spill {len(rows)} rows: {e}")
+
+    def _spill_later(self, rows: list):
+        asyncio.ensure_future(asyncio.to_thread(self._spill, rows))
+
+    def _take_spill(self, limit: int) -> list:
+        """Remove and return up to ``limit`` rows from the front of the spill file."""
+        if not self.spill_path or limit <= 0:
+            return []
+        with self._file_lock:
+            try:
+                f = open(self.spill_path, encoding="utf-8")
+            except FileNotFoundError:
+                return []
+            rest_path = self.spill_path + ".tmp"
+            with f:
+                lines = list(islice(f, limit))
+                # The rest stays on disk for later flushes
+                with open(rest_path, "w", encoding="utf-8") as rest:
+                    shutil.copyfileobj(f, rest)
+                    has_rest = rest.tell() > 0
+            if has_rest:
+                os.replace(rest_path, self.spill_path)
+            else:
+                os.remove(rest_path)
+                os.remove(self.spill_path)
+        rows = []
+        for line in lines:
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                if line.strip():
+                    print("[HISTORY] Skipping corrupt spill line")
+        return rows
+
+    async def _replay_spill(self):
+        """
+        Queue spilled rows again, as many as fit under max_pending; if
+        Supabase is still down they are re-spilled.
+        """
+        rows = await asyncio.to_thread(self._take_spill, self.max_pending - len(self._pending))
+        if rows:
+            self.spilled -= min(self.spilled, len(rows))
+            self._pending.extend(rows)
+            print(f"[HISTORY] Replaying {len(rows)} spilled rows")
+
+    async def close(self):
+        """Stop the background flusher and write out (or spill) every queued row."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._lock is None:
+            return
+        await self.flush(drain=True)
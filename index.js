@@ -144,6 +144,9 @@ window.addEventListener("DOMContentLoaded", async () => {
     supabaseClient.auth.onAuthStateChange((_event, session) => {
         setAuthUI(session ? session.user : null);
     });
+
+    // Pick up an analysis that was still running when the page reloaded
+    resumeAfterReload();
 });
 
 // ── Avatar dropdown ───────────────────────────────────────────────────────────
@@ -328,11 +331,102 @@ async function getAccessToken() {
 
 
 
-async function uploadLog() {
-    const file = fileInput.files[0];
-    if (!file) return;
+// ── Resumable analysis stream ────────────────────────────────────────────────
+// The server runs each analysis as a job and buffers its events, so a dropped
+// connection (or a page reload) reattaches instead of paying for a new run.
+const API_BASE = "https://loganalyzer-4vu8.onrender.com";
+const ACTIVE_JOB_KEY = "active_job";
+const RESUME_ATTEMPTS = 4;
 
-    setLoading(true);
+let activeJob = null; // { id, lastEventId }
+
+function saveActiveJob() {
+    if (activeJob) sessionStorage.setItem(ACTIVE_JOB_KEY, JSON.stringify(activeJob));
+    else sessionStorage.removeItem(ACTIVE_JOB_KEY);
+}
+
+// Reads SSE frames until the stream ends; true once the analysis has finished
+async function readAnalysisStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let eventId = null;
+
+    try {
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) return false;
+
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split("\n");
+            buffer = lines.pop();
+
+            for (const line of lines) {
+                if (line.startsWith("id: ")) {
+                    eventId = Number(line.slice(4));
+                    continue;
+                }
+                if (!line.startsWith("data: ")) continue;
+                const data = JSON.parse(line.slice(6));
+
+                if (data.stage === "queued" && data.job_id) activeJob = { id: data.job_id, lastEventId: 0 };
+                if (activeJob && eventId !== null) {
+                    activeJob.lastEventId = eventId;
+                    saveActiveJob();
+                }
+
+                handleSSEEvent(data);
+
+                if (data.stage === "complete" || data.stage === "error") {
+                    activeJob = null;
+                    saveActiveJob();
+                    return true;
+                }
+            }
+        }
+    } catch (_) {
+        return false; // connection dropped
+    }
+}
+
+// Build headers — token is optional (anonymous users skip auth). Jobs are
+// only readable with the identity that started them.
+async function identityHeaders() {
+    const headers = { "x-anon-id": anonId };
+    try {
+        const token = await getAccessToken();
+        headers["Authorization"] = `Bearer ${token}`;
+    } catch (_) {
+        // Not logged in — proceed as anonymous
+    }
+    return headers;
+}
+
+// Reattach to the active job and replay everything after lastEventId
+async function resumeAnalysis(firstDelay = 1000) {
+    for (let attempt = 0; attempt < RESUME_ATTEMPTS && activeJob; attempt++) {
+        await new Promise(r => setTimeout(r, attempt ? firstDelay * 2 ** attempt : firstDelay));
+        progressMessage.textContent = "Connection lost. Reconnecting...";
+
+        let response;
+        try {
+            response = await fetch(`${API_BASE}/jobs/${activeJob.id}/events`, {
+                headers: { ...(await identityHeaders()), "Last-Event-ID": String(activeJob.lastEventId) },
+            });
+        } catch (_) {
+            continue;
+        }
+        if (response.status === 404) break;
+        if (!response.ok) continue;
+        if (await readAnalysisStream(response)) return;
+    }
+
+    activeJob = null;
+    saveActiveJob();
+    throw new Error("Lost connection to the analysis. Please try again.");
+}
+
+function showProgressUI() {
     resetProgress();
 
     progressSection.classList.remove("hidden");
@@ -342,6 +436,41 @@ async function uploadLog() {
     emptyState.classList.add("hidden");
     resultsContent.innerHTML = "";
     resultsContent.classList.remove("hidden");
+}
+
+function showAnalysisError(error) {
+    resultsContent.innerHTML = `
+            <div style="color:#ef4444;padding:20px;text-align:center;">
+                <h3>Error</h3>
+                <p>${error.message}</p>
+            </div>
+        `;
+}
+
+// After a reload, rebuild the page from a full replay of the unfinished job
+async function resumeAfterReload() {
+    const saved = JSON.parse(sessionStorage.getItem(ACTIVE_JOB_KEY) || "null");
+    if (!saved) return;
+
+    activeJob = { id: saved.id, lastEventId: 0 };
+    setLoading(true);
+    showProgressUI();
+    try {
+        await resumeAnalysis(0);
+    } catch (error) {
+        showAnalysisError(error);
+    } finally {
+        setLoading(false);
+    }
+}
+
+
+async function uploadLog() {
+    const file = fileInput.files[0];
+    if (!file) return;
+
+    setLoading(true);
+    showProgressUI();
 
     const formData = new FormData();
     formData.append("file", file);
@@ -351,16 +480,9 @@ async function uploadLog() {
     if (!sessionChk.session) bumpUsage();
 
     try {
-        // Build headers — token is optional (anonymous users skip auth)
-        const reqHeaders = { "x-anon-id": anonId };
-        try {
-            const token = await getAccessToken();
-            reqHeaders["Authorization"] = `Bearer ${token}`;
-        } catch (_) {
-            // Not logged in — proceed as anonymous
-        }
+        const reqHeaders = await identityHeaders();
 
-        const response = await fetch("https://loganalyzer-4vu8.onrender.com/analyze-stream", {
+        const response = await fetch(`${API_BASE}/analyze-stream`, {
             method: "POST",
             headers: reqHeaders,
             body: formData,
@@ -384,37 +506,21 @@ async function uploadLog() {
             throw new Error("Session expired. Please login again.");
         }
 
+        if (response.status === 503) {
+            throw new Error("The server is busy. Please try again in a few seconds.");
+        }
+
         if (!response.ok) {
             const err = await response.json();
             throw new Error(err.detail || "Server error");
         }
 
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = "";
-
-        while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
-
-            buffer += decoder.decode(value, { stream: true });
-            const lines = buffer.split("\n");
-            buffer = lines.pop();
-
-            for (const line of lines) {
-                if (!line.startsWith("data: ")) continue;
-                const data = JSON.parse(line.slice(6));
-                handleSSEEvent(data);
-            }
+        if (!(await readAnalysisStream(response))) {
+            await resumeAnalysis();
         }
 
     } catch (error) {
-        resultsContent.innerHTML = `
-            <div style="color:#ef4444;padding:20px;text-align:center;">
-                <h3>Error</h3>
-                <p>${error.message}</p>
-            </div>
-        `;
+        showAnalysisError(error);
     } finally {
         setLoading(false);
     }
@@ -423,6 +529,18 @@ async function uploadLog() {
 
 function handleSSEEvent(data) {
     switch (data.stage) {
+        case "queued":
+            // A chunk or the synthesis waiting for the model (rate limits)
+            if (!data.job_id) {
+                progressMessage.textContent = data.message;
+                break;
+            }
+            progressBar.style.width = "5%";
+            progressMessage.textContent = data.position > 1
+                ? `Queued (position ${data.position})...`
+                : "Starting analysis...";
+            break;
+
         case "preprocessing":
             setStage("preprocess");
             progressBar.style.width = "10%";
@@ -457,7 +575,7 @@ function handleSSEEvent(data) {
 
             const chunkHeader = document.createElement("div");
             chunkHeader.className = "chunk-header chunk-toggle";
-            chunkHeader.innerHTML = `<span>Chunk ${data.chunk_index}/${data.total_chunks} Analysis</span><svg class="chunk-chevron" width="12" height="12" viewBox="0 0 24 24" fill="none"><polyline points="6 9 12 15 18 9" stroke="currentColor" stroke-width="2.5" stroke-linecap="round" stroke-linejoin="round"/></svg>`;
+            chunkHeader.innerHTML = `<span>Chunk ${data.chunk_index}/${data.total_chunks} Analysis${data.cached ? " (cached)" : ""}</span><svg class="chunk-chevron" width="12" height="12" viewBox="0 0 24 24" fill="none"><polyline points="6 9 12 15 18 9" stroke="currentColor" stroke-width="2.5" stroke-linecap="round" stroke-linejoin="round"/></svg>`;
 
             const chunkBody = document.createElement("div");
             chunkBody.className = "chunk-body markdown-body chunk-collapsible open";
@@ -489,7 +607,9 @@ function handleSSEEvent(data) {
         case "complete":
             setStage("complete");
             progressBar.style.width = "100%";
-            progressMessage.textContent = "Analysis complete.";
+            progressMessage.textContent = data.tier === "local"
+                ? "Analysis complete (rule-based report, no AI needed)."
+                : "Analysis complete.";
             resultsContent.innerHTML = marked.parse(data.result);
             updateStats(data.stats);
             // Show copy & download buttons
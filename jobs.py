@@ -0,0 +1,217 @@
+"""
+In-process job queue for analyses.
+An analysis runs on a worker task instead of inside the HTTP response, and
+its events are buffered on the job, so a client that loses the connection
+can reattach (with Last-Event-ID) and get a replay followed by the live
+stream without paying for the LLM work again. A job submitted with a key
+can be found by that key until it ends, so identical requests subscribe
+to the running job instead of repeating it.
+"""
+
+import asyncio
+import json
+import secrets
+import time
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+JOB_WORKERS = 4          # analyses running at once
+JOB_QUEUE_SIZE = 32      # queued analyses before submissions are refused
+JOB_TTL = 600            # seconds a finished job stays available for replay
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    """
+    One analysis: status, buffered events (1-based ids) and waiters.
+    ``subscribers`` lists whoever the result is for; requests that join
+    the job append to it. ``owners`` are the identities (user:... or
+    anon:...) allowed to read it.
+    """
+
+    def __init__(self, run, key: str = None, subscribers: list = None, owner: str = None):
+        self.id = secrets.token_urlsafe(16)
+        self.key = key
+        self.subscribers = subscribers if subscribers is not None else []
+        self.owners = {owner} if owner is not None else set()
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events: list[str] = []
+        self._run = run
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    async def append(self, data: dict):
+        async with self._changed:
+            self.events.append(json.dumps(data))
+            self._changed.notify_all()
+
+    async def _finish(self, status: str):
+        async with self._changed:
+            self.status = status
+            self.finished_at = time.time()
+            self._changed.notify_all()
+
+    async def wait(self, seen: int, timeout: float = None) -> bool:
+        """Wait until there are more than ``seen`` events or the job ends; False on timeout."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: len(self.events) > seen or self.finished),
+                    timeout,
+                )
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    async def stream(self, after: int = 0, heartbeat: float = None):
+        """
+        Yield (event_id, payload) for events after ``after``, live until the
+        job finishes. Yields (None, None) every ``heartbeat`` idle seconds.
+        """
+        seen = max(0, after)
+        while True:
+            while seen < len(self.events):
+                seen += 1
+                yield seen, self.events[seen - 1]
+            if self.finished:
+                return
+            if not await self.wait(seen, heartbeat):
+                yield None, None
+
+    def describe(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "events": len(self.events),
+            "subscribers": len(self.subscribers),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Bounded FIFO of jobs served by ``workers`` tasks. ``submit`` raises
+    QueueFullError instead of waiting, so back-pressure reaches the client;
+    finished jobs are dropped ``ttl`` seconds after they end.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE, ttl: float = JOB_TTL):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.jobs: dict[str, Job] = {}
+        self._keyed: dict[str, Job] = {}
+        self._queue: asyncio.Queue = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop = None
+
+    # ─── Workers ────────────────────────────────────────────────────────────
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the app was restarted on a new event loop
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._tasks = []
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: Job):
+        job.status = "running"
+        status = "done"
+        try:
+            async for data in job._run():
+                await job.append(data)
+                if data.get("stage") == "error":
+                    status = "failed"
+        except asyncio.CancelledError:
+            self.forget(job.key, job)
+            await job._finish("cancelled")
+            raise
+        except Exception as e:
+            print(f"[JOBS] Job {job.id} crashed: {e}")
+            await job.append({"stage": "error", "message": "Analysis failed unexpectedly."})
+            status = "failed"
+        job._run = None
+        self.forget(job.key, job)
+        await job._finish(status)
+
+    # ─── Public API ─────────────────────────────────────────────────────────
+
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def full(self) -> bool:
+        return self.queued() >= self.max_queued
+
+    def submit(self, run, key: str = None, subscribers: list = None, owner: str = None) -> Job:
+        """
+        Queue ``run`` (a callable returning an async iterator of event dicts)
+        for ``owner``. The job's first event is ``queued`` with its queue
+        position. Raises QueueFullError when max_queued jobs are already
+        waiting. With a ``key``, find(key) returns the job until it ends or
+        is forgotten.
+        """
+        self._ensure_workers()
+        self.sweep()
+        job = Job(run, key, subscribers, owner)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"{self.max_queued} analyses already queued")
+        job.events.append(json.dumps({"stage": "queued", "job_id": job.id, "position": self._queue.qsize()}))
+        self.jobs[job.id] = job
+        if key is not None:
+            self._keyed[key] = job
+        return job
+
+    def find(self, key: str):
+        """The queued or running job submitted with ``key``, or None."""
+        job = self._keyed.get(key)
+        return job if job is not None and not job.finished else None
+
+    def forget(self, key: str, job: Job = None):
+        """Stop handing out the job for ``key`` (only if it is ``job``, when given)."""
+        if key is not None and (job is None or self._keyed.get(key) is job):
+            self._keyed.pop(key, None)
+
+    def get(self, job_id: str, owner: str):
+        """The job if it exists and ``owner`` may read it, else None."""
+        self.sweep()
+        job = self.jobs.get(job_id)
+        if job is None or owner not in job.owners:
+            return None
+        return job
+
+    def sweep(self):
+        cutoff = time.time() - self.ttl
+        expired = [i for i, j in self.jobs.items() if j.finished and j.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def close(self):
+        """Cancel workers; running jobs end as cancelled."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
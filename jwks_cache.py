@@ -0,0 +1,131 @@
+"""
+JWKS key cache for Supabase token verification.
+Keeps constructed verifier keys per kid plus recently verified tokens, so
+authenticated requests don't fetch the JWKS document or rebuild keys.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+import requests
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+JWKS_TTL = 600                 # seconds before keys are refetched
+JWKS_MIN_REFRESH_INTERVAL = 30  # min seconds between fetch attempts (unknown kid, errors)
+JWKS_FETCH_TIMEOUT = 5
+TOKEN_CACHE_SIZE = 1024        # recently verified tokens kept until their exp
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class JWKSVerifier:
+    """
+    Process-wide ES256 token verifier backed by a cached JWKS.
+
+    Keys are refetched after ``ttl``, or early when a token names an
+    unknown kid (key rotation). Concurrent refreshes share one in-flight
+    fetch, and the fetch runs in a worker thread so it never blocks the
+    event loop. If a fetch fails the previous keys stay in use.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        issuer: str,
+        ttl: float = JWKS_TTL,
+        min_refresh_interval: float = JWKS_MIN_REFRESH_INTERVAL,
+        token_cache_size: int = TOKEN_CACHE_SIZE,
+    ):
+        self.jwks_url = jwks_url
+        self.issuer = issuer
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.token_cache_size = token_cache_size
+        self._keys: dict = {}
+        self._fetched_at = float("-inf")
+        self._attempted_at = float("-inf")
+        self._refresh_task = None
+        self._tokens: OrderedDict[str, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # ─── Keys ───────────────────────────────────────────────────────────────
+
+    def _fetch(self) -> dict:
+        response = requests.get(self.jwks_url, timeout=JWKS_FETCH_TIMEOUT)
+        response.raise_for_status()
+        keys = {}
+        for key in response.json().get("keys", []):
+            try:
+                keys[key["kid"]] = jwk.construct(key)
+            except Exception as e:
+                print(f"[AUTH] Skipping unusable JWKS key {key.get('kid')}: {e}")
+        return keys
+
+    async def _do_refresh(self):
+        self._attempted_at = time.monotonic()
+        try:
+            self._keys = await asyncio.to_thread(self._fetch)
+            self._fetched_at = time.monotonic()
+        except Exception as e:
+            print(f"[AUTH] JWKS refresh failed: {e}")
+
+    async def refresh(self):
+        """Refetch the key set; concurrent callers share one fetch."""
+        task = self._refresh_task
+        if task is None or task.done():
+            task = self._refresh_task = asyncio.create_task(self._do_refresh())
+        await asyncio.shield(task)
+
+    async def get_key(self, kid: str):
+        now = time.monotonic()
+        can_refresh = now - self._attempted_at >= self.min_refresh_interval
+        if can_refresh and (now - self._fetched_at >= self.ttl or kid not in self._keys):
+            await self.refresh()
+        return self._keys.get(kid)
+
+    # ─── Tokens ─────────────────────────────────────────────────────────────
+
+    def _cached_payload(self, token: str):
+        payload = self._tokens.get(token)
+        if payload is None:
+            return None
+        if payload["exp"] <= time.time():
+            del self._tokens[token]
+            return None
+        self._tokens.move_to_end(token)
+        return payload
+
+    def _remember(self, token: str, payload: dict):
+        if not isinstance(payload.get("exp"), (int, float)):
+            return
+        self._tokens[token] = payload
+        self._tokens.move_to_end(token)
+        while len(self._tokens) > self.token_cache_size:
+            self._tokens.popitem(last=False)
+
+    async def verify(self, token: str) -> dict:
+        """Return the decoded payload, or raise JWTError."""
+        payload = self._cached_payload(token)
+        if payload is not None:
+            self.hits += 1
+            return payload
+        self.misses += 1
+
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = await self.get_key(kid)
+        if key is None:
+            raise JWTError("Invalid token key")
+
+        payload = jwt.decode(
+            token,
+            key,
+            algorithms=["ES256"],
+            issuer=self.issuer,
+            options={"verify_aud": False},
+        )
+        self._remember(token, payload)
+        return payload
@@ -0,0 +1,129 @@
+"""
+Content-addressed cache for LLM results.
+Keys are hashes of the model name, prompt template and prompt input, so a
+re-uploaded log (or an overlapping rotation of it) reuses earlier chunk
+and synthesis results instead of paying for new Gemini calls.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+LLM_CACHE_MEMORY_ENTRIES = 1024
+LLM_CACHE_DISK_BYTES = 256 * 1024 * 1024
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def cache_key(*parts: str) -> str:
+    """SHA-256 over length-prefixed parts (so part boundaries are unambiguous)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class LLMResultCache:
+    """
+    Two-tier result cache: an in-memory LRU in front of an optional SQLite
+    file. The disk tier evicts least recently used rows once the stored
+    text exceeds ``disk_bytes``; its I/O runs in a worker thread.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+        disk_bytes: int = LLM_CACHE_DISK_BYTES,
+    ):
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._disk_size = 0
+        if path:
+            self._open(path)
+
+    # ─── Disk tier ──────────────────────────────────────────────────────────
+
+    def _open(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self._db.commit()
+        self._disk_size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def _disk_get(self, key: str):
+        with self._db_lock:
+            row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def _disk_put(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        with self._db_lock:
+            old = self._db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._disk_size += size - (old[0] if old else 0)
+            while self._disk_size > self.disk_bytes:
+                oldest = self._db.execute(
+                    "SELECT key, size FROM results ORDER BY accessed LIMIT 64"
+                ).fetchall()
+                if not oldest:
+                    break
+                for old_key, old_size in oldest:
+                    self._db.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                    self._disk_size -= old_size
+                    if self._disk_size <= self.disk_bytes:
+                        break
+            self._db.commit()
+
+    # ─── Public API ─────────────────────────────────────────────────────────
+
+    def _remember(self, key: str, value: str):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str):
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+        elif self._db is not None:
+            value = await asyncio.to_thread(self._disk_get, key)
+            if value is not None:
+                self._remember(key, value)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def put(self, key: str, value: str):
+        self._remember(key, value)
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._disk_put, key, value)
+            except sqlite3.Error as e:
+                print(f"[CACHE] Failed to store LLM result: {e}")
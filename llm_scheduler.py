@@ -0,0 +1,285 @@
+"""
+Process-wide scheduler for LLM calls.
+Every model call waits here for a slot. The number of calls in flight
+follows AIMD: it grows by about one per window of successful calls, and
+is halved when the model answers 429 / RESOURCE_EXHAUSTED or a call is
+slower than the latency target. Starts are also held to a requests- and
+tokens-per-minute budget. Waiting calls are queued per owner (user or
+anonymous id) and served round-robin, so one large analysis cannot starve
+the others. Rate-limited and transiently failed calls are retried with
+exponential backoff and full jitter, and the whole queue pauses after a
+429, so a burst slows everybody down instead of failing everybody.
+"""
+
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+LLM_START_CONCURRENCY = 4      # calls in flight before any feedback
+LLM_MIN_CONCURRENCY = 1
+LLM_MAX_CONCURRENCY = 16
+LLM_DECREASE_FACTOR = 0.5      # multiplicative decrease on congestion
+LLM_LATENCY_TARGET = 30.0      # seconds; slower calls count as congestion
+LLM_REQUESTS_PER_MINUTE = 60
+LLM_TOKENS_PER_MINUTE = 1_000_000
+LLM_MAX_RETRIES = 4            # retries per call after a 429 or transient error
+LLM_BACKOFF_BASE = 2.0         # seconds; doubled per retry
+LLM_BACKOFF_MAX = 60.0
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+BUDGET_WINDOW = 60.0  # seconds covered by the per-minute budgets
+
+RATE_LIMIT_MARKERS = ("429", "RESOURCE_EXHAUSTED")
+TRANSIENT_MARKERS = ("500", "502", "503", "504", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL")
+
+
+def is_rate_limit(error: Exception) -> bool:
+    message = str(error)
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def is_transient(error: Exception) -> bool:
+    message = str(error)
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError)) or any(
+        marker in message for marker in TRANSIENT_MARKERS
+    )
+
+
+class _Waiter:
+    __slots__ = ("owner", "tokens", "future")
+
+    def __init__(self, owner: str, tokens: int):
+        self.owner = owner
+        self.tokens = tokens
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class LLMScheduler:
+    """
+    Admission control for model calls. ``call(invoke, tokens, owner,
+    on_queued)`` runs ``invoke()`` (a coroutine function) once a slot and
+    budget are free, retrying rate limits and transient errors. While the
+    call waits, ``on_queued(notice)`` is called with a dict (position,
+    reason, retry_in) suitable for an SSE event.
+    """
+
+    def __init__(
+        self,
+        start_concurrency: float = LLM_START_CONCURRENCY,
+        min_concurrency: int = LLM_MIN_CONCURRENCY,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        latency_target: float = LLM_LATENCY_TARGET,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+    ):
+        self.limit = float(start_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+        self._queues: OrderedDict[str, deque] = OrderedDict()
+        self._waiting = 0
+        self._starts: deque = deque()   # start times in the budget window
+        self._tokens: deque = deque()   # [start time, tokens] in the budget window
+        self._token_total = 0
+        self._last_decrease = 0.0
+        self._timer = None
+
+    # ─── Queueing ───────────────────────────────────────────────────────────
+
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _enqueue(self, owner: str, tokens: int, front: bool = False) -> _Waiter:
+        waiter = _Waiter(owner, tokens)
+        queue = self._queues.get(owner)
+        if queue is None:
+            queue = self._queues[owner] = deque()
+        if front:
+            queue.appendleft(waiter)
+        else:
+            queue.append(waiter)
+        self._waiting += 1
+        return waiter
+
+    def _position(self, waiter: _Waiter) -> int:
+        """Approximate place in line: calls served up to and including this one."""
+        own = self._queues.get(waiter.owner, ())
+        turn = next((n for n, other in enumerate(own) if other is waiter), 0) + 1
+        return sum(min(len(queue), turn) for queue in self._queues.values())
+
+    def _next(self):
+        """Pop the head of the next owner's queue (round-robin)."""
+        owner, queue = next(iter(self._queues.items()))
+        waiter = queue.popleft()
+        del self._queues[owner]
+        if queue:
+            self._queues[owner] = queue  # back of the rotation
+        self._waiting -= 1
+        return waiter
+
+    def _budget_delay(self, now: float, tokens: int) -> float:
+        """Seconds until a call of ``tokens`` fits the per-minute budgets."""
+        cutoff = now - BUDGET_WINDOW
+        while self._starts and self._starts[0] <= cutoff:
+            self._starts.popleft()
+        while self._tokens and self._tokens[0][0] <= cutoff:
+            self._token_total -= self._tokens.popleft()[1]
+        delay = 0.0
+        if len(self._starts) >= self.requests_per_minute:
+            delay = self._starts[0] - cutoff
+        # A call bigger than the whole budget still runs once the window is empty
+        if self._tokens and self._token_total + tokens > self.tokens_per_minute:
+            delay = max(delay, self._tokens[0][0] - cutoff)
+        return delay
+
+    def _dispatch(self):
+        self._timer = None
+        while self._queues and self.in_flight < int(self.limit):
+            now = time.monotonic()
+            delay = self.paused_until - now
+            if delay <= 0:
+                head = next(iter(self._queues.values()))[0]
+                delay = self._budget_delay(now, head.tokens)
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            waiter = self._next()
+            if waiter.future.done():  # cancelled while waiting
+                continue
+            self.in_flight += 1
+            self._starts.append(now)
+            entry = [now, waiter.tokens]
+            self._tokens.append(entry)
+            self._token_total += waiter.tokens
+            waiter.future.set_result(entry)
+
+    def _wake(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    async def _acquire(self, owner: str, tokens: int, on_queued, retry: bool = False) -> list:
+        # Retries go to the front of their owner's queue
+        waiter = self._enqueue(owner, tokens, front=retry)
+        self._wake()
+        if not waiter.future.done() and on_queued is not None:
+            on_queued({"position": self._position(waiter), "reason": "capacity"})
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            if not waiter.future.cancelled():
+                # Granted just as it was cancelled: hand the slot back
+                self._release()
+            else:
+                self._discard(waiter)
+            raise
+
+    def _discard(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.owner)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[waiter.owner]
+
+    def _release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    # ─── Feedback ───────────────────────────────────────────────────────────
+
+    def _increase(self):
+        # About +1 per window of `limit` successful calls
+        self.limit = min(self.max_concurrency, self.limit + 1 / max(self.limit, 1.0))
+
+    def _decrease(self, started: float):
+        # One decrease per congestion episode: calls that started before
+        # the last decrease report the same episode
+        if started < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self.limit = max(self.min_concurrency, self.limit * LLM_DECREASE_FACTOR)
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for retry ``attempt`` (1-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    # ─── Calls ──────────────────────────────────────────────────────────────
+
+    async def call(self, invoke, tokens: int = 0, owner: str = "", on_queued=None, used_tokens=None):
+        """
+        Run ``await invoke()`` under the scheduler and return its result.
+        ``used_tokens(result)`` may give the real token count, which then
+        replaces the estimate in the budget. Raises the last error when it
+        is not retryable or retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            entry = await self._acquire(owner, tokens, on_queued, retry=attempt > 0)
+            started = time.monotonic()
+            try:
+                result = await invoke()
+            except Exception as e:
+                self._release()
+                rate_limited = is_rate_limit(e)
+                if rate_limited:
+                    self.rate_limited += 1
+                    self._decrease(started)
+                if not (rate_limited or is_transient(e)) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                delay = self.backoff(attempt)
+                if rate_limited:
+                    # Hold every queued call, not just this one
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                if on_queued is not None:
+                    on_queued({
+                        "position": self._waiting + 1,
+                        "reason": "rate_limited" if rate_limited else "retry",
+                        "retry_in": round(delay, 1),
+                    })
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self._release()
+                raise
+
+            seconds = time.monotonic() - started
+            if used_tokens is not None:
+                used = used_tokens(result)
+                # Calls longer than the window have left the budget already
+                if used and entry[0] > time.monotonic() - BUDGET_WINDOW:
+                    self._token_total += used - entry[1]
+                    entry[1] = used
+            if seconds > self.latency_target:
+                self._decrease(started)
+            else:
+                self._increase()
+            self._release()
+            return result
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self._waiting,
+            "owners": len(self._queues),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1),
+        }
@@ -0,0 +1,114 @@
+"""
+Rule-based reports for logs that do not need the model.
+Quiet logs (health checks, a handful of repeated warnings) are answered
+from the preprocessing stats and severity signatures alone, in the same
+three sections as the LLM report and in milliseconds. escalation_reasons()
+decides whether a log is quiet enough; anything else goes to the LLM.
+"""
+
+from log_processor import ProcessedLog, SEVERITIES
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+LOCAL_MAX_CRITICAL = 0             # critical lines a local report may cover
+LOCAL_MAX_ERRORS = 0               # error lines a local report may cover
+LOCAL_MAX_WARNING_SIGNATURES = 3   # distinct warnings (novelty) before escalating
+LOCAL_MAX_WARNING_SHARE = 0.05     # share of lines that may be warnings
+LOCAL_REPORT_SIGNATURES = 5        # signatures listed per severity
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+MODES = ("auto", "llm", "local")
+
+LABELS = {"critical": "Critical", "error": "Error", "warning": "Warning"}
+STAT_KEYS = {"critical": "critical", "error": "errors", "warning": "warnings"}
+
+
+def escalation_reasons(processed: ProcessedLog) -> list[str]:
+    """Why a log needs the LLM; empty if a local report is enough."""
+    stats = processed.summary_stats
+    reasons = []
+    if stats.get("critical", 0) > LOCAL_MAX_CRITICAL:
+        reasons.append(f"{stats['critical']} critical lines")
+    if stats.get("errors", 0) > LOCAL_MAX_ERRORS:
+        reasons.append(f"{stats['errors']} error lines")
+    warning_signatures = processed.events.get("warning", (0, []))[0]
+    if warning_signatures > LOCAL_MAX_WARNING_SIGNATURES:
+        reasons.append(f"{warning_signatures} distinct warnings")
+    total = stats.get("total_lines", 0)
+    if total and stats.get("warnings", 0) > LOCAL_MAX_WARNING_SHARE * total:
+        reasons.append(f"warnings are {stats['warnings'] / total:.0%} of lines")
+    return reasons
+
+
+def _quote(text: str, limit: int = 200) -> str:
+    text = text.replace("`", "'")
+    if len(text) > limit:
+        text = text[:limit - 3] + "..."
+    return f"`{text}`"
+
+
+def _bullet(severity: str, sig: dict) -> str:
+    count = f"~{sig['count']}" if sig["approximate"] else str(sig["count"])
+    times = "time" if sig["count"] == 1 else "times"
+    if sig["first_line"] == sig["last_line"]:
+        where = f"line {sig['first_line']}"
+    else:
+        where = f"lines {sig['first_line']}-{sig['last_line']}"
+    if sig["first_seen"] is not None:
+        if sig["first_seen"] == sig["last_seen"]:
+            where += f", at {sig['first_seen']}"
+        else:
+            where += f", {sig['first_seen']} to {sig['last_seen']}"
+    return f"- {LABELS[severity]} {_quote(sig['title'])}: {count} {times} ({where})"
+
+
+def local_report(processed: ProcessedLog) -> str:
+    """The three-section report, built from stats and signatures only."""
+    stats = processed.summary_stats
+    total = processed.original_line_count
+    span = f" ({processed.time_range[0]} to {processed.time_range[1]})" if processed.time_range else ""
+
+    problems = []
+    for severity in SEVERITIES:
+        top = processed.signatures.get(severity, [])
+        problems.extend(_bullet(severity, sig) for sig in top[:LOCAL_REPORT_SIGNATURES])
+        more = processed.events.get(severity, (0, []))[0] - min(len(top), LOCAL_REPORT_SIGNATURES)
+        if more > 0:
+            problems.append(f"- ...and {more} more {severity} signatures")
+
+    parts = ["## What Went Wrong"]
+    if problems:
+        parts.extend(problems)
+    else:
+        parts.append(f"- Nothing: no critical, error or warning lines in {total:,} lines{span}.")
+
+    first = next((severity for severity in SEVERITIES if processed.signatures.get(severity)), None)
+    parts += ["", "## What To Do Next"]
+    if first is None:
+        parts.append("No action needed.")
+    elif first == "warning":
+        title = processed.signatures[first][0]["title"]
+        parts.append(f"Check the most frequent warning first: {_quote(title)}. Nothing is failing yet.")
+    else:
+        title = processed.signatures[first][0]["title"]
+        parts.append(f"Fix the most frequent {first} first: {_quote(title)}.")
+
+    counts = ", ".join(
+        f"{stats.get(STAT_KEYS[severity], 0):,} {STAT_KEYS[severity]}" for severity in SEVERITIES
+    )
+    if stats.get("critical"):
+        verdict = "Critical"
+    elif stats.get("errors"):
+        verdict = "Errors"
+    elif stats.get("warnings"):
+        verdict = "Warning"
+    else:
+        verdict = "Fine"
+    parts += [
+        "",
+        "## Final Verdict",
+        f"{verdict}. {total:,} lines{span} with {counts}. "
+        "This report was generated from the log statistics without the AI model.",
+    ]
+    return "\n".join(parts)
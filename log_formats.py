@@ -0,0 +1,350 @@
+"""
+Format-aware severity parsers.
+The format of a log is detected once from a sample of its first lines
+(JSON lines, Docker/Kubernetes container logs, nginx/Apache access and
+error logs, syslog/journald, dmesg). Each parser reads the level, priority
+or status field of a line directly instead of keyword-scanning the whole
+line; lines without one fall back to the keyword classifier on their
+message only. Parsers also record one facet per line (status code and
+endpoint, program, subsystem, stream) that is counted into structured
+aggregates for summary_stats["format"].
+"""
+
+import re
+from collections import Counter
+from itertools import islice
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+FORMAT_SAMPLE_LINES = 200    # lines examined to pick a format
+FORMAT_MIN_SHARE = 0.6       # share of sample lines the format must parse
+FACET_MAX_KEYS = 2000        # distinct facet values tracked per aggregate
+FACET_TOP = 10               # values listed per aggregate in the stats
+ENDPOINT_MAX_CHARS = 120     # request paths are truncated in the aggregates
+MARKER_PROBE_LINES = 1000    # messages checked for level markers before giving up
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+# Level names (lowercase) to severity categories; unknown names are info
+LEVELS = {
+    "emerg": "critical", "emergency": "critical", "alert": "critical", "crit": "critical",
+    "critical": "critical", "fatal": "critical", "panic": "critical",
+    "err": "error", "error": "error", "eror": "error", "severe": "error",
+    "warn": "warning", "warning": "warning",
+}
+INFO_LEVELS = {"info", "notice", "debug", "trace", "verbose"}
+# Syslog / kernel priorities 0-7
+PRIORITIES = ("critical", "critical", "critical", "error", "warning", "info", "info", "info")
+# Numeric levels of bunyan/pino-style JSON loggers (lower bounds)
+NUMERIC_LEVELS = ((60, "critical"), (50, "error"), (40, "warning"))
+# klog/glog prefixes: E0219 10:00:00.000000 ...
+KLOG_LEVELS = {"F": "critical", "E": "error", "W": "warning", "I": "info"}
+
+JSON_LEVEL = re.compile(
+    r'"(?:level|severity|lvl|loglevel|log\.level|levelname|PRIORITY|@l)"\s*:\s*"?([A-Za-z]+|\d+)'
+)
+# level=error, [ERROR], " ERROR " or klog's E0219 near the start of a message
+MESSAGE_LEVEL = re.compile(
+    r"^(?:([IWEF])\d{4} |.{0,48}?(?:\blevel=\"?(\w+)|\[(\w+)\]|(?<!\S)"
+    r"(EMERG|ALERT|CRIT|CRITICAL|FATAL|PANIC|ERROR|ERR|WARN|WARNING|INFO|NOTICE|DEBUG|TRACE)(?=[\s:\]]|$)))"
+)
+
+
+def level_severity(value: str) -> str:
+    """Severity of a level field ("error", "WARN", "50", "3"), or info."""
+    if value.isdigit():
+        number = int(value)
+        if number < len(PRIORITIES):
+            return PRIORITIES[number]
+        return next((severity for bound, severity in NUMERIC_LEVELS if number >= bound), "info")
+    return LEVELS.get(value.lower(), "info")
+
+
+def message_severity(message: str):
+    """Severity from a level marker at the start of a message, else None."""
+    match = MESSAGE_LEVEL.match(message)
+    if match is None:
+        return None
+    if match[1]:
+        return KLOG_LEVELS[match[1]]
+    value = (match[2] or match[3] or match[4]).lower()
+    if value in LEVELS:
+        return LEVELS[value]
+    return "info" if value in INFO_LEVELS else None
+
+
+class LogFormat:
+    """
+    Base parser: every line goes to the keyword classifier. ``fallback``
+    is a batch classifier (SeverityClassifier.classify_lines).
+    """
+
+    name = "generic"
+    pattern: re.Pattern = None
+    probes_markers = False  # parse() looks for level markers in messages
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.facets: dict[str, Counter] = {}
+        # Logs whose messages carry no level markers skip looking for them
+        self.marked = True
+        self._probed = 0
+        self._marker_hits = 0
+        self.probes = 0  # messages looked at, whether or not still probing
+
+    def matches(self, line: str) -> bool:
+        return self.pattern is not None and self.pattern.match(line) is not None
+
+    def parse(self, lines: list[str]) -> tuple[list[str], list]:
+        """(severity category, facet) of each line; facets may be None."""
+        return self.fallback(lines), None
+
+    def probe_state(self) -> tuple:
+        """Where the marker probe stands; the hit count only matters as 0 or not."""
+        return self.marked, self._probed, min(self._marker_hits, 1)
+
+    def set_probe_state(self, state: tuple) -> None:
+        self.marked, self._probed, self._marker_hits = state
+
+    def probe_settled(self) -> bool:
+        """True once more lines can no longer change the probe state."""
+        return not self.probes_markers or not self.marked or self._marker_hits > 0
+
+    def _message_severity(self, message: str):
+        self.probes += 1
+        if not self.marked:
+            return None
+        severity = message_severity(message)
+        if severity is not None:
+            self._marker_hits += 1
+        elif not self._marker_hits:
+            self._probed += 1
+            if self._probed >= MARKER_PROBE_LINES:
+                self.marked = False
+        return severity
+
+    def _resolve(self, categories: list, messages: list) -> list[str]:
+        """Classify lines left as None by keyword, on their message only."""
+        pending = [n for n, category in enumerate(categories) if category is None]
+        if pending:
+            for n, category in zip(pending, self.fallback([messages[n] for n in pending])):
+                categories[n] = category
+        return categories
+
+    def count(self, facets: list) -> None:
+        """Add the facets of kept lines to the aggregates."""
+
+    def _add(self, name: str, values) -> None:
+        counter = self.facets.get(name)
+        if counter is None:
+            counter = self.facets[name] = Counter()
+        counter.update(values)
+        if len(counter) > FACET_MAX_KEYS:
+            # Keep the heavy hitters; rare values are dropped
+            self.facets[name] = Counter(dict(counter.most_common(FACET_MAX_KEYS // 2)))
+
+    def stats(self) -> dict:
+        aggregates = {
+            name: dict(counter.most_common(FACET_TOP))
+            for name, counter in self.facets.items() if counter
+        }
+        return {"name": self.name, **aggregates}
+
+
+class JSONLinesFormat(LogFormat):
+    """One JSON object per line with a level/severity/PRIORITY field."""
+
+    name = "json"
+    pattern = re.compile(r"\s*\{.*\}\s*$")
+
+    def parse(self, lines):
+        categories, facets = [], []
+        for line in lines:
+            match = JSON_LEVEL.search(line)
+            if match is None:
+                categories.append(None)
+                facets.append(None)
+            else:
+                severity = level_severity(match[1])
+                categories.append(severity)
+                facets.append(severity if match[1].isdigit() else match[1].lower())
+        return self._resolve(categories, lines), facets
+
+    def count(self, facets):
+        self._add("levels", (facet for facet in facets if facet is not None))
+
+
+class ContainerFormat(LogFormat):
+    """
+    Docker json-file lines ({"log": ..., "stream": ...}) and Kubernetes
+    CRI lines (<time> stdout|stderr F|P <message>). The severity comes from
+    a level marker in the message (JSON level, level=, [ERROR], klog E0219).
+    """
+
+    name = "container"
+    probes_markers = True
+    pattern = re.compile(
+        r'\{\s*"log"\s*:\s*"([^"\\]*(?:\\.[^"\\]*)*)"\s*,\s*"stream"\s*:\s*"(\w+)"'
+        r"|\d{4}-\d{2}-\d{2}T\S+ (stdout|stderr) [FP] (.*)$"
+    )
+
+    def parse(self, lines):
+        categories, facets, messages = [], [], []
+        match_line = self.pattern.match
+        for line in lines:
+            match = match_line(line)
+            if match is None:
+                message, stream = line, None
+            elif match[1] is not None:
+                message, stream = match[1], match[2]
+                if '\\"' in message:
+                    message = message.replace('\\"', '"')
+            else:
+                message, stream = match[4], match[3]
+            level = JSON_LEVEL.search(message) if message.startswith("{") else None
+            if level is not None:
+                categories.append(level_severity(level[1]))
+            else:
+                categories.append(self._message_severity(message))
+            messages.append(message)
+            facets.append(stream)
+        return self._resolve(categories, messages), facets
+
+    def count(self, facets):
+        self._add("streams", (facet for facet in facets if facet is not None))
+
+
+class AccessLogFormat(LogFormat):
+    """
+    nginx/Apache access logs (common and combined; severity from the
+    status code: 5xx error, 4xx warning) and nginx error logs ([level]).
+    """
+
+    name = "access"
+    pattern = re.compile(r'\S+ \S+ \S+ \[[^\]]+\] "(?:(\S+) (\S+?)(?:\?\S*)?(?: [^"]*)?|[^"]*)" (\d{3}) ')
+    error_pattern = re.compile(r"[^\[]{0,40}\[(emerg|alert|crit|error|warn|notice|info|debug)\] ")
+
+    def matches(self, line):
+        return self.pattern.match(line) is not None or self.error_pattern.match(line) is not None
+
+    def parse(self, lines):
+        categories, facets = [], []
+        access, error_log = self.pattern.match, self.error_pattern.match
+        for line in lines:
+            match = access(line)
+            if match is not None:
+                status = match[3]
+                categories.append("error" if status[0] == "5" else "warning" if status[0] == "4" else "info")
+                endpoint = f"{match[1]} {match[2][:ENDPOINT_MAX_CHARS]}" if match[1] else None
+                facets.append((status, endpoint))
+                continue
+            match = error_log(line)
+            if match is not None:
+                categories.append(level_severity(match[1]))
+            else:
+                categories.append(None)
+            facets.append(None)
+        return self._resolve(categories, lines), facets
+
+    def count(self, facets):
+        requests = [facet for facet in facets if facet is not None]
+        self._add("status_codes", (status for status, _ in requests))
+        self._add("endpoints", (endpoint for _, endpoint in requests if endpoint))
+        self._add("error_endpoints", (endpoint for status, endpoint in requests if endpoint and status[0] == "5"))
+
+
+class SyslogFormat(LogFormat):
+    """
+    RFC 3164/5424 syslog and journald short output. The <PRI> prefix gives
+    the severity when present; otherwise the message is checked for a level
+    marker, then classified by keyword.
+    """
+
+    name = "syslog"
+    probes_markers = True
+    pattern = re.compile(
+        r"(?:<(\d{1,3})>\d?\s*)?(?:[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2}|\d{4}-\d{2}-\d{2}T\S+)"
+        r" \S+ ([^:\[\s]+)(?:\[\d+\])?: ?(.*)$"
+    )
+
+    def parse(self, lines):
+        categories, facets, messages = [], [], []
+        match_line = self.pattern.match
+        for line in lines:
+            match = match_line(line)
+            if match is None:
+                categories.append(None)
+                facets.append(None)
+                messages.append(line)
+                continue
+            priority, program, message = match.groups()
+            if priority is not None:
+                categories.append(PRIORITIES[int(priority) & 7])
+            else:
+                categories.append(self._message_severity(message))
+            facets.append(program)
+            messages.append(message)
+        return self._resolve(categories, messages), facets
+
+    def count(self, facets):
+        self._add("programs", (facet for facet in facets if facet is not None))
+
+
+class DmesgFormat(LogFormat):
+    """
+    Kernel ring buffer: ``dmesg``, ``dmesg -x`` (facility:level prefix) and
+    raw /dev/kmsg-style <N> priorities. Without a level the message is
+    classified by keyword.
+    """
+
+    name = "dmesg"
+    probes_markers = True
+    # Groups: level, priority, message, subsystem (its first word)
+    pattern = re.compile(r"(?:\w+\s*:(\w+)\s*: )?(?:<(\d+)>)?\[\s*\d+\.\d+\] ?(([\w.-]*).*)$")
+
+    def parse(self, lines):
+        categories, facets, messages = [], [], []
+        match_line = self.pattern.match
+        for line in lines:
+            match = match_line(line)
+            if match is None:
+                categories.append(None)
+                facets.append(None)
+                messages.append(line)
+                continue
+            level, priority, message, subsystem = match.groups()
+            if level is not None:
+                categories.append(level_severity(level))
+            elif priority is not None:
+                categories.append(PRIORITIES[int(priority) & 7])  # facility bits above
+            else:
+                categories.append(self._message_severity(message))
+            facets.append(subsystem or None)
+            messages.append(message)
+        return self._resolve(categories, messages), facets
+
+    def count(self, facets):
+        self._add("subsystems", (facet for facet in facets if facet is not None))
+
+
+# Detection order: on equal shares the earlier format wins (container
+# lines are also JSON lines)
+FORMATS = {cls.name: cls for cls in (ContainerFormat, JSONLinesFormat, AccessLogFormat, SyslogFormat, DmesgFormat)}
+
+
+def detect_format(lines: list[str]) -> str:
+    """Name of the format most of the first FORMAT_SAMPLE_LINES non-blank lines parse as, or "generic"."""
+    sample = list(islice((line for line in lines if line.strip()), FORMAT_SAMPLE_LINES))
+    best, best_hits = "generic", 0
+    for name, cls in FORMATS.items():
+        parser = cls(None)
+        hits = sum(1 for line in sample if parser.matches(line))
+        if hits > best_hits:
+            best, best_hits = name, hits
+    if sample and best_hits >= FORMAT_MIN_SHARE * len(sample):
+        return best
+    return "generic"
+
+
+def make_parser(name: str, fallback) -> LogFormat:
+    return FORMATS.get(name, LogFormat)(fallback)
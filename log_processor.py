@@ -4,12 +4,26 @@ Handles preprocessing, chunking, and synthesis of large log files.
 Supports all log types: kernel, deployment, application, Docker, systemd, etc.
 """
 
+import codecs
+import copy
+import heapq
 import re
-from collections import Counter
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
+from functools import cached_property
+from itertools import accumulate
+from multiprocessing import get_context
 
+from log_formats import FORMAT_SAMPLE_LINES, detect_format, make_parser
+from timestamps import TIMESTAMP_PATTERNS, TimestampExtractor, TimeIndex, format_time
 
-# Generic patterns that match across all log types
+
+# Keyword patterns for lines no format parser can read (log_formats.py)
 LOG_PATTERNS = {
     "error": re.compile(
         r"(error|fail|fatal|panic|exception|traceback|crashed|abort|segfault"
@@ -29,13 +43,145 @@ LOG_PATTERNS = {
 }
 
 
+# Severity codes stored per line in LineStore, in output section order
+SEVERITIES = ("critical", "error", "warning")
+SEVERITY_CODES = {name: code for code, name in enumerate(SEVERITIES)}
+INFO_CODE = len(SEVERITIES)
+
+
+class LineStore:
+    """
+    Severity lines in one backing buffer instead of a str object each.
+    Lines are appended block by block, joined with "\n", and addressed by
+    typed arrays: start/end offsets, a one-byte severity code and the
+    original (1-based) line number, about 21 bytes of overhead per line.
+    The store is append-only; ``view()`` gives a copy frozen at the
+    current length that stays valid while the store grows.
+    """
+
+    def __init__(self):
+        self.starts = array("Q")
+        self.ends = array("Q")
+        self.codes = array("B")
+        self.line_numbers = array("I")
+        self.counts = [0] * len(SEVERITIES)
+        self._length = 0
+        self._size = 0
+        # Blocks not yet joined into the buffer; shared with views
+        self._parts: list[str] = []
+
+    def __len__(self) -> int:
+        return self._length
+
+    def extend(self, lines: list[str], codes: list[int], line_numbers: list[int]) -> None:
+        if not lines:
+            return
+        block = "\n".join(lines) + "\n"
+        lengths = list(map(len, lines))
+        starts = list(accumulate((n + 1 for n in lengths[:-1]), initial=self._size))
+        self.starts.extend(starts)
+        self.ends.extend(map(int.__add__, starts, lengths))
+        self.codes.extend(codes)
+        self.line_numbers.extend(line_numbers)
+        for code in codes:
+            self.counts[code] += 1
+        self._parts.append(block)
+        self._size += len(block)
+        self._length += len(lines)
+
+    def view(self) -> "LineStore":
+        """A copy that keeps the current length (arrays and buffer are shared)."""
+        return copy.copy(self)
+
+    @property
+    def buffer(self) -> str:
+        """The backing buffer, joined on first use after new blocks arrive."""
+        parts = self._parts
+        if len(parts) > 1:
+            parts[:] = ["".join(parts)]
+        return parts[0] if parts else ""
+
+    def count(self, severity: str) -> int:
+        if len(self.codes) == self._length:
+            return self.counts[SEVERITY_CODES[severity]]
+        return self.codes[:self._length].count(SEVERITY_CODES[severity])
+
+    # ─── Views ──────────────────────────────────────────────────────────────
+
+    def select(self, severity: str = None, first_line: int = None, last_line: int = None) -> range | list[int]:
+        """
+        Indices of stored lines, optionally limited to one severity and to
+        original line numbers in [first_line, last_line].
+        """
+        numbers = self.line_numbers
+        lo = bisect_left(numbers, first_line, 0, self._length) if first_line is not None else 0
+        hi = bisect_right(numbers, last_line, 0, self._length) if last_line is not None else self._length
+        if severity is None:
+            return range(lo, hi)
+        code = SEVERITY_CODES[severity]
+        codes = self.codes
+        return [i for i in range(lo, hi) if codes[i] == code]
+
+    def line(self, index: int) -> str:
+        return self.buffer[self.starts[index]:self.ends[index]]
+
+    def lines(self, indices=None) -> list[str]:
+        """Line text for ``indices`` (from select()), default all lines."""
+        if indices is None:
+            indices = range(self._length)
+        buffer, starts, ends = self.buffer, self.starts, self.ends
+        return [buffer[starts[i]:ends[i]] for i in indices]
+
+    def categorized(self) -> dict[str, list[str]]:
+        """Lines per severity, in input order."""
+        return {name: self.lines(self.select(name)) for name in SEVERITIES}
+
+
 @dataclass
 class ProcessedLog:
-    """Result of preprocessing a raw log file."""
+    """
+    Result of preprocessing a raw log file. ``lines`` holds every severity
+    line with its position; ``processed_text`` is assembled on first use
+    from ``events`` (rendered severity signatures per section) and
+    ``info_summary`` (rendered template summaries of the info lines).
+    """
     original_line_count: int = 0
-    processed_text: str = ""
     categories: dict = field(default_factory=dict)
     summary_stats: dict = field(default_factory=dict)
+    perf: dict = field(default_factory=dict)  # timing details, not sent to the LLM
+    lines: LineStore = field(default_factory=LineStore, repr=False)
+    info_summary: list[str] = field(default_factory=list, repr=False)
+    events: dict = field(default_factory=dict, repr=False)  # severity -> (signatures, rendered lines)
+    signatures: dict = field(default_factory=dict, repr=False)  # severity -> most frequent signatures
+    time_range: tuple = None  # (first, last) timestamp of the analyzed lines, if detected
+
+    @cached_property
+    def processed_text(self) -> str:
+        stats = self.summary_stats
+        output_parts = []
+        output_parts.append(f"=== LOG SUMMARY: {self.original_line_count} lines ===")
+        output_parts.append(
+            f"Critical: {stats['critical']} | Errors: {stats['errors']} "
+            f"| Warnings: {stats['warnings']} | Info: {stats['info']}"
+        )
+        if self.time_range:
+            output_parts.append(f"Time range: {self.time_range[0]} to {self.time_range[1]}")
+        output_parts.append("")
+
+        # Critical, errors, warnings — one exemplar per signature
+        for cat in SEVERITIES:
+            signatures, rendered = self.events.get(cat, (0, []))
+            if rendered:
+                lines = self.lines.count(cat)
+                output_parts.append(f"--- {cat.upper()} LINES ({lines} lines, {signatures} signatures) ---")
+                output_parts.extend(rendered)
+                output_parts.append("")
+
+        # Info — compress repetitive patterns
+        output_parts.append(f"--- INFO LINES (compressed from {stats['info']} to {len(self.info_summary)}) ---")
+        output_parts.extend(self.info_summary)
+
+        return "\n".join(output_parts)
 
 
 def _categorize_line(line: str) -> str:
@@ -46,119 +192,1123 @@ def _categorize_line(line: str) -> str:
     return "info"
 
 
+class SeverityClassifier:
+    """
+    Batch severity classifier with the same precedence as _categorize_line
+    (LOG_PATTERNS order).
+
+    A block of lines is joined into one buffer and each category pattern is
+    run over it with finditer, so there is no per-line Python regex call.
+    ASCII blocks are lowercased once and matched case-sensitively, which is
+    several times faster than IGNORECASE; other blocks use the original
+    patterns so the results stay identical.
+    """
+
+    def __init__(self, patterns: dict = LOG_PATTERNS):
+        self._patterns = list(patterns.items())
+        # Keyword alternations only: lowering the source keeps them valid
+        self._lowered = [
+            (category, re.compile(pattern.pattern.lower()))
+            for category, pattern in self._patterns
+        ]
+
+    def classify_lines(self, lines: list[str]) -> list[str]:
+        """Classify a block of lines (no embedded newlines, e.g. from splitlines)."""
+        if not lines:
+            return []
+
+        buffer = "\n".join(lines)
+        if buffer.isascii():
+            buffer = buffer.lower()
+            patterns = self._lowered
+        else:
+            patterns = self._patterns
+
+        starts = [0]
+        starts.extend(accumulate(len(line) + 1 for line in lines[:-1]))
+
+        result = ["info"] * len(lines)
+        # Lowest precedence first so higher-precedence matches overwrite
+        for category, pattern in reversed(patterns):
+            for match in pattern.finditer(buffer):
+                result[bisect_right(starts, match.start()) - 1] = category
+        return result
+
+    def classify(self, line: str) -> str:
+        return self.classify_lines([line])[0]
+
+
+_classifier = SeverityClassifier()
+
+# Lines per classify_lines call (bounds the joined buffer; a non-ASCII line
+# only drops its own block to the slower IGNORECASE path)
+CLASSIFY_BLOCK_LINES = 65536
+
+
+# Normalizers for template mining, compiled once. Applied in order; each
+# replaces a variable field with a typed placeholder token.
+TEMPLATE_MASKS = [
+    (re.compile(r"^\[\s*[\d.]+\]\s*"), ""),  # dmesg [secs.usecs] prefix
+    (re.compile(
+        r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+    ), "<TS>"),
+    (re.compile(r"\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b"), "<TS>"),
+    (re.compile(
+        r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"
+    ), "<UUID>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<IP>"),
+    (re.compile(r"\b(?:0[xX][0-9a-fA-F]+|(?=[a-fA-F]*\d)[0-9a-fA-F]{6,})\b"), "<HEX>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "<NUM>"),
+]
+
+WILDCARD = "<*>"
+
+
+def _mask_line(line: str) -> str:
+    for pattern, repl in TEMPLATE_MASKS:
+        line = pattern.sub(repl, line)
+    return line
+
+
+@dataclass
+class LogTemplate:
+    """One mined template and the lines it has absorbed so far."""
+    tokens: list[str]
+    representative: str
+    first_line: int
+    last_line: int
+    count: int = 1
+    # Member lines are only kept until the template is frequent enough to
+    # be summarised, so memory is bounded by the output size
+    members: list[tuple[int, str]] = field(default_factory=list)
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+
+class TemplateMiner:
+    """
+    Streaming Drain-style template miner.
+
+    Lines are masked (timestamps, ids, numbers), split into tokens and
+    routed by token count and their first ``depth`` tokens to a small
+    group of candidate templates. A line joins the most similar candidate
+    when at least ``similarity`` of its tokens match, and differing
+    positions become ``<*>`` slots. Exact masked repeats hit a dict
+    directly, so the common case costs one lookup per line.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 5,
+        similarity: float = 0.5,
+        depth: int = 2,
+        max_candidates: int = 64,
+        max_exact: int = 100_000,
+    ):
+        self.threshold = threshold
+        self.similarity = similarity
+        self.depth = depth
+        self.max_candidates = max_candidates
+        self.max_exact = max_exact
+        self.templates: list[LogTemplate] = []
+        self.line_count = 0
+        self._groups: dict[tuple, list[LogTemplate]] = {}
+        self._exact: dict[str, LogTemplate] = {}
+
+    def _group_key(self, tokens: list[str]) -> tuple:
+        prefix = tuple(
+            WILDCARD if tok.startswith("<") or any(c.isdigit() for c in tok) else tok
+            for tok in tokens[:self.depth]
+        )
+        return (len(tokens),) + prefix
+
+    def _best_match(self, group: list[LogTemplate], tokens: list[str]):
+        best, best_score = None, -1.0
+        for candidate in group:
+            same = sum(1 for a, b in zip(candidate.tokens, tokens) if a == b)
+            score = same / len(tokens) if tokens else 1.0
+            if score > best_score:
+                best, best_score = candidate, score
+        if best is not None and best_score >= self.similarity:
+            return best
+        return None
+
+    def add(self, line: str, line_number: int = 0, masked: str = None) -> LogTemplate:
+        """
+        Feed one line (``line_number`` defaults to the feed position).
+        ``masked`` may be passed if _mask_line(line) was already computed.
+        """
+        self.line_count += 1
+        if not line_number:
+            line_number = self.line_count
+
+        if masked is None:
+            masked = _mask_line(line)
+        tmpl = self._exact.get(masked)
+        if tmpl is None:
+            tokens = masked.split()
+            group = self._groups.setdefault(self._group_key(tokens), [])
+            tmpl = self._best_match(group, tokens)
+            if tmpl is None:
+                tmpl = LogTemplate(
+                    tokens=tokens,
+                    representative=line,
+                    first_line=line_number,
+                    last_line=line_number,
+                    count=0,
+                )
+                self.templates.append(tmpl)
+                group.append(tmpl)
+                # Only the most recent candidates are compared against
+                if len(group) > self.max_candidates:
+                    del group[0]
+            else:
+                tmpl.tokens = [
+                    a if a == b else WILDCARD for a, b in zip(tmpl.tokens, tokens)
+                ]
+            if len(self._exact) >= self.max_exact:
+                self._exact.clear()
+            self._exact[masked] = tmpl
+
+        tmpl.count += 1
+        tmpl.last_line = line_number
+        if tmpl.count < self.threshold:
+            tmpl.members.append((line_number, line))
+        elif tmpl.members:
+            tmpl.members = []
+        return tmpl
+
+    def render(self) -> list[str]:
+        """
+        Compressed lines in order of first occurrence. Templates seen fewer
+        than ``threshold`` times are emitted verbatim; the rest as one
+        representative plus a count and first/last line number.
+        """
+        entries = []
+        for tmpl in self.templates:
+            if tmpl.count >= self.threshold:
+                entries.append((tmpl.first_line, tmpl.representative))
+                entries.append((tmpl.first_line, (
+                    f"  [... {tmpl.count} similar lines (lines {tmpl.first_line}-{tmpl.last_line}): "
+                    f"{tmpl.template} ...]"
+                )))
+            else:
+                entries.extend(tmpl.members)
+        entries.sort(key=lambda entry: entry[0])
+        return [text for _, text in entries]
+
+
+# ─── Severity signatures ────────────────────────────────────────────────────
+
+SIGNATURE_CAPACITY = 200     # signatures tracked per severity (Space-Saving)
+SIGNATURE_THRESHOLD = 5      # occurrences before a signature is summarised
+EVENT_MAX_LINES = 30         # lines kept per event exemplar (head + tail)
+SIGNATURE_TOP = 10           # signatures per severity in ProcessedLog.signatures
+
+# Lines that continue the previous event: Java/JVM frames and causes,
+# or any indented line (traceback frames, wrapped messages)
+EVENT_CONTINUATION = re.compile(
+    r"^(?:\s|Caused by: |\.\.\. \d+ (?:more|common frames omitted))"
+)
+PYTHON_TRACEBACK = "Traceback (most recent call last)"
+# Signature mask: one pass replacing every token that contains a digit
+# (timestamps, ids, counts, addresses), coarser and cheaper than _mask_line
+SIGNATURE_MASK = re.compile(r"\S*\d\S*")
+
+
+def _signature_mask(line: str) -> str:
+    return SIGNATURE_MASK.sub("<*>", line)
+
+
+class _Event:
+    """A severity line plus its continuation lines (e.g. a stack trace)."""
+    __slots__ = ("lines", "code", "first_line", "last_line", "first_time", "last_time", "extra", "python", "complete")
+
+    def __init__(self, line: str, code: int, number: int, stamp):
+        self.lines = [line]
+        self.code = code
+        self.first_line = self.last_line = number
+        self.first_time = self.last_time = stamp
+        self.extra = 0  # continuation lines beyond EVENT_MAX_LINES
+        self.python = line.lstrip().startswith(PYTHON_TRACEBACK)
+        self.complete = False
+
+    def add(self, line: str, code: int, number: int, stamp) -> None:
+        if len(self.lines) < EVENT_MAX_LINES:
+            self.lines.append(line)
+        else:
+            # Keep the head and the most recent tail (innermost frames, exception)
+            del self.lines[EVENT_MAX_LINES // 3]
+            self.lines.append(line)
+            self.extra += 1
+        self.code = min(self.code, code)
+        self.last_line = number
+        if stamp is not None:
+            self.last_time = stamp
+
+    def continues(self, line: str) -> bool:
+        if self.complete:
+            return False
+        if self.python:
+            if line[:1] in (" ", "\t"):
+                return True
+            # The first unindented line closes the traceback (the exception)
+            self.complete = True
+            return bool(line.strip())
+        return EVENT_CONTINUATION.match(line) is not None
+
+    def signature(self) -> str:
+        """Masked first line, plus the exception and innermost frame of a trace."""
+        parts = [_signature_mask(self.lines[0])]
+        if len(self.lines) > 1:
+            frames = [line for line in self.lines if line.lstrip().startswith(("File ", "at "))]
+            if frames:
+                parts.append(_signature_mask(frames[-1] if self.python else frames[0]).strip())
+            if self.python:
+                parts.append(_signature_mask(self.lines[-1]))
+        return "\n".join(parts)
+
+    def title(self) -> str:
+        """The line that names the event (the exception, for a Python traceback)."""
+        return (self.lines[-1] if self.python and self.complete else self.lines[0]).strip()
+
+    def text(self) -> str:
+        if not self.extra:
+            return "\n".join(self.lines)
+        head = EVENT_MAX_LINES // 3
+        return "\n".join([
+            *self.lines[:head],
+            f"  [... {self.extra} lines omitted ...]",
+            *self.lines[head:],
+        ])
+
+
+class _Signature:
+    __slots__ = (
+        "key", "count", "error", "title", "exemplar", "first_line", "last_line", "first_time", "last_time", "members",
+    )
+
+    def __init__(self, key: str, event: _Event, count: int = 0, error: int = 0):
+        self.key = key
+        self.count = count
+        self.error = error  # Space-Saving overestimate inherited on eviction
+        self.title = event.title()
+        self.exemplar = event.text()
+        self.first_line = event.first_line
+        self.last_line = event.last_line
+        self.first_time = event.first_time
+        self.last_time = event.last_time
+        self.members: list[tuple[int, str]] = []
+
+
+class SignatureAggregator:
+    """
+    Streaming top-K of severity events by masked signature.
+
+    Lines are assembled into events (a severity line and its continuation
+    lines, so a Python or Java stack trace is one record) and counted per
+    signature in a Space-Saving summary of ``capacity`` entries per
+    severity: when a table is full the least frequent signature is evicted
+    and the newcomer inherits its count, so frequent signatures are never
+    lost and memory stays bounded however many errors the log has.
+    Signatures seen fewer than ``threshold`` times are rendered verbatim;
+    the rest as one exemplar with count and first/last seen.
+    """
+
+    def __init__(self, capacity: int = SIGNATURE_CAPACITY, threshold: int = SIGNATURE_THRESHOLD):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.events = [0] * len(SEVERITIES)
+        self.evicted = 0
+        self._tables: list[dict[str, _Signature]] = [{} for _ in SEVERITIES]
+        # Lazy min-heaps of (count, seq, signature) for eviction
+        self._heaps: list[list] = [[] for _ in SEVERITIES]
+        self._seq = 0
+        self.pending: _Event = None  # event that may still get continuation lines
+
+    def add(self, line: str, code: int, number: int, stamp) -> bool:
+        """
+        Feed one line in input order (``code`` from SEVERITY_CODES, or
+        INFO_CODE). Returns True if it continued an open severity event, in
+        which case an info line should not also go to the template miner.
+        """
+        event = self.pending
+        if event is not None and event.continues(line):
+            event.add(line, code, number, stamp)
+            return True
+        if event is not None:
+            self.close()
+        if code != INFO_CODE:
+            self.pending = _Event(line, code, number, stamp)
+        return False
+
+    def close(self) -> None:
+        """Count the open event (at the end of input or before a new one)."""
+        event, self.pending = self.pending, None
+        if event is None:
+            return
+        self.events[event.code] += 1
+        key = event.signature()
+        table = self._tables[event.code]
+        sig = table.get(key)
+        if sig is None:
+            count = error = 0
+            if len(table) >= self.capacity:
+                count = error = self._evict(event.code)
+            sig = table[key] = _Signature(key, event, count, error)
+            self._seq += 1
+            heapq.heappush(self._heaps[event.code], (sig.count + 1, self._seq, sig))
+        sig.count += 1
+        sig.last_line = event.last_line
+        if event.last_time is not None:
+            sig.last_time = event.last_time
+        if sig.count < self.threshold and not sig.error:
+            sig.members.append((event.first_line, event.text()))
+        elif sig.members:
+            sig.members = []
+
+    def _evict(self, code: int) -> int:
+        heap, table = self._heaps[code], self._tables[code]
+        while True:
+            count, _, sig = heap[0]
+            if sig.count != count:
+                # Counted since it was pushed; reinsert at its real count
+                self._seq += 1
+                heapq.heapreplace(heap, (sig.count, self._seq, sig))
+                continue
+            heapq.heappop(heap)
+            del table[sig.key]
+            self.evicted += 1
+            return sig.count
+
+    def signatures(self, code: int) -> int:
+        return len(self._tables[code]) + (self.pending is not None and self.pending.code == code)
+
+    def top(self, code: int, n: int = SIGNATURE_TOP, fmt: str = None) -> list[dict]:
+        """The ``n`` most frequent signatures of one severity, most frequent first."""
+        sigs = list(self._tables[code].values())
+        if self.pending is not None and self.pending.code == code:
+            sigs.append(_Signature(self.pending.signature(), self.pending, count=1))
+        sigs = heapq.nsmallest(n, sigs, key=lambda sig: (-sig.count, sig.first_line))
+        pattern = TIMESTAMP_PATTERNS.get(fmt)
+
+        def title(sig: _Signature) -> str:
+            # Times are reported separately; drop a leading timestamp
+            match = pattern.match(sig.title) if pattern else None
+            return sig.title[match.end():].lstrip(" ]-:") or sig.title if match else sig.title
+
+        return [
+            {
+                "title": title(sig),
+                "count": sig.count,
+                "approximate": bool(sig.error),
+                "first_line": sig.first_line,
+                "last_line": sig.last_line,
+                "first_seen": format_time(sig.first_time, fmt) if fmt and sig.first_time is not None else None,
+                "last_seen": format_time(sig.last_time, fmt) if fmt and sig.last_time is not None else None,
+            }
+            for sig in sigs
+        ]
+
+    def render(self, code: int, fmt: str = None) -> list[str]:
+        """Lines for one severity section, in order of first occurrence."""
+        entries = []
+        for sig in self._tables[code].values():
+            if sig.count < self.threshold and not sig.error:
+                entries.extend(sig.members)
+                continue
+            seen = f"lines {sig.first_line}-{sig.last_line}"
+            if fmt and sig.first_time is not None:
+                seen += f", {format_time(sig.first_time, fmt)} to {format_time(sig.last_time, fmt)}"
+            count = f"~{sig.count}" if sig.error else str(sig.count)
+            entries.append((sig.first_line, f"{sig.exemplar}\n  [... {count} similar events ({seen}) ...]"))
+        # An event still open (live snapshot) is shown as it is so far
+        if self.pending is not None and self.pending.code == code:
+            entries.append((self.pending.first_line, self.pending.text()))
+        entries.sort(key=lambda entry: entry[0])
+        return [text for _, text in entries]
+
+
 def _compress_repetitive(lines: list[str], threshold: int = 5) -> list[str]:
     """
-    Collapse consecutive similar lines into summaries.
+    Collapse similar lines into template summaries, including interleaved
+    (non-consecutive) repeats.
     Generic — works for any log type with repeated patterns.
     """
     if not lines:
         return lines
 
-    compressed = []
-    i = 0
-    while i < len(lines):
-        # Normalize: strip timestamps and hex identifiers for comparison
-        normalized = re.sub(r"[\da-f]{6,}", "XXX", lines[i], flags=re.IGNORECASE)
-        normalized = re.sub(r"\[[\d.]+\]\s*", "", normalized)
-
-        # Count consecutive similar lines
-        run_length = 1
-        while i + run_length < len(lines):
-            next_norm = re.sub(r"[\da-f]{6,}", "XXX", lines[i + run_length], flags=re.IGNORECASE)
-            next_norm = re.sub(r"\[[\d.]+\]\s*", "", next_norm)
-            if next_norm == normalized:
-                run_length += 1
-            else:
-                break
+    miner = TemplateMiner(threshold=threshold)
+    for line in lines:
+        miner.add(line)
+    return miner.render()
+
 
-        if run_length >= threshold:
-            compressed.append(lines[i])
-            compressed.append(f"  [... {run_length - 2} similar lines omitted ...]")
-            compressed.append(lines[i + run_length - 1])
+# Characters str.splitlines() treats as line boundaries
+LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+
+class LogPreprocessor:
+    """
+    Incremental version of preprocess_log.
+
+    Text (or raw bytes, decoded incrementally) can be fed in blocks of any
+    size; only a partial trailing line is carried between blocks. Severity
+    lines are kept for the output and info lines go straight into the
+    template miner, so memory is bounded by the output, not the input.
+    finish() produces the same ProcessedLog as preprocess_log(full_text).
+
+    Each line is timestamped (timestamps.py) and counted in ``time_index``.
+    With ``since``/``until`` only lines whose time falls in the window are
+    classified and kept; ``line_count`` counts those lines and
+    ``position`` every line seen.
+    """
+
+    def __init__(self, line_offset: int = 0, since: float = None, until: float = None, log_format: str = None):
+        self.line_count = 0
+        self.position = 0
+        # Added to line numbers (for windows of a longer log)
+        self.line_offset = line_offset
+        self.since = since
+        self.until = until
+        self.lines = LineStore()
+        self.clock = TimestampExtractor()
+        self.time_index = TimeIndex()
+        # Format parser (log_formats.py), detected from the first lines:
+        # until FORMAT_SAMPLE_LINES non-blank ones arrive (or finish()),
+        # lines are held in _sample so block boundaries don't matter
+        self.parser = make_parser(log_format, _classifier.classify_lines) if log_format else None
+        self._sample: list[str] = []
+        self._sampled = 0
+        self.first_time = None
+        self.last_time = None
+        self.miner = TemplateMiner()
+        self.events = SignatureAggregator()
+        self.info_count = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._carry = ""
+        self._skip_lf = False
+        # Mirrors raw_text.strip(): leading blank lines are dropped, and the
+        # last content line plus any blank lines after it are held back
+        # until more content arrives (or finish() strips them)
+        self._started = False
+        self._last = None
+        self._pending: list[str] = []
+
+    def feed_bytes(self, data: bytes) -> None:
+        self.feed(self._decoder.decode(data))
+
+    def feed(self, text: str) -> None:
+        text = self._carry + text
+        self._carry = ""
+        if self._skip_lf and text.startswith("\n"):
+            text = text[1:]
+        self._skip_lf = False
+        if not text:
+            return
+
+        lines = text.splitlines()
+        if text[-1] in LINE_BREAKS:
+            # A trailing \r may be the first half of a \r\n split across blocks
+            self._skip_lf = text[-1] == "\r"
         else:
-            compressed.extend(lines[i:i + run_length])
+            self._carry = lines.pop()
+        self._feed_lines(lines)
+
+    def feed_classified(self, lines: list[str], categories: list[str], masks: list, facets: list = None) -> None:
+        """
+        Feed complete lines that were already classified (and, for info
+        lines, masked), e.g. by _preprocess_shard in a worker process.
+        """
+        self._feed_lines(lines, categories, masks, facets)
+
+    def _feed_lines(self, lines: list[str], categories: list = None, masks: list = None, facets: list = None) -> None:
+        first = 0
+        if not self._started:
+            while first < len(lines) and not lines[first].strip():
+                first += 1
+            if first == len(lines):
+                return
+            stripped = lines[first].lstrip()
+            if stripped != lines[first]:
+                lines[first] = stripped
+                if masks is not None:
+                    masks[first] = None
+            self._started = True
+
+        end = len(lines)
+        while end > first and not lines[end - 1].strip():
+            end -= 1
+        if end == first:
+            self._pending.extend(lines[first:])
+            return
+
+        if self._last is not None:
+            self._commit([self._last, *self._pending])
+        self._commit(lines, first, end - 1, categories, masks, facets)
+        self._last = lines[end - 1]
+        self._pending = lines[end:]
+
+    def _commit(
+        self,
+        lines: list[str],
+        start: int = 0,
+        stop: int = -1,
+        categories: list = None,
+        masks: list = None,
+        facets: list = None,
+    ) -> None:
+        if stop < 0:
+            stop = len(lines)
+        if self.parser is None:
+            start = self._fill_sample(lines, start, stop)
+            if self.parser is None:
+                return
+        windowed = self.since is not None or self.until is not None
+        for block_start in range(start, stop, CLASSIFY_BLOCK_LINES):
+            block_stop = min(block_start + CLASSIFY_BLOCK_LINES, stop)
+            block = lines[block_start:block_stop]
+            first = self.line_offset + self.position + 1
+            numbers = range(first, first + len(block))
+            self.position += len(block)
+            stamps = self.clock.stamps(block)
+            parser = self.parser
+            cats = categories[block_start:block_stop] if categories is not None else None
+            block_masks = masks[block_start:block_stop] if masks is not None else None
+            block_facets = facets[block_start:block_stop] if facets is not None else None
+
+            if windowed:
+                since = self.since if self.since is not None else float("-inf")
+                until = self.until if self.until is not None else float("inf")
+                # Continuation lines carry their parent's time (TimestampExtractor),
+                # so they are kept or dropped with it. Lines before the first
+                # timestamp are kept when the window is open at the start.
+                keep_untimed = self.since is None
+                keep = [
+                    n for n, stamp in enumerate(stamps)
+                    if (since <= stamp <= until if stamp is not None else keep_untimed)
+                ]
+                if len(keep) < len(block):
+                    block = [block[n] for n in keep]
+                    numbers = [numbers[n] for n in keep]
+                    stamps = [stamps[n] for n in keep]
+                    cats = [cats[n] for n in keep] if cats is not None else None
+                    block_masks = [block_masks[n] for n in keep] if block_masks is not None else None
+                    block_facets = [block_facets[n] for n in keep] if block_facets is not None else None
+                if not block:
+                    continue
+
+            if cats is None:
+                cats, block_facets = parser.parse(block)
+            if block_facets is not None:
+                parser.count(block_facets)
+            self._add_block(block, cats, block_masks, numbers, stamps)
 
-        i += run_length
+    def _fill_sample(self, lines: list[str], start: int, stop: int) -> int:
+        """
+        Hold lines[start:stop] back until the format sample is complete,
+        then detect the format and commit the sample. Returns where the
+        caller continues committing.
+        """
+        n = start
+        # At most one classify block is held, even of blank lines
+        while n < stop and self._sampled < FORMAT_SAMPLE_LINES and len(self._sample) < CLASSIFY_BLOCK_LINES:
+            if lines[n].strip():
+                self._sampled += 1
+            self._sample.append(lines[n])
+            n += 1
+        if self._sampled >= FORMAT_SAMPLE_LINES or len(self._sample) >= CLASSIFY_BLOCK_LINES:
+            self._detect_format()
+        return n
 
-    return compressed
+    def _detect_format(self) -> None:
+        sample, self._sample = self._sample, []
+        self.parser = make_parser(detect_format(sample), _classifier.classify_lines)
+        if sample:
+            self._commit(sample)
 
+    @property
+    def lines_seen(self) -> int:
+        """Lines committed so far plus those held for format detection."""
+        return self.line_count + len(self._sample)
 
-def preprocess_log(raw_text: str) -> ProcessedLog:
+    def _add_block(self, block: list[str], cats: list[str], masks, numbers, stamps: list) -> None:
+        kept, codes, kept_numbers = [], [], []
+        all_codes = []
+        miner, events = self.miner, self.events
+        for n, (line, cat) in enumerate(zip(block, cats)):
+            if cat == "info":
+                self.info_count += 1
+                # Trace frames etc. belong to the open severity event
+                if events.pending is None or not events.add(line, INFO_CODE, numbers[n], stamps[n]):
+                    miner.add(line, numbers[n], masks[n] if masks is not None else None)
+                all_codes.append(INFO_CODE)
+            else:
+                code = SEVERITY_CODES[cat]
+                events.add(line, code, numbers[n], stamps[n])
+                kept.append(line)
+                codes.append(code)
+                kept_numbers.append(numbers[n])
+                all_codes.append(code)
+        self.line_count += len(block)
+        self.lines.extend(kept, codes, kept_numbers)
+
+        self.time_index.add(stamps, numbers, all_codes)
+        timed = [stamp for stamp in stamps if stamp is not None]
+        if timed:
+            if self.first_time is None:
+                self.first_time = timed[0]
+            self.last_time = max(self.last_time or timed[-1], max(timed))
+
+    # ─── Live logs ─────────────────────────────────────────────────────────
+    # A growing log has no final end, so held-back lines are committed as
+    # they arrive and the output can be inspected without finishing.
+
+    def commit_held(self) -> None:
+        """Commit the held-back last line and trailing blank lines now."""
+        if self._last is not None:
+            self._commit([self._last, *self._pending])
+            self._last = None
+            self._pending = []
+
+    def snapshot(self) -> ProcessedLog:
+        """ProcessedLog of the lines committed so far; feeding can continue."""
+        if self.parser is None and self._sample:
+            # Nothing is committed before the format is known: build from a
+            # throwaway copy that detects it on the lines held so far
+            draft = LogPreprocessor(self.line_offset, self.since, self.until)
+            draft._sample = list(self._sample)
+            draft._detect_format()
+            return draft._build()
+        return self._build()
+
+    def split(self) -> tuple:
+        """
+        Finish the complete lines fed so far and return (ProcessedLog,
+        preprocessor) where the new preprocessor carries the partial
+        trailing line and continues the line numbering.
+        """
+        self.commit_held()
+        rest = LogPreprocessor(self.line_offset + self.position, self.since, self.until)
+        # Timestamps, the time index and format aggregates continue across windows
+        rest.clock, rest.time_index, rest.parser = self.clock, self.time_index, self.parser
+        rest._decoder, self._decoder = self._decoder, rest._decoder
+        rest._carry, self._carry = self._carry, ""
+        rest._skip_lf, self._skip_lf = self._skip_lf, False
+        return self.finish(), rest
+
+    def finish(self) -> ProcessedLog:
+        self.feed(self._decoder.decode(b"", final=True))
+        if self._carry:
+            self._feed_lines([self._carry])
+            self._carry = ""
+        if self._last is not None:
+            self._commit([self._last.rstrip()])
+            self._last = None
+        self._pending = []
+        if self.parser is None:
+            self._detect_format()
+        self.events.close()
+        return self._build()
+
+    def _build(self) -> ProcessedLog:
+        lines = self.lines.view()
+        stats = {
+            "total_lines": self.line_count,
+            "critical": lines.count("critical"),
+            "errors": lines.count("error"),
+            "warnings": lines.count("warning"),
+            "info": self.info_count,
+        }
+        if self.line_count < self.position:
+            stats["outside_window"] = self.position - self.line_count
+        if self.parser is not None and self.parser.name != "generic":
+            stats["format"] = self.parser.stats()
+        timeline = self.time_index.histogram(self.clock.fmt) if self.clock.fmt else None
+        if timeline:
+            stats["timeline"] = timeline
+        time_range = None
+        if self.first_time is not None:
+            time_range = (format_time(self.first_time, self.clock.fmt), format_time(self.last_time, self.clock.fmt))
+        return ProcessedLog(
+            original_line_count=self.line_count,
+            categories={**{name: lines.count(name) for name in SEVERITIES}, "info": self.info_count},
+            summary_stats=stats,
+            lines=lines,
+            info_summary=self.miner.render(),
+            events={
+                name: (self.events.signatures(code), self.events.render(code, self.clock.fmt))
+                for code, name in enumerate(SEVERITIES)
+            },
+            signatures={name: self.events.top(code, fmt=self.clock.fmt) for code, name in enumerate(SEVERITIES)},
+            time_range=time_range,
+        )
+
+
+def preprocess_log(raw_text: str, since: float = None, until: float = None) -> ProcessedLog:
     """
     Preprocess a raw log file for LLM analysis.
     Works with any log format: kernel, app, deployment, syslog, etc.
+    ``since``/``until`` keep only lines in that time window (see timestamps.py).
     """
-    lines = raw_text.strip().splitlines()
-    original_count = len(lines)
+    preprocessor = LogPreprocessor(since=since, until=until)
+    preprocessor.feed(raw_text)
+    return preprocessor.finish()
 
-    # Categorize every line
-    categorized: dict[str, list[str]] = {
-        "critical": [], "error": [], "warning": [], "info": [],
-    }
-    for line in lines:
-        cat = _categorize_line(line)
-        categorized[cat].append(line)
-
-    # Build stats
-    stats = {
-        "total_lines": original_count,
-        "critical": len(categorized["critical"]),
-        "errors": len(categorized["error"]),
-        "warnings": len(categorized["warning"]),
-        "info": len(categorized["info"]),
+
+# ─── Parallel preprocessing ─────────────────────────────────────────────────
+
+SHARD_BYTES = 8 * 1024 * 1024  # input bytes per worker task
+
+_pool = None
+_pool_workers = 0
+# Uploads are preprocessed on worker threads (asyncio.to_thread)
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: never fork a process that has event-loop and server threads
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool, _pool_workers = None, 0
+
+
+def _preprocess_shard(
+    data: bytes, log_format: str = "generic", probe: tuple = None, first: bool = False,
+) -> tuple[list[str], list[str], list, list, tuple, bool, float]:
+    """
+    Worker: decode, split, classify and mask one newline-aligned shard
+    with the parser for ``log_format``, starting from the marker-probe
+    state ``probe`` (LogFormat.probe_state). Also returns the probe state
+    at the end and whether any line depended on it. Clustering and facet
+    counting stay in the parent, in input order.
+    """
+    start = time.process_time()
+    text = data.decode("utf-8", errors="ignore")
+    if first:
+        text = text.lstrip()  # as LogPreprocessor does with leading blank lines
+    lines = text.splitlines()
+    parser = make_parser(log_format, _classifier.classify_lines)
+    if probe is not None:
+        parser.set_probe_state(probe)
+    categories, facets = [], []
+    for block_start in range(0, len(lines), CLASSIFY_BLOCK_LINES):
+        block = lines[block_start:block_start + CLASSIFY_BLOCK_LINES]
+        block_categories, block_facets = parser.parse(block)
+        categories.extend(block_categories)
+        facets.extend(block_facets if block_facets is not None else [None] * len(block))
+    masks = [
+        _mask_line(line) if cat == "info" else None
+        for line, cat in zip(lines, categories)
+    ]
+    return lines, categories, masks, facets, parser.probe_state(), parser.probes > 0, time.process_time() - start
+
+
+# Bytes of the first shard decoded for format detection
+FORMAT_SAMPLE_BYTES = 256 * 1024
+
+
+def _shards(blocks, shard_bytes: int):
+    """Regroup arbitrary byte blocks into shards that end on a newline."""
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        if len(buffer) >= shard_bytes:
+            cut = buffer.rfind(b"\n") + 1
+            if cut:
+                yield bytes(buffer[:cut])
+                del buffer[:cut]
+    if buffer:
+        yield bytes(buffer)
+
+
+def preprocess_parallel(
+    blocks, workers: int, shard_bytes: int = SHARD_BYTES, since: float = None, until: float = None,
+) -> ProcessedLog:
+    """
+    Preprocess an iterable of byte blocks on a process pool. Shards are
+    classified and masked in parallel (at most 2 x workers in flight) and
+    merged in order. The parent carries the parsers' level-marker probe
+    from shard to shard: a shard classified from a state that turned out
+    stale is classified again, and for formats that probe, the first shard
+    runs alone so the rest start from its state. The result matches
+    preprocess_log on the decoded text, except that with since/until,
+    lines outside the window still count toward the marker probe.
+    ``perf`` reports shard count,
+    wall time and parallelism (worker + merge CPU seconds per wall second;
+    not a measured speedup).
+    """
+    started = time.perf_counter()
+    pool = _get_pool(workers)
+    preprocessor = LogPreprocessor(since=since, until=until)
+    pending = deque()
+    busy = 0.0
+    shard_count = 0
+
+    def merge():
+        nonlocal busy
+        shard, probe, first, future = pending.popleft()
+        parser = preprocessor.parser
+        result = future.result()
+        merge_start = time.process_time()
+        if result[5] and probe != parser.probe_state():
+            # Classified from a stale marker-probe state: redo it here
+            result = _preprocess_shard(shard, parser.name, parser.probe_state(), first)
+        lines, categories, masks, facets, end_probe, probed, elapsed = result
+        if probed:
+            parser.set_probe_state(end_probe)
+        preprocessor.feed_classified(lines, categories, masks, facets)
+        busy += elapsed + time.process_time() - merge_start
+
+    try:
+        for shard in _shards(blocks, shard_bytes):
+            parser = preprocessor.parser
+            if parser is None:
+                # Workers need the format up front: detect it on the first shard
+                sample = shard[:FORMAT_SAMPLE_BYTES].decode("utf-8", errors="ignore").lstrip().splitlines()
+                if sum(1 for line in sample if line.strip()) < FORMAT_SAMPLE_LINES:
+                    # Long lines: sample the whole shard, like the serial path
+                    sample = shard.decode("utf-8", errors="ignore").lstrip().splitlines()
+                name = detect_format(sample)
+                parser = preprocessor.parser = make_parser(name, _classifier.classify_lines)
+            elif shard_count == 1 and not parser.probe_settled():
+                merge()  # the first shard decides where the probe stands
+            probe, first = parser.probe_state(), shard_count == 0
+            pending.append((shard, probe, first, pool.submit(_preprocess_shard, shard, parser.name, probe, first)))
+            shard_count += 1
+            if len(pending) >= workers * 2:
+                merge()
+        while pending:
+            merge()
+    finally:
+        for *_, future in pending:
+            future.cancel()
+
+    processed = preprocessor.finish()
+    wall = time.perf_counter() - started
+    processed.perf = {
+        "mode": "parallel",
+        "workers": workers,
+        "shards": shard_count,
+        "seconds": round(wall, 3),
+        "parallelism": round(busy / wall, 2) if wall else 1.0,
     }
+    return processed
 
-    # Assemble output: errors/warnings first (full), then compressed info
-    output_parts = []
-    output_parts.append(f"=== LOG SUMMARY: {original_count} lines ===")
-    output_parts.append(
-        f"Critical: {stats['critical']} | Errors: {stats['errors']} "
-        f"| Warnings: {stats['warnings']} | Info: {stats['info']}"
-    )
-    output_parts.append("")
-
-    # Critical & errors — always include fully
-    for cat in ("critical", "error", "warning"):
-        if categorized[cat]:
-            output_parts.append(f"--- {cat.upper()} LINES ({len(categorized[cat])}) ---")
-            output_parts.extend(categorized[cat])
-            output_parts.append("")
-
-    # Info — compress repetitive patterns
-    compressed_info = _compress_repetitive(categorized["info"])
-    output_parts.append(f"--- INFO LINES (compressed from {len(categorized['info'])} to {len(compressed_info)}) ---")
-    output_parts.extend(compressed_info)
-
-    processed_text = "\n".join(output_parts)
-
-    return ProcessedLog(
-        original_line_count=original_count,
-        processed_text=processed_text,
-        categories={k: len(v) for k, v in categorized.items()},
-        summary_stats=stats,
-    )
+
+# ─── Chunking ───────────────────────────────────────────────────────────────
+
+CHUNK_TOKEN_BUDGET = 15_000  # estimated tokens per chunk
+MAX_CHUNKS = 8               # cap to avoid excessive API calls
+CHARS_PER_TOKEN = 4          # rough estimate for log text
+
+# Section headers written by LogPreprocessor, in keep-priority order
+SECTION_HEADER = re.compile(r"^--- (CRITICAL|ERROR|WARNING|INFO) LINES \(.*\) ---$", re.MULTILINE)
+SECTION_PRIORITY = {"SUMMARY": 0, "CRITICAL": 1, "ERROR": 2, "WARNING": 3, "INFO": 4}
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
 
 
-def split_into_chunks(text: str, chunk_size: int = 60000, overlap: int = 500) -> list[str]:
+@dataclass
+class TextChunk:
     """
-    Split preprocessed log text into LLM-friendly chunks.
-    Uses LangChain text splitter. Auto-adjusts to cap at MAX_CHUNKS.
+    One LLM-sized piece of the processed text, stored as offsets into it.
+    ``spans`` are (start, end, omitted_lines) ranges; omitted_lines counts
+    lines dropped right after the span to fit the budget.
     """
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    spans: list[tuple[int, int, int]] = field(default_factory=list)
+    section: str = ""  # header of the section the chunk starts in, if mid-section
 
-    MAX_CHUNKS = 8  # Cap to avoid excessive API calls
+    @property
+    def size(self) -> int:
+        return sum(end - start for start, end, _ in self.spans)
 
-    # Auto-increase chunk_size if text would produce too many chunks
-    text_len = len(text)
-    if text_len / chunk_size > MAX_CHUNKS:
-        chunk_size = (text_len // MAX_CHUNKS) + 1000
+    def text(self, source: str) -> str:
+        parts = []
+        if self.section:
+            parts.append(f"{self.section.rstrip(' -')} (continued) ---\n")
+        for start, end, omitted in self.spans:
+            parts.append(source[start:end])
+            if omitted:
+                parts.append(f"\n  [... {omitted} lines omitted to fit the token budget ...]\n")
+        return "".join(parts)
+
+
+def _sections(text: str) -> list[tuple[str, str, int, int]]:
+    """(name, header line, start, end) for the preamble and each section."""
+    headers = list(SECTION_HEADER.finditer(text))
+    sections = []
+    preamble_end = headers[0].start() if headers else len(text)
+    if preamble_end:
+        sections.append(("SUMMARY", "", 0, preamble_end))
+    for n, match in enumerate(headers):
+        end = headers[n + 1].start() if n + 1 < len(headers) else len(text)
+        sections.append((match.group(1), match.group(0), match.start(), end))
+    return sections
+
+
+def _count_lines(text: str, start: int, end: int) -> int:
+    """Lines in text[start:end], ignoring trailing blank lines."""
+    while end > start and text[end - 1] == "\n":
+        end -= 1
+    return text.count("\n", start, end) + 1 if end > start else 0
+
+
+def _allocate(text: str, sections: list, budget_chars: int) -> list[tuple[str, str, int, int, int]]:
+    """
+    Keep section bodies by priority until budget_chars is spent: the first
+    section that does not fit is truncated at a line boundary and every
+    lower one is dropped, so no line is kept while a more severe one is
+    not. Header lines are always kept so the model still sees which
+    sections were cut.
+    """
+    bodies = {}
+    for name, header, start, end in sections:
+        if header:
+            newline = text.find("\n", start, end)
+            bodies[start] = newline + 1 if newline >= 0 else end
+        else:
+            bodies[start] = start
+    remaining = budget_chars - sum(bodies[s[2]] - s[2] for s in sections)
+
+    kept = {}
+    kept_any = truncated = False
+    for name, header, start, end in sorted(sections, key=lambda s: SECTION_PRIORITY[s[0]]):
+        body = bodies[start]
+        if not truncated and end - body <= remaining:
+            kept[start] = (name, header, start, end, 0)
+            remaining -= end - body
+            kept_any = kept_any or end > body
+            continue
+        keep_end = body
+        if not truncated:
+            cut = text.rfind("\n", body, body + max(remaining, 0))
+            if cut >= body:
+                keep_end = cut + 1
+            elif not kept_any:
+                # Nothing fits whole: keep the start of the first line
+                keep_end = body + max(remaining, 0)
+            truncated = True
+        kept[start] = (name, header, start, keep_end, _count_lines(text, keep_end, end))
+        remaining -= keep_end - body
+    return [kept[s[2]] for s in sections]
+
+
+def _pack(text: str, kept: list, chunk_chars: int, max_chunks: int) -> tuple[list[TextChunk], int]:
+    """
+    Lay the kept spans out in at most ``max_chunks`` chunks. Returns
+    (chunks, dropped): lines that did not fit are dropped from the end and
+    noted after the last span.
+    """
+    chunks = [TextChunk()]
+    total_left = sum(end - start for _, _, start, end, _ in kept)
+
+    def overflow(n: int, pos: int, end: int, omitted: int):
+        dropped = _count_lines(text, pos, end) + omitted + sum(
+            _count_lines(text, start, end) + omitted for _, _, start, end, omitted in kept[n + 1:]
+        )
+        last = chunks[-1]
+        span_start, span_end, span_omitted = last.spans[-1]
+        last.spans[-1] = (span_start, span_end, span_omitted + dropped)
+        return chunks, dropped
+
+    for n, (name, header, start, end, omitted) in enumerate(kept):
+        if start == end:
+            continue
+        current = chunks[-1]
+        size = end - start
+        # Start a section in a fresh chunk if it would fit there and the
+        # remaining text still fits in the chunks we have left
+        if current.spans and current.size + size > chunk_chars and size <= chunk_chars:
+            needed = len(chunks) + -(-total_left // chunk_chars)
+            if needed <= max_chunks:
+                current = TextChunk()
+                chunks.append(current)
+
+        pos = start
+        while pos < end:
+            room = chunk_chars - current.size
+            if room <= 0:
+                if len(chunks) >= max_chunks:
+                    return overflow(n, pos, end, omitted)
+                current = TextChunk(section=header)
+                chunks.append(current)
+                room = chunk_chars
+            if end - pos <= room:
+                cut = end
+            else:
+                newline = text.rfind("\n", pos, pos + room)
+                if newline >= pos:
+                    cut = newline + 1
+                elif current.spans:
+                    # Next line doesn't fit; continue in a new chunk
+                    if len(chunks) >= max_chunks:
+                        return overflow(n, pos, end, omitted)
+                    current = TextChunk(section=header)
+                    chunks.append(current)
+                    continue
+                else:
+                    # A single line longer than a whole chunk
+                    cut = pos + room
+            current.spans.append((pos, cut, omitted if cut == end else 0))
+            total_left -= cut - pos
+            pos = cut
+
+    return [chunk for chunk in chunks if chunk.spans], 0
+
+
+def plan_chunks(
+    text: str,
+    token_budget: int = CHUNK_TOKEN_BUDGET,
+    max_chunks: int = MAX_CHUNKS,
+) -> list[TextChunk]:
+    """
+    Split preprocessed log text into at most ``max_chunks`` line-aligned
+    chunks of about ``token_budget`` estimated tokens, preferring to start
+    a section (--- ERROR LINES ---, ...) in a new chunk. If the text does
+    not fit, lines are kept by priority: summary, critical, error,
+    warning, then info; the dropped tail of a section is noted in the
+    chunk text. The cap is enforced by dropping noted lines, never whole
+    chunks.
+    """
+    chunk_chars = token_budget * CHARS_PER_TOKEN
+    sections = _sections(text)
+    budget_chars = chunk_chars * max_chunks
+
+    while True:
+        chunks, dropped = _pack(text, _allocate(text, sections, budget_chars), chunk_chars, max_chunks)
+        # Line-aligned packing can waste part of each chunk; shrink the
+        # budget until the kept lines fit (at the floor, _pack notes the rest)
+        if not dropped or budget_chars <= chunk_chars:
+            return chunks
+        budget_chars -= chunk_chars // 4
+
+
+def split_into_chunks(
+    text: str,
+    token_budget: int = CHUNK_TOKEN_BUDGET,
+    max_chunks: int = MAX_CHUNKS,
+) -> list[str]:
+    """Split preprocessed log text into LLM-friendly chunk strings."""
+    return [chunk.text(text) for chunk in plan_chunks(text, token_budget, max_chunks)]
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=overlap,
-        separators=["\n---", "\n\n", "\n", " "],
-    )
-    return splitter.split_text(text)
 
 # Prompt for analyzing each chunk
 CHUNK_PROMPT = """You are a senior SRE. Analyze this log section (chunk {chunk_index} of {total_chunks}).
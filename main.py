@@ -1,18 +1,40 @@
 from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, StreamingResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
-from jose import jwt, jwk
-import requests
 import os
 import json
 import asyncio
+import base64
+import re
+from datetime import datetime
+import time
+from contextlib import asynccontextmanager
 from supabase import create_client, Client
 
 from langchain_google_genai import ChatGoogleGenerativeAI
-from log_processor import preprocess_log, split_into_chunks, CHUNK_PROMPT, SYNTHESIS_PROMPT
-from usage_guard import usage_guard
+from log_processor import (
+    LogPreprocessor, ProcessedLog, plan_chunks, preprocess_parallel, shutdown_pool,
+    estimate_tokens, CHUNK_PROMPT, SYNTHESIS_PROMPT,
+)
+from usage_guard import usage_guard, usage_refund, usage_counters
+from local_report import MODES, escalation_reasons, local_report
+from jwks_cache import JWKSVerifier
+from llm_cache import LLMResultCache, cache_key
+import metrics
+from metrics import StageTimer
+from jobs import JobQueue, QueueFullError
+from llm_scheduler import (
+    LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_REQUESTS_PER_MINUTE, LLM_START_CONCURRENCY,
+    LLM_TOKENS_PER_MINUTE, LLMScheduler, is_rate_limit,
+)
+from static_assets import StaticAssets
+from history_cache import HistoryCache, CachedJSON
+from history_writer import HistoryWriter
+from timestamps import DETECT_SAMPLE_LINES, TimestampExtractor, parse_bound
+from uploads import ALLOWED_NAMES, MAX_DECOMPRESSION_RATIO, DecompressionLimitError, UploadError, UploadReader, is_supported
+from sessions import AnalysisSession, SessionStore, SessionLimitError, SESSION_SYNTHESIS_CHUNKS
 
 load_dotenv()
 
@@ -35,38 +57,20 @@ else:
     supabase_admin: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 
-def get_current_user(credentials=Depends(security)):
-    token = credentials.credentials
-
-    try:
-        header = jwt.get_unverified_header(token)
-        kid = header.get("kid")
-
-        jwks = requests.get(SUPABASE_JWKS_URL).json()
-
-        key = next(
-            (k for k in jwks["keys"] if k["kid"] == kid),
-            None
-        )
-
-        if key is None:
-            raise HTTPException(status_code=401, detail="Invalid token key")
+jwks_verifier = JWKSVerifier(SUPABASE_JWKS_URL, SUPABASE_ISSUER)
 
-        public_key = jwk.construct(key)
-        pem_key = public_key.to_pem().decode("utf-8")
-
-        payload = jwt.decode(
-            token,
-            pem_key,
-            algorithms=["ES256"],
-            issuer=SUPABASE_ISSUER,
-            options={"verify_aud": False},
-        )
 
-        return payload
+async def get_current_user(credentials=Depends(security)):
+    token = credentials.credentials
 
+    started = time.perf_counter()
+    try:
+        user = await jwks_verifier.verify(token)
     except Exception:
+        metrics.AUTH_SECONDS.labels("invalid").observe(time.perf_counter() - started)
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    metrics.AUTH_SECONDS.labels("ok").observe(time.perf_counter() - started)
+    return user
 
 
 
@@ -106,125 +110,655 @@ def _extract_text(result) -> str:
     return str(content)
 
 
+# Chunk and synthesis results, keyed by model + prompt template + input.
+# Set LLM_CACHE_PATH to a file to keep results across restarts.
+llm_cache = LLMResultCache(path=os.getenv("LLM_CACHE_PATH") or None)
+
+
+def _model_name() -> str:
+    return getattr(llm, "model", "")
+
+
+# /history pages and details, dropped when the user's next analysis is saved
+history_cache = HistoryCache()
+
+
+def _history_saved(rows: list):
+    for user_id in {row["user_id"] for row in rows}:
+        history_cache.invalidate(user_id)
+
+
+# Analyses are saved in the background; rows that can't be inserted are
+# kept in HISTORY_SPILL_PATH and retried
+history_writer = HistoryWriter(
+    "analyses",
+    spill_path=os.getenv("HISTORY_SPILL_PATH", "history_spill.jsonl"),
+    on_saved=_history_saved,
+)
+
+
+def _cache_counts():
+    caches = (
+        ("llm", llm_cache), ("jwks_token", jwks_verifier),
+        ("usage", usage_counters), ("history", history_cache),
+    )
+    for name, cache in caches:
+        yield (name, "hit"), cache.hits
+        yield (name, "miss"), cache.misses
+
+
+metrics.FunctionCounter(
+    "loganalyzer_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"), _cache_counts,
+)
+
+
+# Every model call in the process goes through one scheduler: an adaptive
+# concurrency limit, per-minute request/token budgets, per-owner fair
+# queuing, and retries with backoff on 429s
+llm_scheduler = LLMScheduler(
+    start_concurrency=int(os.getenv("LLM_START_CONCURRENCY", str(LLM_START_CONCURRENCY))),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", str(LLM_MAX_CONCURRENCY))),
+    requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", str(LLM_REQUESTS_PER_MINUTE))),
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", str(LLM_TOKENS_PER_MINUTE))),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", str(LLM_MAX_RETRIES))),
+)
+metrics.FunctionGauge(
+    "loganalyzer_llm_scheduler", "LLM scheduler state: concurrency limit, calls in flight, calls waiting", ("state",),
+    lambda: [
+        (("limit",), llm_scheduler.limit),
+        (("in_flight",), llm_scheduler.in_flight),
+        (("waiting",), llm_scheduler.waiting()),
+    ],
+)
+metrics.FunctionCounter(
+    "loganalyzer_llm_retries_total", "LLM calls retried, and 429 responses from the model", ("reason",),
+    lambda: [(("retry",), llm_scheduler.retries), (("rate_limited",), llm_scheduler.rate_limited)],
+)
+
+
+def _input_tokens(result) -> int:
+    usage = getattr(result, "usage_metadata", None) or {}
+    return usage.get("input_tokens") or 0
+
+
+async def _invoke_llm(kind: str, prompt: str, owner: str = "", on_queued=None) -> tuple[str, float]:
+    """
+    Call the model through the scheduler, recording latency and prompt
+    size; returns (text, seconds). ``owner`` is the fair-queuing key and
+    ``on_queued`` gets the scheduler's notices while the call waits.
+    """
+    metrics.LLM_PROMPT_CHARS.labels(kind).inc(len(prompt))
+    started = time.perf_counter()
+
+    async def invoke():
+        nonlocal started
+        started = time.perf_counter()  # latency excludes time spent queued
+        with metrics.LLM_CALLS_IN_FLIGHT.track(kind):
+            return await llm.ainvoke(prompt)
+
+    try:
+        result = await llm_scheduler.call(invoke, estimate_tokens(prompt), owner, on_queued, _input_tokens)
+    except Exception:
+        metrics.LLM_CALLS.labels(kind, "error").inc()
+        raise
+    seconds = time.perf_counter() - started
+    metrics.LLM_SECONDS.labels(kind).observe(seconds)
+    metrics.LLM_CALLS.labels(kind, "ok").inc()
+
+    metrics.LLM_PROMPT_TOKENS.labels(kind).inc(_input_tokens(result) or estimate_tokens(prompt))
+    return _extract_text(result), seconds
+
+
 async def aLog(log_data: str):
     fpt = prompt_template.format(log_data=log_data)
-    result = await llm.ainvoke(fpt)
-    return _extract_text(result)
+    text, _ = await _invoke_llm("analyze", fpt)
+    return text
 
 
-def _sse_event(data: dict) -> str:
-    return f"data: {json.dumps(data)}\n\n"
+def _event(data: dict, timer: StageTimer) -> dict:
+    data["timings"] = timer.snapshot()
+    return data
 
 
-async def _stream_analysis(log_text: str, user_id: str = "", file_name: str = ""):
-    yield _sse_event({"stage": "preprocessing", "message": "Preprocessing log file..."})
+def _sse_event(payload: str, event_id: int) -> str:
+    return f"id: {event_id}\ndata: {payload}\n\n"
 
-    processed = preprocess_log(log_text)
 
-    yield _sse_event({
-        "stage": "preprocessed",
-        "stats": processed.summary_stats,
-        "message": f"Preprocessed {processed.original_line_count} lines",
-    })
+def _queued_event(notice: dict, what: str, timer: StageTimer) -> dict:
+    """SSE event for a model call waiting in the scheduler (no job_id)."""
+    retry_in = notice.get("retry_in")
+    if notice["reason"] == "rate_limited":
+        message = f"{what}: model rate limit reached, retrying in {retry_in}s..."
+    elif notice["reason"] == "retry":
+        message = f"{what}: model unavailable, retrying in {retry_in}s..."
+    else:
+        message = f"{what}: waiting for the model (position {notice['position']})..."
+    return _event({"stage": "queued", **notice, "message": message}, timer)
 
-    chunks = split_into_chunks(processed.processed_text)
-    total_chunks = len(chunks)
 
-    yield _sse_event({
-        "stage": "chunking",
-        "total_chunks": total_chunks,
-        "message": f"Split into {total_chunks} chunks for analysis",
-    })
+def _llm_error_event(error: Exception, timer: StageTimer) -> dict:
+    if is_rate_limit(error):
+        # Only reached once the scheduler's retries are used up
+        return _event({"stage": "error", "message": "Rate limit hit. Please wait a minute and try again."}, timer)
+    return _event({"stage": "error", "message": f"AI analysis failed: {str(error)[:200]}"}, timer)
 
-    chunk_results = []
 
-    for i, chunk in enumerate(chunks, 1):
-        yield _sse_event({
-            "stage": "analyzing",
-            "chunk_index": i,
-            "total_chunks": total_chunks,
-            "message": f"Analyzing chunk {i}/{total_chunks}...",
-        })
+# Max chunk prompts in flight per analysis
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+
+# Upload read size: the upload is preprocessed block by block, so it is
+# never held in memory as a whole
+UPLOAD_BLOCK_SIZE = 1024 * 1024
 
-        prompt = CHUNK_PROMPT.format(
-            chunk_index=i,
-            total_chunks=total_chunks,
-            chunk_text=chunk,
+# Analyses run as background jobs; clients reattach to /jobs/{id}/events
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_queued=int(os.getenv("JOB_QUEUE_SIZE", "32")),
+    ttl=int(os.getenv("JOB_TTL", "600")),
+)
+metrics.FunctionGauge(
+    "loganalyzer_jobs_queued", "Analyses waiting for a job worker", (),
+    lambda: [((), job_queue.queued())],
+)
+metrics.FunctionGauge(
+    "loganalyzer_history_pending", "Analysis history rows waiting to be saved", ("state",),
+    lambda: [(("queued",), history_writer.pending()), (("spilled",), history_writer.spilled)],
+)
+metrics.FunctionGauge(
+    "loganalyzer_jobs_retained", "Jobs kept for replay (queued, running or within TTL)", (),
+    lambda: [((), len(job_queue.jobs))],
+)
+
+# Seconds between keep-alive comments on an idle event stream
+SSE_HEARTBEAT = 15
+
+# Default /analyze-stream mode: "auto" answers quiet logs with a rule-based
+# report and escalates the rest to the LLM; "llm" and "local" force one tier
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "auto")
+
+# Uploads at least this large are preprocessed on a process pool
+PARALLEL_THRESHOLD_BYTES = int(os.getenv("PARALLEL_THRESHOLD_BYTES", str(64 * 1024 * 1024)))
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(os.cpu_count() or 1)))
+# Compressed uploads: assumed ratio for the parallel threshold, and the cap
+# on decompressed bytes per upload byte
+COMPRESSED_SIZE_ESTIMATE = 10
+DECOMPRESSION_RATIO_LIMIT = int(os.getenv("MAX_DECOMPRESSION_RATIO", str(MAX_DECOMPRESSION_RATIO)))
+
+
+def _upload_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    position = file.file.tell()
+    size = file.file.seek(0, os.SEEK_END)
+    file.file.seek(position)
+    return size
+
+
+# Upload bytes read to check for timestamps before a windowed analysis
+TIMESTAMP_SNIFF_BYTES = 256 * 1024
+
+
+def _sniff_timestamps(file: UploadFile):
+    """
+    Timestamp format of the upload's first lines, or None if none is
+    recognised. Reads (and decompresses) only the head and rewinds.
+    """
+    upload = UploadReader(file.file, file.filename, _upload_size(file), 64 * 1024, DECOMPRESSION_RATIO_LIMIT)
+    head = bytearray()
+    try:
+        for block in upload:
+            head += block
+            if len(head) >= TIMESTAMP_SNIFF_BYTES:
+                break
+    finally:
+        file.file.seek(0)
+    lines = head.decode("utf-8", errors="ignore").splitlines()
+    if len(head) >= TIMESTAMP_SNIFF_BYTES:
+        lines = lines[:-1]  # possibly cut short
+    return TimestampExtractor().detect(lines[:DETECT_SAMPLE_LINES])
+
+
+def _preprocess_blocks(blocks, since: float = None, until: float = None) -> ProcessedLog:
+    preprocessor = LogPreprocessor(since=since, until=until)
+    for block in blocks:
+        preprocessor.feed_bytes(block)
+    return preprocessor.finish()
+
+
+async def _preprocess_upload(file: UploadFile, since: float = None, until: float = None) -> ProcessedLog:
+    """
+    Preprocess an upload block by block, off the event loop since that is
+    CPU-bound. Compressed uploads are decompressed as they are read;
+    UploadError is raised if one is corrupt or over the ratio cap.
+    """
+    started = time.perf_counter()
+    size = _upload_size(file)
+    upload = UploadReader(file.file, file.filename, size, UPLOAD_BLOCK_SIZE, DECOMPRESSION_RATIO_LIMIT)
+    estimated = size * COMPRESSED_SIZE_ESTIMATE if upload.compressed else size
+
+    if PREPROCESS_WORKERS > 1 and estimated >= PARALLEL_THRESHOLD_BYTES:
+        processed = await asyncio.to_thread(
+            preprocess_parallel, upload, PREPROCESS_WORKERS, since=since, until=until,
         )
+    else:
+        processed = await asyncio.to_thread(_preprocess_blocks, upload, since, until)
+        processed.perf = {"mode": "serial", "seconds": round(time.perf_counter() - started, 3)}
 
-        try:
-            result = await llm.ainvoke(prompt)
-            analysis = _extract_text(result)
-        except Exception as e:
-            error_msg = str(e)
-            if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                yield _sse_event({"stage": "error", "message": "Rate limit hit. Please wait a minute and try again."})
-            else:
-                yield _sse_event({"stage": "error", "message": f"AI analysis failed: {error_msg[:200]}"})
-            return
+    if upload.compressed:
+        processed.perf.update(upload.describe())
+    return processed
 
-        chunk_results.append(analysis)
 
-        yield _sse_event({
-            "stage": "chunk_done",
-            "chunk_index": i,
-            "total_chunks": total_chunks,
-            "result": analysis,
-        })
+async def _stream_analysis(
+    processed: ProcessedLog,
+    subscribers: list,
+    timer: StageTimer = None,
+    owner: str = "",
+    flight_key: str = None,
+):
+    timer = timer or StageTimer()
+    metrics.ANALYSES_IN_FLIGHT.inc()
+    try:
+        async for event in _analysis_events(processed, subscribers, timer, owner, flight_key):
+            yield event
+    finally:
+        metrics.ANALYSES_IN_FLIGHT.dec()
+
 
-    yield _sse_event({"stage": "synthesizing", "message": "Synthesizing final report..."})
+async def _chunk_events(
+    chunks: list[tuple[int, str]], total_chunks: int, results: dict, timer: StageTimer, owner: str = "",
+):
+    """
+    Analyze (chunk_index, text) pairs concurrently, yielding analyzing,
+    queued and chunk_done events and storing each analysis in
+    ``results[chunk_index]``. Ends after an error event if a call fails.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+
+    async def analyze_chunk(i: int, chunk: str):
+        key = cache_key(_model_name(), CHUNK_PROMPT, chunk)
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            await events.put(("done", i, (cached, None), True))
+            return
 
+        async with semaphore:
+            await events.put(("analyzing", i, None, False))
+            prompt = CHUNK_PROMPT.format(
+                chunk_index=i,
+                total_chunks=total_chunks,
+                chunk_text=chunk,
+            )
+            try:
+                analysis, seconds = await _invoke_llm(
+                    "chunk", prompt, owner, lambda notice: events.put_nowait(("queued", i, notice, False)),
+                )
+            except Exception as e:
+                await events.put(("error", i, e, False))
+                return
+            await llm_cache.put(key, analysis)
+            await events.put(("done", i, (analysis, seconds), False))
+
+    chunks_started = time.perf_counter()
+    tasks = [asyncio.create_task(analyze_chunk(i, chunk)) for i, chunk in chunks]
+
+    try:
+        remaining = len(chunks)
+        while remaining:
+            kind, i, value, cached = await events.get()
+
+            if kind == "analyzing":
+                yield _event({
+                    "stage": "analyzing",
+                    "chunk_index": i,
+                    "total_chunks": total_chunks,
+                    "message": f"Analyzing chunk {i}/{total_chunks}...",
+                }, timer)
+                continue
+
+            if kind == "queued":
+                yield _queued_event({"chunk_index": i, **value}, f"Chunk {i}/{total_chunks}", timer)
+                continue
+
+            if kind == "error":
+                yield _llm_error_event(value, timer)
+                return
+
+            remaining -= 1
+            analysis, seconds = value
+            results[i] = analysis
+            if not remaining:
+                timer.record("llm_chunks", time.perf_counter() - chunks_started)
+
+            yield _event({
+                "stage": "chunk_done",
+                "chunk_index": i,
+                "total_chunks": total_chunks,
+                "result": analysis,
+                "cached": cached,
+                "llm_seconds": round(seconds, 4) if seconds is not None else None,
+            }, timer)
+    finally:
+        # Stop in-flight calls on failure or job cancellation
+        for task in tasks:
+            task.cancel()
+
+
+def _stats_for_prompt(stats: dict) -> str:
+    """Counts as JSON, with the timeline as one compact line of errors/lines per bucket."""
+    timeline = stats.get("timeline")
+    text = json.dumps({k: v for k, v in stats.items() if k != "timeline"}, indent=2)
+    if timeline:
+        bars = ", ".join(
+            f"{bar['start']} {bar['errors']}/{bar['lines']}" for bar in timeline["buckets"] if bar["lines"]
+        )
+        text += f"\nErrors/lines per {timeline['bucket_seconds']}s: {bars}"
+    return text
+
+
+async def _synthesize(
+    chunk_results: list[str], stats: dict, total_lines: int, total_chunks: int, omitted: int = 0,
+    owner: str = "", on_queued=None,
+) -> tuple[str, bool]:
+    """
+    Final report from the chunk analyses (the last ``len(chunk_results)``
+    of ``total_chunks``); returns (report, cached) and raises if the call fails.
+    """
+    first = total_chunks - len(chunk_results) + 1
     combined = "\n\n---\n\n".join(
-        [f"### Chunk {i+1} Analysis\n{r}" for i, r in enumerate(chunk_results)]
+        [f"### Chunk {i} Analysis\n{r}" for i, r in enumerate(chunk_results, first)]
     )
+    if omitted:
+        combined = f"(Analyses of the first {omitted} chunks omitted.)\n\n{combined}"
 
-    stats_str = json.dumps(processed.summary_stats, indent=2)
+    stats_str = _stats_for_prompt(stats)
 
     synth_prompt = SYNTHESIS_PROMPT.format(
-        total_lines=processed.original_line_count,
+        total_lines=total_lines,
         total_chunks=total_chunks,
         chunk_analyses=combined,
         stats=stats_str,
     )
 
+    key_parts = [json.dumps(chunk_results), stats_str, str(total_lines)]
+    if omitted:
+        key_parts.append(str(omitted))
+    synth_key = cache_key(_model_name(), SYNTHESIS_PROMPT, *key_parts)
+
+    final_report = await llm_cache.get(synth_key)
+    if final_report is not None:
+        return final_report, True
+    final_report, _ = await _invoke_llm("synthesis", synth_prompt, owner, on_queued)
+    await llm_cache.put(synth_key, final_report)
+    return final_report, False
+
+
+async def _synthesis_events(out: dict, timer: StageTimer, *args, **kwargs):
+    """
+    Run _synthesize(*args, **kwargs), yielding queued events while the call
+    waits for the scheduler and an error event if it fails; on success
+    ``out`` gets "report" and "cached".
+    """
+    notices: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_synthesize(*args, on_queued=notices.put_nowait, **kwargs))
+    notice = None
     try:
-        synth_result = await llm.ainvoke(synth_prompt)
-        final_report = _extract_text(synth_result)
-    except Exception as e:
-        error_msg = str(e)
-        yield _sse_event({"stage": "error", "message": f"AI analysis failed: {error_msg[:200]}"})
+        with timer.stage("synthesis"):
+            while True:
+                notice = asyncio.ensure_future(notices.get())
+                await asyncio.wait((task, notice), return_when=asyncio.FIRST_COMPLETED)
+                if notice.done():
+                    yield _queued_event(notice.result(), "Synthesis", timer)
+                    continue
+                notice.cancel()
+                break
+            try:
+                out["report"], out["cached"] = task.result()
+            except Exception as e:
+                yield _llm_error_event(e, timer)
+    finally:
+        task.cancel()
+        if notice is not None:
+            notice.cancel()
+
+
+def _flight_key(processed: ProcessedLog) -> str:
+    """Identifies an analysis by its preprocessed content and stats."""
+    return cache_key(
+        _model_name(), "analysis", processed.processed_text, json.dumps(processed.summary_stats, sort_keys=True),
+    )
+
+
+async def _analysis_events(
+    processed: ProcessedLog, subscribers: list, timer: StageTimer, owner: str = "", flight_key: str = None,
+):
+    """
+    Events of one LLM analysis. ``subscribers`` holds (user_id, file_name)
+    for every request sharing it; each gets a history row.
+    """
+    yield _event({"stage": "preprocessing", "message": "Preprocessing log file..."}, timer)
+
+    yield _event({
+        "stage": "preprocessed",
+        "stats": {**processed.summary_stats, "preprocessing": processed.perf},
+        "message": f"Preprocessed {processed.original_line_count} lines",
+    }, timer)
+
+    with timer.stage("chunk"):
+        chunks = plan_chunks(processed.processed_text)
+    total_chunks = len(chunks)
+
+    yield _event({
+        "stage": "chunking",
+        "total_chunks": total_chunks,
+        "message": f"Split into {total_chunks} chunks for analysis",
+    }, timer)
+
+    results: dict[int, str] = {}
+    texts = [(i, plan.text(processed.processed_text)) for i, plan in enumerate(chunks, 1)]
+    async for event in _chunk_events(texts, total_chunks, results, timer, owner):
+        yield event
+    if len(results) < total_chunks:
         return
 
-    if supabase_admin and user_id:
-        try:
-            supabase_admin.table("analyses").insert({
-                "user_id": user_id,
-                "file_name": file_name,
-                "summary": final_report,
-                "total_lines": processed.original_line_count,
-                "critical": processed.summary_stats.get("critical", 0),
-                "errors": processed.summary_stats.get("errors", 0),
-                "warnings": processed.summary_stats.get("warnings", 0),
-            }).execute()
-        except Exception as db_err:
-            print(f"[DB] Failed to save analysis history: {db_err}")
-
-    yield _sse_event({
+    yield _event({"stage": "synthesizing", "message": "Synthesizing final report..."}, timer)
+
+    chunk_results = [results[i] for i in range(1, total_chunks + 1)]
+    synthesis: dict = {}
+    async for event in _synthesis_events(
+        synthesis, timer, chunk_results, processed.summary_stats, processed.original_line_count, total_chunks,
+        owner=owner,
+    ):
+        yield event
+    if not synthesis:
+        return
+    final_report, synth_cached = synthesis["report"], synthesis["cached"]
+
+    # No more subscribers can join once the rows are saved
+    job_queue.forget(flight_key)
+    for user_id, file_name in subscribers:
+        _save_history(processed, user_id, file_name, final_report)
+
+    metrics.STAGE_SECONDS.labels("total").observe(timer.elapsed())
+    yield _event({
         "stage": "complete",
         "result": final_report,
         "stats": processed.summary_stats,
+        "cached": synth_cached,
+        "tier": "llm",
+    }, timer)
+
+
+def _save_history(processed: ProcessedLog, user_id: str, file_name: str, report: str):
+    if supabase_admin and user_id:
+        history_writer.enqueue(supabase_admin, {
+            "user_id": user_id,
+            "file_name": file_name,
+            "summary": report,
+            "total_lines": processed.original_line_count,
+            "critical": processed.summary_stats.get("critical", 0),
+            "errors": processed.summary_stats.get("errors", 0),
+            "warnings": processed.summary_stats.get("warnings", 0),
+        })
+
+
+async def _local_stream(processed: ProcessedLog, user_id: str, file_name: str, timer: StageTimer):
+    """
+    SSE for a rule-based report. It takes milliseconds, so it is sent
+    directly instead of waiting behind LLM jobs in the queue.
+    """
+    events = [
+        {"stage": "preprocessing", "message": "Preprocessing log file..."},
+        {
+            "stage": "preprocessed",
+            "stats": {**processed.summary_stats, "preprocessing": processed.perf},
+            "message": f"Preprocessed {processed.original_line_count} lines",
+        },
+    ]
+    with timer.stage("local_report"):
+        report = local_report(processed)
+    _save_history(processed, user_id, file_name, report)
+    metrics.STAGE_SECONDS.labels("total").observe(timer.elapsed())
+    events.append({
+        "stage": "complete",
+        "result": report,
+        "stats": processed.summary_stats,
+        "cached": False,
+        "tier": "local",
     })
+    for event_id, data in enumerate(events, 1):
+        yield _sse_event(json.dumps(_event(data, timer)), event_id)
 
 
+async def _session_events(session: AnalysisSession, timer: StageTimer):
+    """
+    One update of an append-mode session: sealed chunks without a stored
+    result and the open window are analyzed, then the report is
+    re-synthesized from the most recent chunk analyses.
+    """
+    metrics.ANALYSES_IN_FLIGHT.inc()
+    try:
+        async with session.analysis_lock:
+            with timer.stage("chunk"):
+                view = await asyncio.to_thread(session.view)
+            total_chunks = len(view.chunks)
+            if not total_chunks:
+                yield _event({"stage": "error", "message": "Session has no log lines yet"}, timer)
+                return
+
+            yield _event({
+                "stage": "preprocessed",
+                "stats": view.stats,
+                "session": session.describe(),
+                "message": f"Session has {view.total_lines} lines",
+            }, timer)
+
+            todo = [
+                (i, chunk) for i, chunk in enumerate(view.chunks, 1)
+                if i > view.sealed or i - 1 not in session.results
+            ]
+            yield _event({
+                "stage": "chunking",
+                "total_chunks": total_chunks,
+                "new_chunks": len(todo),
+                "message": f"{len(todo)} of {total_chunks} chunks to analyze",
+            }, timer)
+
+            results: dict[int, str] = {}
+            async for event in _chunk_events(todo, total_chunks, results, timer, session.owner):
+                yield event
+            for i, analysis in results.items():
+                if i <= view.sealed:
+                    session.results[i - 1] = analysis
+            if len(results) < len(todo):
+                return
+
+            yield _event({"stage": "synthesizing", "message": "Synthesizing final report..."}, timer)
+
+            first = max(1, total_chunks - SESSION_SYNTHESIS_CHUNKS + 1)
+            chunk_results = [
+                session.results[i - 1] if i <= view.sealed else results[i]
+                for i in range(first, total_chunks + 1)
+            ]
+            synthesis: dict = {}
+            async for event in _synthesis_events(
+                synthesis, timer, chunk_results, view.stats, view.total_lines, total_chunks,
+                omitted=first - 1, owner=session.owner,
+            ):
+                yield event
+            if not synthesis:
+                return
+            final_report, synth_cached = synthesis["report"], synthesis["cached"]
+
+        metrics.STAGE_SECONDS.labels("total").observe(timer.elapsed())
+        yield _event({
+            "stage": "complete",
+            "result": final_report,
+            "stats": view.stats,
+            "cached": synth_cached,
+            "tier": "llm",
+        }, timer)
+    finally:
+        metrics.ANALYSES_IN_FLIGHT.dec()
+
+
+
+async def _job_stream(job, after: int = 0):
+    async for event_id, payload in job.stream(after, heartbeat=SSE_HEARTBEAT):
+        if event_id is None:
+            yield ": keep-alive\n\n"
+        else:
+            yield _sse_event(payload, event_id)
+
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server busy, please retry shortly",
+        headers={"Retry-After": "10"},
+    )
 
-app = FastAPI(title="Log Analyzer Agent")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if supabase_admin:
+        history_writer.start(supabase_admin)
+    yield
+    await job_queue.close()
+    # Save queued history rows (or spill them) before the process exits
+    await history_writer.close()
+    # Write out buffered usage counts before the process exits
+    await usage_counters.close()
+    shutdown_pool()
+
+
+app = FastAPI(title="Log Analyzer Agent", lifespan=lifespan)
+
+# Frontend files, loaded once; pages reference assets by versioned URL
+static_files = StaticAssets(
+    os.path.dirname(os.path.abspath(__file__)),
+    pages=["index.html", "history.html", "login.html", "settings.html"],
+    assets=["style.css", "index.js", "history.js", "login.js"],
+)
+
+
+class _ReceivedAt:
+    """Stamps each request's arrival time so upload parsing can be timed."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        await self.app(scope, receive, send)
 
 
 @app.get("/", response_class=HTMLResponse)
 @app.get("/index.html", response_class=HTMLResponse)
-async def root():
-    with open("index.html", "r") as f:
-        return f.read()
+async def root(request: Request):
+    return static_files.response("index.html", request)
 
 
 @app.post("/analyze")
@@ -232,10 +766,17 @@ async def analyze_log(
     file: UploadFile = File(...),
     user=Depends(get_current_user)
 ):
-    if not file.filename.endswith(".txt"):
-        return JSONResponse({"error": "Please upload a .txt file"}, status_code=400)
+    if not is_supported(file.filename):
+        return JSONResponse({"error": f"Please upload a {ALLOWED_NAMES} file"}, status_code=400)
 
-    content = await file.read()
+    # The whole log goes into one prompt here, so it is read in full
+    upload = UploadReader(file.file, file.filename, _upload_size(file), UPLOAD_BLOCK_SIZE, DECOMPRESSION_RATIO_LIMIT)
+    try:
+        content = await asyncio.to_thread(b"".join, upload)
+    except DecompressionLimitError as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except UploadError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
     logT = content.decode("utf-8", errors="ignore")
 
     if not logT.strip():
@@ -249,52 +790,420 @@ async def analyze_log(
 async def analyze_log_stream(
     request: Request,
     file: UploadFile = File(...),
+    since: str = None,
+    until: str = None,
+    mode: str = None,
     credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
 ):
+    timer = StageTimer()
+    received_at = getattr(request.state, "received_at", None)
+    if received_at is not None:
+        # Multipart parsing happens before the handler runs
+        timer.started = received_at
+        timer.record("upload", time.perf_counter() - received_at)
+
     # ── Optional auth (anonymous users are allowed through to the guard) ──
     user = None
     if credentials:
+        with timer.stage("auth", histogram=None):
+            try:
+                user = await get_current_user(credentials)
+            except Exception:
+                user = None
+
+    mode = mode or ANALYSIS_MODE
+    if mode not in MODES:
+        return JSONResponse({"error": f"mode must be one of {', '.join(MODES)}"}, status_code=400)
+
+    # Refuse before charging usage when no job can be queued
+    if mode == "llm" and job_queue.full():
+        raise _busy()
+
+    # Optional time window (ISO-8601 or epoch / dmesg seconds)
+    try:
+        window_since = parse_bound(since) if since else None
+        window_until = parse_bound(until) if until else None
+    except ValueError:
+        return JSONResponse({"error": "since/until must be ISO-8601 times or numbers"}, status_code=400)
+    if window_since is not None and window_until is not None and window_since > window_until:
+        return JSONResponse({"error": "since must not be after until"}, status_code=400)
+    # A log without recognised timestamps would be dropped whole by the
+    # window; refuse it before any quota is spent
+    if (window_since is not None or window_until is not None) and is_supported(file.filename):
         try:
-            user = get_current_user(credentials)
-        except Exception:
-            user = None
+            time_format = await asyncio.to_thread(_sniff_timestamps, file)
+        except DecompressionLimitError as e:
+            return JSONResponse({"error": str(e)}, status_code=413)
+        except UploadError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        if time_format is None:
+            return JSONResponse(
+                {"error": "Timestamps not recognised in this log; since/until are not supported for it"},
+                status_code=400,
+            )
 
     # 🆕 USAGE GUARD — thin gate before any AI logic (antigravity, additive only)
-    await usage_guard(request, user, supabase_admin)
+    # Outside "llm" mode an upload is charged one rule-based report up front;
+    # if it is escalated that unit is refunded and the LLM quota charged
+    # instead. A user already out of LLM quota is refused in "auto" before
+    # paying for a preprocess whose result might need it ("local" still works).
+    with timer.stage("usage_guard", histogram=None):
+        if mode == "auto":
+            await usage_guard(request, user, supabase_admin, tier="llm", charge=False)
+        await usage_guard(request, user, supabase_admin, tier="llm" if mode == "llm" else "local")
 
     # ── Everything below is UNCHANGED ────────────────────────────────────
-    if not file.filename.endswith(".txt"):
-        return JSONResponse({"error": "Please upload a .txt file"}, status_code=400)
-
-    content = await file.read()
-    log_text = content.decode("utf-8", errors="ignore")
+    if not is_supported(file.filename):
+        return JSONResponse({"error": f"Please upload a {ALLOWED_NAMES} file"}, status_code=400)
 
-    if not log_text.strip():
+    try:
+        with timer.stage("preprocess"):
+            processed = await _preprocess_upload(file, window_since, window_until)
+    except DecompressionLimitError as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except UploadError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not processed.original_line_count:
+        if processed.summary_stats.get("outside_window"):
+            return JSONResponse({"error": "No log lines in the requested time window"}, status_code=400)
         return JSONResponse({"error": "Empty file"}, status_code=400)
 
     user_id = user["sub"] if user else ""
+    file_name = file.filename
+    # Fair-queuing key for the LLM scheduler and who may read the job
+    if user_id:
+        owner = f"user:{user_id}"
+    else:
+        owner = f"anon:{request.headers.get('x-anon-id', '').strip() or (request.client.host if request.client else '')}"
+
+    if mode == "local" or (mode == "auto" and not escalation_reasons(processed)):
+        metrics.ANALYSIS_TIERS.labels("local").inc()
+        return StreamingResponse(
+            _local_stream(processed, user_id, file_name, timer),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    # Identical uploads already being analyzed subscribe to that job
+    flight_key = _flight_key(processed)
+    if mode == "auto":
+        # Only the tier actually used is charged
+        usage_refund(request, user, supabase_admin, tier="local")
+        if job_queue.full() and job_queue.find(flight_key) is None:
+            raise _busy()
+        with timer.stage("usage_guard", histogram=None):
+            await usage_guard(request, user, supabase_admin, tier="llm")
+    metrics.ANALYSIS_TIERS.labels("llm").inc()
+
+    job = job_queue.find(flight_key)
+    if job is not None:
+        # Charged above like any upload; the history row is saved when the job completes
+        job.subscribers.append((user_id, file_name))
+        job.owners.add(owner)
+        metrics.ANALYSES_COALESCED.inc()
+    else:
+        submitted_at = time.perf_counter()
+        subscribers = [(user_id, file_name)]
+
+        def run():
+            timer.record("queue_wait", time.perf_counter() - submitted_at)
+            return _stream_analysis(processed, subscribers, timer=timer, owner=owner, flight_key=flight_key)
+
+        try:
+            job = job_queue.submit(run, key=flight_key, subscribers=subscribers, owner=owner)
+        except QueueFullError:
+            raise _busy()
+
+    # The analysis keeps running if this response is dropped
+    return StreamingResponse(
+        _job_stream(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Job-Id": job.id},
+    )
+
+
+async def _get_job(job_id: str, request: Request, credentials):
+    """The job if the caller submitted or joined it; 404 otherwise, as for sessions."""
+    owner, _ = await _request_owner(request, credentials)
+    job = job_queue.get(job_id, owner)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+):
+    job = await _get_job(job_id, request, credentials)
+    return job.describe()
+
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(
+    job_id: str,
+    request: Request,
+    last_event_id: int = 0,
+    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+):
+    """Replay events after Last-Event-ID (header or query), then follow live."""
+    job = await _get_job(job_id, request, credentials)
+
+    header = request.headers.get("last-event-id", "")
+    after = int(header) if header.isdigit() else last_event_id
     return StreamingResponse(
-        _stream_analysis(log_text, user_id=user_id, file_name=file.filename),
+        _job_stream(job, after),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+# Append-mode sessions for growing logs (see sessions.py)
+session_store = SessionStore(
+    ttl=int(os.getenv("SESSION_TTL", "3600")),
+    max_sessions=int(os.getenv("SESSION_MAX", "256")),
+)
+metrics.FunctionGauge(
+    "loganalyzer_sessions_open", "Append-mode analysis sessions kept in memory", (),
+    lambda: [((), len(session_store.sessions))],
+)
+
+
+async def _request_owner(request: Request, credentials) -> tuple[str, dict]:
+    """(owner key, user) for the caller of a job or session endpoint; anonymous callers are keyed by X-Anon-Id."""
+    user = None
+    if credentials:
+        try:
+            user = await get_current_user(credentials)
+        except Exception:
+            user = None
+    if user:
+        return f"user:{user['sub']}", user
+    anon_id = request.headers.get("x-anon-id", "").strip()
+    if not anon_id or len(anon_id) > 100:
+        raise HTTPException(status_code=400, detail="Missing identity")
+    return f"anon:{anon_id}", None
+
+
+def _get_session(session_id: str, owner: str) -> AnalysisSession:
+    session = session_store.get(session_id, owner)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return session
+
+
+@app.post("/sessions")
+async def create_session(
+    request: Request,
+    name: str = "",
+    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+):
+    """
+    Open a session for a growing log. Opening is free (it makes no model
+    calls); each append is charged as one LLM analysis.
+    """
+    owner, user = await _request_owner(request, credentials)
+    if session_store.full():
+        raise _busy()
+    try:
+        session = session_store.create(owner, name[:255])
+    except SessionLimitError:
+        raise _busy()
+    return session.describe()
+
+
+@app.post("/sessions/{session_id}/append")
+async def append_session(
+    session_id: str,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+):
+    """
+    Append the raw request body to the session and stream an updated
+    analysis (same events as /analyze-stream; resumable via /jobs/{id}/events).
+    Every append queues chunk and synthesis calls, so each one is charged
+    one unit of the LLM quota, before the body is read.
+    """
+    timer = StageTimer()
+    owner, user = await _request_owner(request, credentials)
+    session = _get_session(session_id, owner)
+    if job_queue.full():
+        raise _busy()
+    with timer.stage("usage_guard", histogram=None):
+        await usage_guard(request, user, supabase_admin, tier="llm")
+
+    with timer.stage("preprocess"):
+        async with session.append_lock:
+            try:
+                # Off the event loop, like compressed uploads: a body may be
+                # up to SESSION_MAX_BYTES
+                async for block in request.stream():
+                    await asyncio.to_thread(session.append, block)
+            except SessionLimitError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            session.appends += 1
+
+    submitted_at = time.perf_counter()
+
+    def run():
+        timer.record("queue_wait", time.perf_counter() - submitted_at)
+        return _session_events(session, timer)
+
+    try:
+        job = job_queue.submit(run, owner=session.owner)
+    except QueueFullError:
+        raise _busy()
+
+    return StreamingResponse(
+        _job_stream(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Job-Id": job.id},
+    )
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(
+    session_id: str,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+):
+    owner, _ = await _request_owner(request, credentials)
+    return _get_session(session_id, owner).describe()
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(
+    session_id: str,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+):
+    owner, _ = await _request_owner(request, credentials)
+    session_store.delete(_get_session(session_id, owner).id)
+    return {"deleted": session_id}
+
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+HISTORY_LIST_COLUMNS = "id, file_name, total_lines, critical, errors, warnings, created_at"
+HISTORY_DETAIL_COLUMNS = "id, file_name, summary, total_lines, critical, errors, warnings, created_at"
+
+
+def _encode_cursor(row: dict) -> str:
+    raw = json.dumps([row["created_at"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    # Both values end up inside a PostgREST filter, so accept only a
+    # timestamp and a plain id
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        if not re.fullmatch(r"[\w-]+", str(row_id)):
+            raise ValueError(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, row_id
+
+
+def _history_page(user_id: str, limit: int, cursor: str):
+    query = (
+        supabase_admin.table("analyses")
+        .select(HISTORY_LIST_COLUMNS)
+        .eq("user_id", user_id)
+    )
+    if cursor:
+        # Keyset on (created_at, id): rows strictly after the cursor row
+        created_at, row_id = _decode_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt."{created_at}",'
+            f'and(created_at.eq."{created_at}",id.lt."{row_id}")'
+        )
+    rows = (
+        query.order("created_at", desc=True)
+        .order("id", desc=True)
+        .limit(limit + 1)
+        .execute()
+        .data
+    )
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"items": rows[:limit], "next_cursor": next_cursor}
+
+
+def _history_detail(user_id: str, analysis_id: str):
+    rows = (
+        supabase_admin.table("analyses")
+        .select(HISTORY_DETAIL_COLUMNS)
+        .eq("user_id", user_id)
+        .eq("id", analysis_id)
+        .limit(1)
+        .execute()
+        .data
+    )
+    return rows[0] if rows else None
+
+
 @app.get("/history")
-async def get_history(user=Depends(get_current_user)):
+async def get_history(
+    request: Request,
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: str = "",
+    user=Depends(get_current_user),
+):
+    """One page of the user's analyses, newest first, without summaries."""
     if not supabase_admin:
         raise HTTPException(status_code=503, detail="History unavailable")
-    try:
-        result = (
-            supabase_admin.table("analyses")
-            .select("id, file_name, summary, total_lines, critical, errors, warnings, created_at")
-            .eq("user_id", user["sub"])
-            .order("created_at", desc=True)
-            .execute()
-        )
-        return result.data
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    user_id = user["sub"]
+    key = ("page", limit, cursor)
+
+    cached = history_cache.get(user_id, key)
+    if cached is None:
+        generation = history_cache.generation(user_id)
+        if cursor:
+            _decode_cursor(cursor)
+        try:
+            page = await asyncio.to_thread(_history_page, user_id, limit, cursor)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        cached = CachedJSON(page)
+        history_cache.put(user_id, key, cached, generation)
+    return cached.response(request)
+
+
+@app.get("/history/{analysis_id}")
+async def get_history_detail(analysis_id: str, request: Request, user=Depends(get_current_user)):
+    if not supabase_admin:
+        raise HTTPException(status_code=503, detail="History unavailable")
+    user_id = user["sub"]
+    key = ("detail", analysis_id)
+
+    cached = history_cache.get(user_id, key)
+    if cached is None:
+        generation = history_cache.generation(user_id)
+        try:
+            row = await asyncio.to_thread(_history_detail, user_id, analysis_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if row is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        cached = CachedJSON(row)
+        history_cache.put(user_id, key, cached, generation)
+    return cached.response(request)
+
+
+# Set METRICS_TOKEN to require "Authorization: Bearer <token>" on /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.api_route("/health", methods=["GET", "HEAD"])
@@ -306,41 +1215,38 @@ async def health_check():
 
 
 @app.get("/style.css")
-async def get_css():
-    return FileResponse("style.css", media_type="text/css")
+async def get_css(request: Request):
+    return static_files.response("style.css", request)
 
 
 @app.get("/index.js")
-async def get_js():
-    return FileResponse("index.js", media_type="application/javascript")
+async def get_js(request: Request):
+    return static_files.response("index.js", request)
 
 
 @app.get("/history.html", response_class=HTMLResponse)
-async def get_history_page():
-    with open("history.html", "r") as f:
-        return f.read()
+async def get_history_page(request: Request):
+    return static_files.response("history.html", request)
 
 
 @app.get("/history.js")
-async def get_history_js():
-    return FileResponse("history.js", media_type="application/javascript")
+async def get_history_js(request: Request):
+    return static_files.response("history.js", request)
 
 
 @app.get("/login.html", response_class=HTMLResponse)
-async def get_login_page():
-    with open("login.html", "r") as f:
-        return f.read()
+async def get_login_page(request: Request):
+    return static_files.response("login.html", request)
 
 
 @app.get("/login.js")
-async def get_login_js():
-    return FileResponse("login.js", media_type="application/javascript")
+async def get_login_js(request: Request):
+    return static_files.response("login.js", request)
 
 
 @app.get("/settings.html", response_class=HTMLResponse)
-async def get_settings_page():
-    with open("settings.html", "r") as f:
-        return f.read()
+async def get_settings_page(request: Request):
+    return static_files.response("settings.html", request)
 
 
 app.add_middleware(
@@ -350,10 +1256,12 @@ app.add_middleware(
         "http://localhost:8000",
         "http://127.0.0.1:8000",
     ],
+    expose_headers=["X-Job-Id"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(_ReceivedAt)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,265 @@
+"""
+Process-local metrics in the Prometheus text format, plus per-request
+stage timers for the SSE stream.
+Updates are a lock, a bisect and a few additions, so instrumentation can
+stay on in production; /metrics renders the registry on demand.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: dict = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """Child for one label combination (created on first use)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    @contextmanager
+    def track(self, *values):
+        """Increment for the duration of the block."""
+        child = self.labels(*values)
+        child.inc()
+        try:
+            yield
+        finally:
+            child.dec()
+
+
+class FunctionCounter(_Metric):
+    """Counter read from existing state at scrape time, e.g. cache hit counts."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple, read):
+        super().__init__(name, help, labelnames)
+        self._read = read
+
+    def _samples(self):
+        for values, value in self._read():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(value)}"
+
+
+class FunctionGauge(FunctionCounter):
+    """Gauge read at scrape time, e.g. a queue length."""
+
+    kind = "gauge"
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds, lock):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = lock
+
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds, self._lock)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            with self._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}"
+
+
+REGISTRY: list = []
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# ─── Application metrics ────────────────────────────────────────────────────
+
+STAGE_SECONDS = Histogram(
+    "loganalyzer_stage_seconds", "Analysis pipeline stage latency", ("stage",),
+)
+AUTH_SECONDS = Histogram(
+    "loganalyzer_auth_seconds", "JWT verification latency", ("result",),
+)
+USAGE_GUARD_SECONDS = Histogram(
+    "loganalyzer_usage_guard_seconds", "Usage limit check latency", ("result",),
+)
+LLM_SECONDS = Histogram(
+    "loganalyzer_llm_seconds", "LLM call latency (one observation per chunk or synthesis call)", ("kind",),
+)
+LLM_CALLS = Counter(
+    "loganalyzer_llm_calls_total", "LLM calls by outcome", ("kind", "result"),
+)
+LLM_PROMPT_CHARS = Counter(
+    "loganalyzer_llm_prompt_chars_total", "Characters sent to the LLM", ("kind",),
+)
+LLM_PROMPT_TOKENS = Counter(
+    "loganalyzer_llm_prompt_tokens_total", "Prompt tokens (reported by the model, else estimated)", ("kind",),
+)
+ANALYSES_IN_FLIGHT = Gauge(
+    "loganalyzer_analyses_in_flight", "Analysis streams currently running",
+)
+ANALYSIS_TIERS = Counter(
+    "loganalyzer_analysis_tiers_total", "Uploads answered by the rule-based report or the LLM", ("tier",),
+)
+ANALYSES_COALESCED = Counter(
+    "loganalyzer_analyses_coalesced_total", "Uploads that joined an identical analysis already in flight",
+)
+LLM_CALLS_IN_FLIGHT = Gauge(
+    "loganalyzer_llm_calls_in_flight", "LLM calls currently awaiting a response", ("kind",),
+)
+
+
+# ─── Per-request timers ─────────────────────────────────────────────────────
+
+class StageTimer:
+    """
+    Monotonic stage durations for one analysis. ``stages`` accumulates
+    seconds per stage name and is sent with every SSE event; each stage
+    is also observed in STAGE_SECONDS unless ``histogram`` is None.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def record(self, name: str, seconds: float, histogram=STAGE_SECONDS):
+        self.stages[name] = round(self.stages.get(name, 0.0) + seconds, 4)
+        if histogram is not None:
+            histogram.labels(name).observe(seconds)
+
+    @contextmanager
+    def stage(self, name: str, histogram=STAGE_SECONDS):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, histogram)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def snapshot(self) -> dict:
+        return {**self.stages, "elapsed": round(self.elapsed(), 4)}
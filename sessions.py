@@ -0,0 +1,167 @@
+"""
+Append-mode analysis sessions for growing logs.
+A session keeps the preprocessing state of a log that arrives in
+segments (e.g. a tailed service log). Input is cut into windows in
+arrival order: once a window's processed text fills a chunk it is sealed,
+split into chunks and analyzed once, and its result is kept. Later
+segments only extend the open window, so an update costs the newly
+sealed chunks, the open window and one synthesis, not the whole log.
+"""
+
+import asyncio
+import secrets
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+
+from log_processor import LogPreprocessor, plan_chunks, CHUNK_TOKEN_BUDGET, CHARS_PER_TOKEN
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+SESSION_TTL = 3600                 # seconds an idle session is kept
+SESSION_MAX = 256                  # open sessions before new ones are refused
+SESSION_MAX_BYTES = 1024 ** 3      # bytes appended to one session in total
+SESSION_FEED_BLOCK = 64 * 1024     # input fed between window-size checks
+SESSION_SYNTHESIS_CHUNKS = 16      # most recent chunk analyses sent to synthesis
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+@dataclass
+class SessionView:
+    """Chunks and stats of a session at one point in time."""
+    chunks: list[str] = field(default_factory=list)  # sealed chunks, then the open window's
+    sealed: int = 0
+    stats: dict = field(default_factory=dict)
+
+    @property
+    def total_lines(self) -> int:
+        return self.stats.get("total_lines", 0)
+
+
+def _counts(stats: dict) -> dict:
+    return {key: value for key, value in stats.items() if isinstance(value, int)}
+
+
+class AnalysisSession:
+    """
+    Preprocessing state of one growing log. ``results`` holds the analysis
+    of each sealed chunk (by 0-based index) once it has been produced.
+    """
+
+    def __init__(self, owner: str, name: str = "", chunk_chars: int = CHUNK_TOKEN_BUDGET * CHARS_PER_TOKEN):
+        self.id = secrets.token_urlsafe(16)
+        self.owner = owner
+        self.name = name
+        self.chunk_chars = chunk_chars
+        self.created_at = self.updated_at = time.time()
+        self.bytes = 0
+        self.appends = 0
+        self.chunks: list[str] = []
+        self.results: dict[int, str] = {}
+        self._sealed_stats: Counter = Counter()
+        self._window = LogPreprocessor()
+        self._unchecked = 0
+        # Appends are fed one at a time; updates are analyzed one at a time
+        self.append_lock = asyncio.Lock()
+        self.analysis_lock = asyncio.Lock()
+        # append() and view() run on worker threads; they share the window
+        self._state_lock = threading.Lock()
+
+    def append(self, data: bytes):
+        """Feed one piece of a segment, sealing the window whenever it fills a chunk."""
+        with self._state_lock:
+            if self.bytes + len(data) > SESSION_MAX_BYTES:
+                raise SessionLimitError(f"Session is limited to {SESSION_MAX_BYTES} bytes")
+            self.bytes += len(data)
+            self.updated_at = time.time()
+            for start in range(0, len(data), SESSION_FEED_BLOCK):
+                piece = data[start:start + SESSION_FEED_BLOCK]
+                self._window.feed_bytes(piece)
+                self._unchecked += len(piece)
+                if self._unchecked >= SESSION_FEED_BLOCK:
+                    self._unchecked = 0
+                    self._window.commit_held()
+                    if len(self._window.snapshot().processed_text) >= self.chunk_chars:
+                        self._seal()
+
+    def _seal(self):
+        processed, self._window = self._window.split()
+        text = processed.processed_text
+        self.chunks.extend(chunk.text(text) for chunk in plan_chunks(text))
+        self._sealed_stats.update(_counts(processed.summary_stats))
+
+    def view(self) -> SessionView:
+        with self._state_lock:
+            return self._view()
+
+    def _view(self) -> SessionView:
+        # No final line in a live log: commit what has been held back
+        self._window.commit_held()
+        open_window = self._window.snapshot()
+        chunks = list(self.chunks)
+        if open_window.original_line_count:
+            text = open_window.processed_text
+            chunks.extend(chunk.text(text) for chunk in plan_chunks(text))
+        stats = self._sealed_stats.copy()
+        stats.update(_counts(open_window.summary_stats))
+        stats = dict(stats)
+        # The time index and format aggregates span the whole session, so the
+        # open window's copies cover it
+        for key in ("timeline", "format"):
+            if key in open_window.summary_stats:
+                stats[key] = open_window.summary_stats[key]
+        return SessionView(chunks=chunks, sealed=len(self.chunks), stats=stats)
+
+    def describe(self) -> dict:
+        return {
+            "session_id": self.id,
+            "name": self.name,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "bytes": self.bytes,
+            "appends": self.appends,
+            "total_lines": self._sealed_stats["total_lines"] + self._window.lines_seen,
+            "sealed_chunks": len(self.chunks),
+            "analyzed_chunks": len(self.results),
+        }
+
+
+class SessionStore:
+    """Open sessions by id, dropped after ``ttl`` seconds without an append."""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, AnalysisSession] = OrderedDict()
+
+    def sweep(self):
+        cutoff = time.time() - self.ttl
+        for session_id in [s.id for s in self.sessions.values() if s.updated_at < cutoff]:
+            del self.sessions[session_id]
+
+    def full(self) -> bool:
+        self.sweep()
+        return len(self.sessions) >= self.max_sessions
+
+    def create(self, owner: str, name: str = "") -> AnalysisSession:
+        if self.full():
+            raise SessionLimitError("Too many open sessions")
+        session = AnalysisSession(owner, name)
+        self.sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str, owner: str):
+        """The session if it exists and belongs to ``owner``, else None."""
+        self.sweep()
+        session = self.sessions.get(session_id)
+        if session is None or session.owner != owner:
+            return None
+        return session
+
+    def delete(self, session_id: str):
+        self.sessions.pop(session_id, None)
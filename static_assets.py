@@ -0,0 +1,134 @@
+"""
+In-memory static files for the frontend.
+Pages and assets are read once at startup together with gzip (and, when
+the ``brotli`` package is installed, brotli) variants and strong ETags,
+so page loads are served from memory with no disk I/O. Asset references
+in the pages are rewritten to versioned URLs (``index.js?v=<hash>``),
+which are cached by browsers for a year; everything else revalidates
+with If-None-Match and gets a 304 when unchanged.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+MEDIA_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+}
+
+
+class StaticFile:
+    """One file with its encoded variants, keyed by content-coding."""
+
+    def __init__(self, name: str, body: bytes):
+        self.name = name
+        self.media_type = MEDIA_TYPES[os.path.splitext(name)[1]]
+        digest = hashlib.sha256(body).hexdigest()
+        self.version = digest[:12]
+        self.variants = {"identity": (body, f'"{digest[:32]}"')}
+
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            self.variants["gzip"] = (compressed, f'"{digest[:32]}-gz"')
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                self.variants["br"] = (compressed, f'"{digest[:32]}-br"')
+
+    def etags(self) -> set:
+        return {etag for _, etag in self.variants.values()}
+
+
+def _accepted(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def accepts_encoding(request: Request, coding: str) -> bool:
+    accepted = _accepted(request.headers.get("accept-encoding", ""))
+    return coding in accepted or "*" in accepted
+
+
+def _matches(if_none_match: str, etags: set) -> bool:
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in etags:
+            return True
+    return False
+
+
+class StaticAssets:
+    """
+    ``assets`` (css/js) are loaded first so ``pages`` (html) can point at
+    their versioned URLs. Call ``response(name, request)`` from a route.
+    """
+
+    def __init__(self, root: str, pages: list[str], assets: list[str]):
+        self.files: dict[str, StaticFile] = {}
+        for name in assets:
+            self.files[name] = StaticFile(name, self._read(root, name))
+
+        pattern = re.compile(
+            r'(src|href)="(' + "|".join(re.escape(name) for name in assets) + r')"'
+        )
+        for name in pages:
+            html = self._read(root, name).decode("utf-8")
+            html = pattern.sub(
+                lambda m: f'{m.group(1)}="{m.group(2)}?v={self.files[m.group(2)].version}"', html,
+            )
+            self.files[name] = StaticFile(name, html.encode("utf-8"))
+
+    @staticmethod
+    def _read(root: str, name: str) -> bytes:
+        with open(os.path.join(root, name), "rb") as f:
+            return f.read()
+
+    def response(self, name: str, request: Request) -> Response:
+        asset = self.files[name]
+        accepted = _accepted(request.headers.get("accept-encoding", ""))
+        coding = next(
+            (c for c in ("br", "gzip") if c in asset.variants and (c in accepted or "*" in accepted)),
+            "identity",
+        )
+        body, etag = asset.variants[coding]
+
+        versioned = request.query_params.get("v") == asset.version
+        headers = {
+            "ETag": etag,
+            "Cache-Control": IMMUTABLE_CACHE if versioned else REVALIDATE_CACHE,
+            "Vary": "Accept-Encoding",
+        }
+        if _matches(request.headers.get("if-none-match", ""), asset.etags()):
+            return Response(status_code=304, headers=headers)
+
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return Response(content=body, media_type=asset.media_type, headers=headers)
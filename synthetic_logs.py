@@ -0,0 +1,158 @@
+"""
+Deterministic synthetic log generators for benchmarks.
+
+Each generator yields lines in one format with a tunable share of
+error events (error_ratio) and of repeated messages (repetition_ratio;
+the rest are structurally unique). The same seed always produces the
+same log.
+"""
+
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+
+_WORDS = (
+    "cache session worker queue shard replica token upstream socket handler "
+    "buffer index lease pool scheduler volume snapshot route config backend"
+).split()
+
+_START = datetime(2026, 2, 19, 10, 0, 0, tzinfo=timezone.utc)
+
+
+def _unique_message(rng: random.Random) -> str:
+    words = rng.sample(_WORDS, rng.randint(3, 7))
+    return " ".join(words) + f" id={rng.getrandbits(32):08x}"
+
+
+class _Generator:
+    repeated_info: list[str] = []
+    repeated_errors: list[str] = []
+
+    def __init__(self, error_ratio: float, repetition_ratio: float, seed: int):
+        self.error_ratio = error_ratio
+        self.repetition_ratio = repetition_ratio
+        self.rng = random.Random(seed)
+
+    def message(self, error: bool) -> str:
+        rng = self.rng
+        if rng.random() < self.repetition_ratio:
+            pool = self.repeated_errors if error else self.repeated_info
+            return rng.choice(pool).format(n=rng.randint(1, 65535))
+        prefix = "failed: " if error else ""
+        return prefix + _unique_message(rng)
+
+    def event(self, i: int, error: bool) -> list[str]:
+        raise NotImplementedError
+
+    def lines(self, count: int):
+        i = 0
+        produced = 0
+        while produced < count:
+            error = self.rng.random() < self.error_ratio
+            for line in self.event(i, error):
+                if produced == count:
+                    return
+                yield line
+                produced += 1
+            i += 1
+
+
+class DmesgGenerator(_Generator):
+    repeated_info = [
+        "usb 1-1: new high-speed USB device number {n} using xhci_hcd",
+        "EXT4-fs (sda1): mounted filesystem with ordered data mode",
+        "e1000e 0000:00:1f.6 eth0: NIC Link is Up 1000 Mbps Full Duplex",
+        "audit: type=1400 audit({n}.123:45): apparmor=\"STATUS\"",
+    ]
+    repeated_errors = [
+        "Out of memory: Kill process {n} (java) score 900 or sacrifice child",
+        "EXT4-fs error (device sda1): ext4_find_entry:1455: inode #{n}: comm bash",
+        "BUG: unable to handle kernel NULL pointer dereference at {n:016x}",
+    ]
+
+    def event(self, i, error):
+        return [f"[{i * 0.00137:12.6f}] {self.message(error)}"]
+
+
+class NginxGenerator(_Generator):
+    repeated_info = ["GET /api/v1/items?page={n} HTTP/1.1", "GET /healthz HTTP/1.1", "POST /api/v1/login HTTP/1.1"]
+    repeated_errors = ["connect() failed (111: Connection refused) while connecting to upstream, request #{n}"]
+
+    def event(self, i, error):
+        rng = self.rng
+        ts = (_START + timedelta(milliseconds=i * 13)).strftime("%d/%b/%Y:%H:%M:%S +0000")
+        ip = f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        if error:
+            return [f"{ts} [error] {rng.randint(1, 64)}#0: *{i} {self.message(True)}, client: {ip}"]
+        status = 200 if rng.random() < 0.9 else 404
+        request = self.message(False)
+        if not request.startswith(("GET", "POST")):
+            request = "GET /" + request.replace(" ", "/") + " HTTP/1.1"
+        return [f'{ip} - - [{ts}] "{request}" {status} {rng.randint(100, 90000)} "-" "curl/8.5.0"']
+
+
+class DockerJSONGenerator(_Generator):
+    repeated_info = ["request completed in {n}ms", "heartbeat ok seq={n}", "cache hit ratio 0.{n}"]
+    repeated_errors = ["Error: ECONNRESET socket hang up (attempt {n})", "panic: runtime error: index out of range [{n}]"]
+
+    def event(self, i, error):
+        ts = (_START + timedelta(milliseconds=i * 7)).isoformat().replace("+00:00", "Z")
+        stream = "stderr" if error else "stdout"
+        return [json.dumps({"log": self.message(error) + "\n", "stream": stream, "time": ts})]
+
+
+class SystemdGenerator(_Generator):
+    repeated_info = [
+        "Started Session {n} of user root.",
+        "Starting Cleanup of Temporary Directories...",
+        "Finished Daily apt upgrade and clean activities.",
+    ]
+    repeated_errors = [
+        "nginx.service: Main process exited, code=exited, status=1/FAILURE",
+        "Failed to start Docker Application Container Engine.",
+    ]
+
+    def event(self, i, error):
+        ts = (_START + timedelta(seconds=i)).strftime("%b %d %H:%M:%S")
+        unit = "systemd[1]" if self.rng.random() < 0.7 else f"sshd[{self.rng.randint(100, 99999)}]"
+        return [f"{ts} host-01 {unit}: {self.message(error)}"]
+
+
+class PythonTracebackGenerator(_Generator):
+    repeated_info = ["app.worker: processed job {n}", "app.http: 200 GET /api/items", "app.db: pool size 10 in use {n}"]
+    repeated_errors = ["ValueError: invalid literal for int() with base 10: '{n}'", "KeyError: 'user_{n}'"]
+
+    def event(self, i, error):
+        ts = (_START + timedelta(milliseconds=i * 11)).strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
+        if not error:
+            return [f"{ts} INFO {self.message(False)}"]
+        return [
+            f"{ts} ERROR app.worker: job failed",
+            "Traceback (most recent call last):",
+            '  File "/srv/app/worker.py", line 88, in run',
+            "    result = handler(payload)",
+            f'  File "/srv/app/handlers.py", line {self.rng.randint(10, 400)}, in handle',
+            "    value = int(payload[\"count\"])",
+            self.message(True),
+        ]
+
+
+GENERATORS = {
+    "dmesg": DmesgGenerator,
+    "nginx": NginxGenerator,
+    "docker": DockerJSONGenerator,
+    "systemd": SystemdGenerator,
+    "python": PythonTracebackGenerator,
+}
+
+
+def generate(
+    fmt: str,
+    count: int,
+    error_ratio: float = 0.05,
+    repetition_ratio: float = 0.8,
+    seed: int = 0,
+) -> list[str]:
+    """``count`` lines of synthetic ``fmt`` log (see GENERATORS)."""
+    return list(GENERATORS[fmt](error_ratio, repetition_ratio, seed).lines(count))
@@ -0,0 +1,99 @@
+"""Invariants of plan_chunks/_allocate on randomly sized logs."""
+
+import random
+
+import pytest
+
+from log_processor import SECTION_PRIORITY, _sections, plan_chunks, preprocess_log
+
+
+LEVELS = ("CRITICAL", "ERROR", "WARNING", "INFO")
+
+
+def _random_log(rng: random.Random) -> str:
+    lines = []
+    for n in range(rng.randrange(1, 60)):
+        level = rng.choice(LEVELS)
+        # Distinct words per line so nothing is merged into one signature
+        words = " ".join(f"w{rng.randrange(10**6)}" for _ in range(rng.randrange(1, 25)))
+        lines.append(f"2026-02-19T10:{n // 60:02d}:{n % 60:02d}Z {level} {words}")
+    return "\n".join(lines)
+
+
+def _line_starts(text: str) -> list[int]:
+    starts = [0]
+    starts.extend(n + 1 for n, char in enumerate(text) if char == "\n" and n + 1 < len(text))
+    return starts
+
+
+def _kept_lines(text: str, chunks) -> set[int]:
+    """Start offsets of the lines fully inside some span."""
+    kept = set()
+    for chunk in chunks:
+        for start, end, _ in chunk.spans:
+            for line_start in _line_starts(text):
+                line_end = text.find("\n", line_start)
+                line_end = len(text) if line_end < 0 else line_end
+                if start <= line_start and line_end <= end:
+                    kept.add(line_start)
+    return kept
+
+
+def test_critical_is_kept_before_lower_fragments():
+    lines = [f"2026-02-19T10:00:0{n}Z CRITICAL kernel panic id={n} " + "c" * 120 for n in range(3)]
+    lines += [f"2026-02-19T10:00:1{n}Z ERR request failed id={n} " + "e" * 130 for n in range(3)]
+    lines += [f"2026-02-19T10:00:2{n}Z INFO served id={n} " + "i" * 130 for n in range(3)]
+    text = preprocess_log("\n".join(lines)).processed_text
+
+    (chunk,) = plan_chunks(text, token_budget=150, max_chunks=1)
+    rendered = chunk.text(text)
+    assert "ERR request failed id=0 e" not in rendered
+    assert "INFO served" not in rendered
+    assert "lines omitted" in rendered
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_spans_are_line_aligned_and_kept_by_priority(seed):
+    rng = random.Random(seed)
+    text = preprocess_log(_random_log(rng)).processed_text
+    token_budget = rng.randrange(100, 400)
+    max_chunks = rng.randrange(1, 5)
+
+    chunks = plan_chunks(text, token_budget=token_budget, max_chunks=max_chunks)
+
+    assert 0 < len(chunks) <= max_chunks
+    for chunk in chunks:
+        assert chunk.size <= token_budget * 4
+        for start, end, _ in chunk.spans:
+            assert start == 0 or text[start - 1] == "\n"
+            assert end == len(text) or text[end - 1] == "\n"
+
+    kept = _kept_lines(text, chunks)
+    bodies = []  # (priority, body line starts) per section
+    for name, header, start, end in _sections(text):
+        starts = [
+            s for s in _line_starts(text)
+            if start <= s < end and (not header or s > start) and text[s:text.find("\n", s)].strip()
+        ]
+        bodies.append((SECTION_PRIORITY[name], starts))
+    for priority, starts in bodies:
+        if any(s in kept for s in starts):
+            for higher, higher_starts in bodies:
+                if higher < priority:
+                    assert all(s in kept for s in higher_starts), "a lower section kept lines before a higher one"
+
+
+def test_cap_notes_every_dropped_line():
+    text = preprocess_log("\n".join(
+        f"2026-02-19T10:{n // 60 % 60:02d}:{n % 60:02d}Z ERROR failure {n} " + "x" * (n % 90) for n in range(3000)
+    )).processed_text
+    chunks = plan_chunks(text, token_budget=500, max_chunks=3)
+
+    assert len(chunks) == 3
+    kept = len(_kept_lines(text, chunks))
+    omitted = sum(omitted for chunk in chunks for _, _, omitted in chunk.spans)
+    assert omitted > 0
+    assert "lines omitted to fit the token budget" in chunks[-1].text(text)
+    # Every non-blank line is either kept or counted as omitted, and no line twice
+    lines = text.splitlines()
+    assert sum(1 for line in lines if line.strip()) <= kept + omitted <= len(lines)
@@ -0,0 +1,77 @@
+"""Serial, block-fed and parallel preprocessing give the same result."""
+
+import random
+
+import pytest
+
+from log_processor import LogPreprocessor, preprocess_log, preprocess_parallel, shutdown_pool
+from synthetic_logs import GENERATORS, generate
+
+
+def _fed_in_blocks(data: bytes, size: int):
+    preprocessor = LogPreprocessor()
+    for start in range(0, len(data), size):
+        preprocessor.feed_bytes(data[start:start + size])
+    return preprocessor.finish()
+
+
+def _same(a, b):
+    assert a.summary_stats == b.summary_stats
+    assert a.processed_text == b.processed_text
+
+
+@pytest.mark.parametrize("fmt", sorted(GENERATORS))
+@pytest.mark.parametrize("size", [1, 97, 4096, 1 << 20])
+def test_block_fed_matches_whole_text(fmt, size):
+    text = "\n".join(generate(fmt, 2000))
+    _same(_fed_in_blocks(text.encode(), size), preprocess_log(text))
+
+
+def test_format_is_not_decided_by_a_short_first_block():
+    text = '{"level":"error","msg":"boom"}\n' + "\n".join(
+        f"plain line {n} failed" if n % 5 == 0 else f"plain line {n} ok" for n in range(1000)
+    )
+    whole = preprocess_log(text)
+    assert "format" not in whole.summary_stats
+
+    preprocessor = LogPreprocessor()
+    first, rest = text.split("\n", 1)
+    preprocessor.feed(first + "\n")
+    preprocessor.feed(rest)
+    _same(preprocessor.finish(), whole)
+
+
+def _syslog_without_markers(seed: int, marked_from: int) -> str:
+    """Syslog messages whose level markers disagree with their keywords, from line ``marked_from`` on."""
+    rng = random.Random(seed)
+    lines = []
+    for n in range(20000):
+        message = rng.choice((
+            "sshd[12]: Accepted publickey for root",
+            "nginx[2]: upstream timed out error",
+            "app[9]: [INFO] retry after error cleared",
+        ))
+        if n < marked_from and "[INFO]" in message:
+            message = "kernel: eth0 link up"
+        priority = "<13>" if n < 4000 or n % 3 else ""
+        lines.append(f"{priority}Feb 19 10:{n // 60 % 60:02d}:{n % 60:02d} host {message}")
+    return "\n".join(lines)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    yield 2
+    shutdown_pool()
+
+
+@pytest.mark.parametrize("text", [
+    *("\n".join(generate(fmt, 20000)) for fmt in sorted(GENERATORS)),
+    _syslog_without_markers(1, marked_from=6000),
+    _syslog_without_markers(2, marked_from=0),
+], ids=[*sorted(GENERATORS), "probe_settles_late", "probe_hits"])
+def test_parallel_matches_serial(pool, text):
+    data = text.encode()
+    blocks = (data[n:n + 65536] for n in range(0, len(data), 65536))
+    parallel = preprocess_parallel(blocks, pool, shard_bytes=64 * 1024)
+    assert parallel.perf["shards"] > 2
+    _same(parallel, preprocess_log(text))
@@ -0,0 +1,108 @@
+"""UsageCounters: limits, refunds, day rollover and failed loads."""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import usage_guard
+from fake_supabase import FakeSupabase
+from usage_guard import UsageCounters
+
+
+TABLE, COLUMN = "anonymous_usage", "anon_id"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable UTC 'now' for usage_guard."""
+    now = {"value": datetime(2026, 2, 19, 12, 0, tzinfo=timezone.utc)}
+    monkeypatch.setattr(usage_guard, "_utc_now", lambda: now["value"])
+    return now
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _charge(counters, db, identity, limit, times=1):
+    results = []
+    for _ in range(times):
+        results.append(await counters.check_and_increment(db, TABLE, COLUMN, identity, limit))
+    return results
+
+
+def test_limit_and_refund(clock):
+    async def scenario():
+        counters, db = UsageCounters(flush_interval=3600), FakeSupabase()
+        assert await _charge(counters, db, "a", 2, times=3) == [True, True, False]
+        counters.refund(TABLE, "a")
+        assert await _charge(counters, db, "a", 2) == [True]
+        # A check without charge never counts
+        assert await counters.check_and_increment(db, TABLE, COLUMN, "a", 2, charge=False) is False
+        await counters.close()
+        return db.tables[TABLE]
+
+    (row,) = _run(scenario())
+    assert row["request_count"] == 2
+
+
+def test_refund_never_goes_below_zero_or_touches_unknown_identities(clock):
+    async def scenario():
+        counters, db = UsageCounters(flush_interval=3600), FakeSupabase()
+        counters.refund(TABLE, "nobody")
+        await _charge(counters, db, "a", 5)
+        counters.refund(TABLE, "a")
+        counters.refund(TABLE, "a")
+        assert await _charge(counters, db, "a", 1) == [True]
+        await counters.close()
+
+    _run(scenario())
+
+
+def test_day_rollover_resets_the_count(clock):
+    async def scenario():
+        counters, db = UsageCounters(flush_interval=3600), FakeSupabase()
+        assert await _charge(counters, db, "a", 1, times=2) == [True, False]
+        clock["value"] += timedelta(days=1)
+        # A refund for yesterday's request must not credit today
+        counters.refund(TABLE, "a")
+        assert await _charge(counters, db, "a", 1, times=2) == [True, False]
+        await counters.close()
+
+    _run(scenario())
+
+
+def test_stored_count_is_loaded_and_stale_rows_are_ignored(clock):
+    async def scenario():
+        db = FakeSupabase()
+        today = clock["value"].isoformat()
+        yesterday = (clock["value"] - timedelta(days=1)).isoformat()
+        db.tables[TABLE] = [
+            {"id": 1, COLUMN: "today", "request_count": 3, "last_request": today},
+            {"id": 2, COLUMN: "yesterday", "request_count": 3, "last_request": yesterday},
+        ]
+        counters = UsageCounters(flush_interval=3600)
+        assert await _charge(counters, db, "today", 3) == [False]
+        assert await _charge(counters, db, "yesterday", 3) == [True]
+        await counters.close()
+
+    _run(scenario())
+
+
+def test_failed_load_fails_closed_and_keeps_the_stored_count(clock):
+    async def scenario():
+        db = FakeSupabase()
+        db.tables[TABLE] = [{"id": 1, COLUMN: "a", "request_count": 2, "last_request": clock["value"].isoformat()}]
+        counters = UsageCounters(flush_interval=3600)
+        db.fail = True
+        with pytest.raises(HTTPException) as error:
+            await _charge(counters, db, "a", 3)
+        assert error.value.status_code == 503
+        db.fail = False
+        await counters.close()
+        assert db.tables[TABLE][0]["request_count"] == 2
+        assert await _charge(counters, db, "a", 3, times=2) == [True, False]
+
+    _run(scenario())
@@ -0,0 +1,285 @@
+"""
+Timestamp extraction and a time-bucketed line index.
+The timestamp format of a log is detected once on a sample of lines
+(ISO-8601, syslog, dmesg, nginx); every line then gets the time of its
+own timestamp or, for continuation lines such as traceback frames, of
+the last line that had one. Times are seconds since the epoch (UTC),
+or seconds since boot for dmesg.
+"""
+
+import calendar
+import re
+from datetime import datetime, timezone
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+DETECT_SAMPLE_LINES = 200    # lines examined to pick a format
+DETECT_MIN_SHARE = 0.25      # share of sample lines that must match
+MAX_INDEX_BUCKETS = 4096     # index buckets before they are widened
+HISTOGRAM_BUCKETS = 60       # max bars in summary_stats["timeline"]
+# Bucket widths in seconds, smallest first
+BUCKET_WIDTHS = (1, 5, 10, 30, 60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 7 * 86400)
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+MONTHS = {name: n for n, name in enumerate(
+    ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1,
+)}
+
+# Group 1 is the date and time to the second; fraction and zone follow
+TIMESTAMP_PATTERNS = {
+    # 2026-02-19T10:00:00.123Z, 2026-02-19 10:00:00,011 +01:00 (also inside JSON)
+    "iso8601": re.compile(r"(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2})([.,]\d+)?\s?(Z|[+-]\d{2}:?\d{2})?"),
+    # Feb 19 10:00:00 (no year)
+    "syslog": re.compile(r"^(?:<\d+>\d?\s*)?([A-Z][a-z]{2} {1,2}\d{1,2} \d{2}:\d{2}:\d{2})"),
+    # [   12.345678] (seconds since boot)
+    "dmesg": re.compile(r"^\[\s*(\d+\.\d+)\]"),
+    # [19/Feb/2026:10:00:00 +0000] (access log)
+    "nginx": re.compile(r"\[?(\d{2}/[A-Z][a-z]{2}/\d{4}:\d{2}:\d{2}:\d{2}) ([+-]\d{4})"),
+    # 2026/02/19 10:00:00 (error log)
+    "nginx_error": re.compile(r"^(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})"),
+}
+
+
+def _offset_seconds(zone: str) -> int:
+    """UTC offset of 'Z', '+0100' or '-05:30' in seconds."""
+    if not zone or zone == "Z":
+        return 0
+    digits = zone[1:].replace(":", "")
+    seconds = int(digits[:2]) * 3600 + int(digits[2:4]) * 60
+    return -seconds if zone[0] == "-" else seconds
+
+
+class TimestampExtractor:
+    """
+    Per-line timestamps for one log. ``fmt`` is detected from the first
+    DETECT_SAMPLE_LINES lines unless given. Syslog lines have no year:
+    ``year`` is used if given; otherwise the first line is taken to be in
+    the current UTC year unless that would put it in the future (then the
+    previous year), and the year advances when the month wraps around
+    (Dec -> Jan).
+    """
+
+    def __init__(self, fmt: str = None, year: int = None):
+        self.fmt = fmt
+        self.year = year
+        self._month = None  # month of the last syslog time parsed
+        self.last = None
+        self._sampled = 0
+        self._head = self._tail = 0
+        # Epoch seconds of recently seen minutes (date/time text without ":SS")
+        self._minutes: dict = {}
+
+    def detect(self, lines: list[str]) -> str:
+        sample = [line for line in lines[:DETECT_SAMPLE_LINES] if line.strip()]
+        best, best_hits = None, 0
+        for name, pattern in TIMESTAMP_PATTERNS.items():
+            hits = sum(1 for line in sample if pattern.search(line))
+            if hits > best_hits:
+                best, best_hits = name, hits
+        if best is not None and best_hits >= DETECT_MIN_SHARE * len(sample):
+            return best
+        return None
+
+    def stamps(self, lines: list[str]) -> list:
+        """Timestamp of each line (inherited from the previous timed line, else None)."""
+        if self.fmt is None:
+            if self._sampled >= DETECT_SAMPLE_LINES:
+                return [None] * len(lines)
+            self.fmt = self.detect(lines)
+            self._sampled += len(lines)
+            if self.fmt is None:
+                return [None] * len(lines)
+
+        pattern = TIMESTAMP_PATTERNS[self.fmt]
+        search, at = pattern.search, pattern.match
+        parse = getattr(self, f"_parse_{self.fmt}")
+        last, last_text = self.last, None
+        # Where the previous timestamp started, from the start and from the
+        # end of its line: trying there first avoids scanning (JSON logs)
+        head, tail = self._head, self._tail
+        stamps = []
+        append = stamps.append
+        for line in lines:
+            match = at(line, head)
+            if match is None and len(line) >= tail:
+                match = at(line, len(line) - tail)
+            if match is None:
+                match = search(line)
+            if match is not None:
+                head, tail = match.start(), len(line) - match.start()
+                # Neighbouring lines often share a timestamp string
+                if match[0] != last_text:
+                    last, last_text = parse(match), match[0]
+            append(last)
+        self.last = last
+        self._head, self._tail = head, tail
+        return stamps
+
+    def _second(self, text: str, fields) -> int:
+        """
+        Epoch seconds of a date/time ``text`` ending in ":SS"; the minute
+        is cached, and ``fields(text)`` gives (year, month, day, hour,
+        minute, second) on a miss.
+        """
+        key = text[:-3]
+        base = self._minutes.get(key)
+        if base is None:
+            if len(self._minutes) >= 4096:
+                self._minutes.clear()
+            try:
+                base = calendar.timegm(fields(text)) - int(text[-2:])
+            except (ValueError, OverflowError):
+                base = 0
+            self._minutes[key] = base
+        return base + int(text[-2:])
+
+    def _parse_iso8601(self, m) -> float:
+        base = self._second(m[1], _numeric_fields)
+        fraction = float("0." + m[2][1:]) if m[2] else 0.0
+        return base + fraction - _offset_seconds(m[3])
+
+    def _parse_syslog(self, m) -> float:
+        return float(self._second(m[1], self._syslog_fields))
+
+    def _syslog_fields(self, text: str) -> tuple:
+        month, day, clock = text.split()
+        month, day = MONTHS.get(month, 1), int(day)
+        if self.year is None:
+            today = datetime.now(timezone.utc)
+            # Dec logs analyzed in Jan are from last year (a day of slack for time zones)
+            self.year = today.year - 1 if (month, day) > (today.month, today.day + 1) else today.year
+        elif self._month is not None and month < self._month - 6:
+            self.year += 1
+            self._minutes.clear()  # cached minutes are keyed without the year
+        elif self._month is not None and month > self._month + 6:
+            # A late line from before the wrap
+            return (self.year - 1, month, day, int(clock[0:2]), int(clock[3:5]), int(clock[6:8]))
+        self._month = month
+        return (self.year, month, day, int(clock[0:2]), int(clock[3:5]), int(clock[6:8]))
+
+    def _parse_dmesg(self, m) -> float:
+        return float(m[1])
+
+    def _parse_nginx(self, m) -> float:
+        return float(self._second(m[1], _nginx_fields) - _offset_seconds(m[2]))
+
+    def _parse_nginx_error(self, m) -> float:
+        return float(self._second(m[1], _numeric_fields))
+
+
+def _numeric_fields(text: str) -> tuple:
+    """2026-02-19T10:00:00 or 2026/02/19 10:00:00."""
+    return (int(text[0:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]), int(text[14:16]), int(text[17:19]))
+
+
+def _nginx_fields(text: str) -> tuple:
+    """19/Feb/2026:10:00:00."""
+    return (int(text[7:11]), MONTHS.get(text[3:6], 1), int(text[0:2]), int(text[12:14]), int(text[15:17]), int(text[18:20]))
+
+
+def parse_bound(value: str) -> float:
+    """
+    A since/until value: a number (epoch seconds, or seconds since boot
+    for dmesg logs) or an ISO-8601 date/time (UTC unless it has an offset).
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def format_time(stamp: float, fmt: str):
+    """ISO-8601 (UTC) for wall-clock formats; dmesg times stay seconds."""
+    if fmt == "dmesg":
+        return round(stamp, 3)
+    return datetime.fromtimestamp(stamp, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class TimeIndex:
+    """
+    Line counts per time bucket: for each bucket the first line number,
+    the number of lines and the critical/error/warning counts. Buckets
+    start at 1 s and are widened (BUCKET_WIDTHS) whenever there are more
+    than MAX_INDEX_BUCKETS of them.
+    """
+
+    def __init__(self):
+        self.width = BUCKET_WIDTHS[0]
+        # bucket start -> [first_line, lines, critical, errors, warnings]
+        self.buckets: dict[int, list[int]] = {}
+        self.untimed = 0
+
+    def add(self, stamps: list, line_numbers, codes: list) -> None:
+        """``codes`` are SEVERITY_CODES (0-2) for severity lines, 3 for info."""
+        buckets = self.buckets
+        width = self.width
+        end = None  # end of the current bucket; consecutive lines usually share it
+        for stamp, number, code in zip(stamps, line_numbers, codes):
+            if stamp is None:
+                self.untimed += 1
+                continue
+            if end is None or not start <= stamp < end:
+                start = stamp // width * width
+                end = start + width
+                key = int(start)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = [number, 0, 0, 0, 0]
+            bucket[1] += 1
+            if code < 3:
+                bucket[2 + code] += 1
+        if len(buckets) > MAX_INDEX_BUCKETS:
+            self._widen(len(buckets) // MAX_INDEX_BUCKETS + 1)
+
+    def _widen(self, factor: int) -> None:
+        width = next((w for w in BUCKET_WIDTHS if w >= self.width * factor), self.width * factor)
+        self.buckets = self._regroup(width)
+        self.width = width
+
+    def _regroup(self, width: int) -> dict:
+        merged: dict[int, list[int]] = {}
+        for key in sorted(self.buckets):
+            bucket = self.buckets[key]
+            target = merged.get(key // width * width)
+            if target is None:
+                merged[key // width * width] = list(bucket)
+            else:
+                for n in range(1, 5):
+                    target[n] += bucket[n]
+        return merged
+
+    def histogram(self, fmt: str, max_buckets: int = HISTOGRAM_BUCKETS) -> dict:
+        """Error rate over time, in at most ``max_buckets`` bars, for summary_stats."""
+        if not self.buckets:
+            return None
+        start, end = min(self.buckets), max(self.buckets) + self.width
+        width = next(
+            (w for w in BUCKET_WIDTHS if w >= self.width and (end - start) / w <= max_buckets),
+            max(self.width, -(-(end - start) // max_buckets)),
+        )
+        grouped = self._regroup(width)
+        first = start // width * width
+        bars = []
+        for key in range(first, end, width):
+            _, lines, critical, errors, warnings = grouped.get(key, (0, 0, 0, 0, 0))
+            bars.append({
+                "start": format_time(key, fmt),
+                "lines": lines,
+                "errors": critical + errors,
+                "warnings": warnings,
+                "error_rate": round((critical + errors) / lines, 4) if lines else 0.0,
+            })
+        return {
+            "format": fmt,
+            "bucket_seconds": width,
+            "start": format_time(start, fmt),
+            "end": format_time(end, fmt),
+            "untimed_lines": self.untimed,
+            "buckets": bars,
+        }
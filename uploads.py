@@ -0,0 +1,141 @@
+"""
+Plain and compressed log uploads.
+gzip, zstd and bz2 files and tar bundles of rotated logs (optionally
+compressed, with compressed members) are decompressed as a stream of
+blocks straight into the preprocessor, so the decompressed log is never
+held in memory. The output is capped at a multiple of the upload size to
+stop decompression bombs.
+"""
+
+import bz2
+import gzip
+import os
+import tarfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional: .zst uploads are refused
+    zstandard = None
+
+
+# ─── Tuning ─────────────────────────────────────────────────────────────────
+MAX_DECOMPRESSION_RATIO = 200              # decompressed bytes per upload byte
+MIN_DECOMPRESSED_LIMIT = 16 * 1024 * 1024  # cap for tiny uploads, in bytes
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+# Compression by file suffix; anything else must be .txt
+SUFFIXES = {".gz": "gzip", ".tgz": "gzip", ".zst": "zstd", ".zstd": "zstd", ".bz2": "bz2", ".tar": None, ".txt": None}
+MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd", b"BZh": "bz2"}
+ALLOWED_NAMES = ".txt, .gz, .zst, .bz2, .tar or .tar.gz"
+# Errors from corrupt or truncated input
+DECODE_ERRORS = (OSError, EOFError, zlib.error, tarfile.TarError) + (
+    (zstandard.ZstdError,) if zstandard is not None else ()
+)
+
+
+class UploadError(Exception):
+    pass
+
+
+class DecompressionLimitError(UploadError):
+    pass
+
+
+def is_supported(name: str) -> bool:
+    return os.path.splitext(name.lower())[1] in SUFFIXES
+
+
+def is_tar(name: str) -> bool:
+    name = name.lower()
+    return name.endswith((".tar", ".tgz")) or ".tar." in name
+
+
+def sniff(fileobj) -> str:
+    """Compression of a seekable file from its magic bytes (None: plain)."""
+    position = fileobj.tell()
+    head = fileobj.read(4)
+    fileobj.seek(position)
+    return next((kind for magic, kind in MAGIC.items() if head.startswith(magic)), None)
+
+
+def _decompressed(fileobj, kind: str):
+    """A file object reading the decompressed stream (all frames/members)."""
+    if kind == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if kind == "bz2":
+        return bz2.BZ2File(fileobj, mode="rb")
+    if kind == "zstd":
+        if zstandard is None:
+            raise UploadError("zstd uploads need the zstandard package on the server")
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    return fileobj
+
+
+class UploadReader:
+    """
+    Decompressed blocks of one upload. ``size`` is the upload's size in
+    bytes; iterating raises DecompressionLimitError once the output
+    exceeds ``max_ratio`` times that (or MIN_DECOMPRESSED_LIMIT).
+    """
+
+    def __init__(self, fileobj, name: str, size: int, block_size: int, max_ratio: int = MAX_DECOMPRESSION_RATIO):
+        self.fileobj = fileobj
+        self.name = name
+        self.block_size = block_size
+        self.compression = sniff(fileobj)
+        self.tar = is_tar(name)
+        self.limit = max(size * max_ratio, MIN_DECOMPRESSED_LIMIT)
+        self.max_ratio = max_ratio
+        self.bytes = 0
+        self.members = 0
+
+    @property
+    def compressed(self) -> bool:
+        return self.compression is not None or self.tar
+
+    def describe(self) -> dict:
+        """Upload details for ProcessedLog.perf."""
+        info = {"compression": self.compression, "decompressed_bytes": self.bytes}
+        if self.tar:
+            info["members"] = self.members
+        return info
+
+    def __iter__(self):
+        try:
+            stream = _decompressed(self.fileobj, self.compression)
+            if self.tar:
+                yield from self._tar_blocks(stream)
+            else:
+                yield from self._blocks(stream)
+        except DECODE_ERRORS as e:
+            raise UploadError(f"Could not decompress {self.name}: {e}") from e
+
+    def _blocks(self, stream):
+        last = b"\n"
+        while True:
+            block = stream.read(self.block_size)
+            if not block:
+                break
+            self.bytes += len(block)
+            if self.bytes > self.limit:
+                raise DecompressionLimitError(
+                    f"Decompressed upload exceeds {self.max_ratio}x its compressed size"
+                )
+            last = block
+            yield block
+        # Keep the last line of one tar member apart from the next member
+        if self.tar and not last.endswith(b"\n"):
+            yield b"\n"
+
+    def _tar_blocks(self, stream):
+        # Stream mode ("r|"): members are read in order, never seeked
+        with tarfile.open(fileobj=stream, mode="r|") as bundle:
+            for member in bundle:
+                if not member.isfile():
+                    continue
+                self.members += 1
+                member_stream = bundle.extractfile(member)
+                kind = SUFFIXES.get(os.path.splitext(member.name.lower())[1])
+                yield from self._blocks(_decompressed(member_stream, kind))
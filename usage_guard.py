@@ -1,10 +1,19 @@
 from fastapi import HTTPException, Request
-from datetime import datetime, timezone
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+import asyncio
+import time
+
+from metrics import USAGE_GUARD_SECONDS
 
 
 # ─── Limits (adjust freely, revert before production) ───────────────────────
 ANON_LIMIT = 3     # free anonymous requests per day
 USER_LIMIT = 20    # authenticated requests per day
+# Rule-based (no LLM) reports have their own, cheaper quota
+ANON_LOCAL_LIMIT = 30
+USER_LOCAL_LIMIT = 300
 # ─────────────────────────────────────────────────────────────────────────────
 
 
@@ -25,113 +34,293 @@ def is_new_day(last_request) -> bool:
 
 # ─── Main entry point ────────────────────────────────────────────────────────
 
-async def usage_guard(request: Request, user=None, supabase_admin=None):
+async def usage_guard(request: Request, user=None, supabase_admin=None, tier: str = "llm", charge: bool = True):
     """
     Call at the top of /analyze-stream BEFORE any AI logic.
 
     :param request:        FastAPI Request (used for headers + client IP)
     :param user:           Decoded JWT payload dict if authenticated, else None
     :param supabase_admin: Supabase admin client (pass-in to avoid circular import)
+    :param tier:           "llm", or "local" for the rule-based report quota
+    :param charge:         False to only check that the quota is not used up
     """
-    anon_id = request.headers.get("x-anon-id", "").strip()
-    ip = request.client.host if request.client else "unknown"
+    started = time.perf_counter()
+    result = "allowed"
+    try:
+        anon_id = request.headers.get("x-anon-id", "").strip()
+        ip = request.client.host if request.client else "unknown"
+
+        # Safety: validate anon_id length
+        if anon_id and len(anon_id) > 100:
+            raise HTTPException(status_code=400, detail="Invalid anon_id")
+
+        if user:
+            await _check_user_limit(user["sub"], supabase_admin, tier, charge)
+        elif anon_id:
+            await _check_anon_limit(anon_id, ip, supabase_admin, tier, charge)
+        else:
+            raise HTTPException(status_code=400, detail="Missing identity")
+    except HTTPException as e:
+        result = "limited" if e.status_code == 403 else "rejected"
+        raise
+    finally:
+        USAGE_GUARD_SECONDS.labels(result).observe(time.perf_counter() - started)
 
-    # Safety: validate anon_id length
-    if anon_id and len(anon_id) > 100:
-        raise HTTPException(status_code=400, detail="Invalid anon_id")
 
+def usage_refund(request: Request, user=None, supabase_admin=None, tier: str = "llm"):
+    """Give back one request charged by usage_guard (e.g. on escalation)."""
+    if supabase_admin is None:
+        return
     if user:
-        await _check_user_limit(user["sub"], supabase_admin)
-    elif anon_id:
-        await _check_anon_limit(anon_id, ip, supabase_admin)
+        usage_counters.refund(_table("user", tier), user["sub"])
     else:
-        raise HTTPException(status_code=400, detail="Missing identity")
+        usage_counters.refund(_table("anon", tier), request.headers.get("x-anon-id", "").strip())
 
 
-# ─── Anonymous limit logic ──────────────────────────────────────────────────
+# ─── Counter engine ─────────────────────────────────────────────────────────
 
-async def _check_anon_limit(anon_id: str, ip: str, supabase_admin):
-    if supabase_admin is None:
-        return  # Graceful no-op if DB not configured
+USAGE_FLUSH_INTERVAL = 2.0   # seconds between write-behind flushes
+USAGE_MAX_ENTRIES = 50_000   # identities kept in memory (LRU)
 
-    try:
-        result = supabase_admin.table("anonymous_usage") \
+
+def _unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Usage check unavailable, please retry shortly",
+        headers={"Retry-After": "5"},
+    )
+
+
+@dataclass
+class _UsageEntry:
+    count: int
+    day: date
+    last_request: str
+    extra: dict
+    dirty: bool = False
+
+
+class UsageCounters:
+    """
+    In-process daily usage counters with write-behind persistence.
+
+    Check-and-increment happens in memory with no await in between, so it
+    is atomic on the event loop and costs no HTTP calls. An identity seen
+    for the first time is loaded from Supabase once (concurrent misses
+    share the load, and a failed load refuses the request with 503 rather
+    than starting from zero); increments are upserted in batches every
+    USAGE_FLUSH_INTERVAL seconds. Counts are per process, and at most one
+    flush interval of increments is lost on a crash.
+    """
+
+    def __init__(self, flush_interval: float = USAGE_FLUSH_INTERVAL, max_entries: int = USAGE_MAX_ENTRIES):
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, _UsageEntry] = OrderedDict()
+        self._loading: dict[tuple, asyncio.Future] = {}
+        self._clients: dict[str, object] = {}
+        self._flusher = None
+        self.hits = 0
+        self.misses = 0
+
+    # ─── Loading ────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _load(supabase_admin, table: str, id_column: str, identity: str):
+        """The stored row, or None if there is none. Query errors propagate."""
+        result = supabase_admin.table(table) \
             .select("id, request_count, last_request") \
-            .eq("anon_id", anon_id) \
-            .single() \
+            .eq(id_column, identity) \
+            .limit(1) \
             .execute()
-        record = result.data
-    except Exception:
-        record = None
-
-    if record is None:
-        # First visit — create record
-        supabase_admin.table("anonymous_usage").insert({
-            "anon_id": anon_id,
-            "ip_address": ip,
-            "request_count": 1,
-            "last_request": _utc_now().isoformat(),
-        }).execute()
-        return
+        return result.data[0] if result.data else None
 
-    # Day reset
-    if is_new_day(record["last_request"]):
-        supabase_admin.table("anonymous_usage").update({
-            "request_count": 1,
-            "last_request": _utc_now().isoformat(),
-        }).eq("anon_id", anon_id).execute()
-        return
+    async def _get_entry(self, supabase_admin, table: str, id_column: str, identity: str) -> _UsageEntry:
+        key = (table, identity)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
 
-    # Limit check
-    if record["request_count"] >= ANON_LIMIT:
-        raise HTTPException(status_code=403, detail="FREE_LIMIT_REACHED")
+        loading = self._loading.get(key)
+        if loading is None:
+            self.misses += 1
+            loading = self._loading[key] = asyncio.ensure_future(
+                asyncio.to_thread(self._load, supabase_admin, table, id_column, identity)
+            )
+            try:
+                record = await loading
+            except Exception as e:
+                # Fail closed: starting from 0 would let the next flush
+                # overwrite the stored count and reset the daily quota
+                print(f"[USAGE] Failed to load {table} counter: {e}")
+                raise _unavailable()
+            finally:
+                del self._loading[key]
+            now = _utc_now()
+            if record is None or is_new_day(record["last_request"]):
+                entry = _UsageEntry(count=0, day=now.date(), last_request=now.isoformat(), extra={})
+            else:
+                entry = _UsageEntry(
+                    count=record["request_count"],
+                    day=now.date(),
+                    last_request=record["last_request"],
+                    extra={},
+                )
+            self._entries[key] = entry
+            self._evict()
+            return entry
 
-    # Increment
-    supabase_admin.table("anonymous_usage").update({
-        "request_count": record["request_count"] + 1,
-        "last_request": _utc_now().isoformat(),
-    }).eq("anon_id", anon_id).execute()
+        try:
+            await loading
+        except Exception:
+            raise _unavailable()
+        return await self._get_entry(supabase_admin, table, id_column, identity)
 
+    def _evict(self):
+        # Dirty entries are kept until flushed so no increment is dropped
+        if len(self._entries) <= self.max_entries:
+            return
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            if not self._entries[key].dirty:
+                del self._entries[key]
 
-# ─── Authenticated user limit logic ─────────────────────────────────────────
+    # ─── Check and increment ────────────────────────────────────────────────
+
+    async def check_and_increment(
+        self,
+        supabase_admin,
+        table: str,
+        id_column: str,
+        identity: str,
+        limit: int,
+        extra: dict = None,
+        charge: bool = True,
+    ) -> bool:
+        """
+        Count one request for identity; False if it is already at limit.
+        With ``charge=False`` nothing is counted.
+        """
+        self._clients[table] = supabase_admin
+        self._ensure_flusher()
+        entry = await self._get_entry(supabase_admin, table, id_column, identity)
 
-async def _check_user_limit(user_id: str, supabase_admin):
+        now = _utc_now()
+        if entry.day < now.date():
+            entry.count = 0
+            entry.day = now.date()
+        if entry.count >= limit:
+            return False
+
+        if not charge:
+            return True
+
+        entry.count += 1
+        entry.last_request = now.isoformat()
+        entry.extra = extra or {}
+        entry.dirty = True
+        return True
+
+    def refund(self, table: str, identity: str) -> None:
+        """Take back one request counted today (no-op if none is cached)."""
+        entry = self._entries.get((table, identity))
+        if entry is None or entry.count <= 0 or entry.day < _utc_now().date():
+            return
+        entry.count -= 1
+        entry.dirty = True
+
+    # ─── Write-behind ───────────────────────────────────────────────────────
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Upsert all dirty counters, one batched request per table."""
+        batches: dict[str, list] = {}
+        for (table, identity), entry in self._entries.items():
+            if entry.dirty:
+                entry.dirty = False
+                batches.setdefault(table, []).append(((table, identity), entry))
+
+        for table, items in batches.items():
+            id_column = _ID_COLUMNS[table]
+            rows = [
+                {
+                    id_column: identity,
+                    **entry.extra,
+                    "request_count": entry.count,
+                    "last_request": entry.last_request,
+                }
+                for (_, identity), entry in items
+            ]
+            client = self._clients[table]
+            try:
+                await asyncio.to_thread(
+                    lambda: client.table(table).upsert(rows, on_conflict=id_column).execute()
+                )
+            except Exception as e:
+                print(f"[USAGE] Failed to flush {len(rows)} {table} counters: {e}")
+                for _, entry in items:
+                    entry.dirty = True
+
+    async def close(self):
+        """Stop the background flusher and write out pending counts."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+
+_ID_COLUMNS = {
+    "anonymous_usage": "anon_id",
+    "user_usage": "user_id",
+    "anonymous_local_usage": "anon_id",
+    "user_local_usage": "user_id",
+}
+
+usage_counters = UsageCounters()
+
+
+def _table(kind: str, tier: str) -> str:
+    if kind == "anon":
+        return "anonymous_local_usage" if tier == "local" else "anonymous_usage"
+    return "user_local_usage" if tier == "local" else "user_usage"
+
+
+# ─── Anonymous limit logic ──────────────────────────────────────────────────
+
+async def _check_anon_limit(anon_id: str, ip: str, supabase_admin, tier: str = "llm", charge: bool = True):
     if supabase_admin is None:
         return  # Graceful no-op if DB not configured
 
-    try:
-        result = supabase_admin.table("user_usage") \
-            .select("id, request_count, last_request") \
-            .eq("user_id", user_id) \
-            .single() \
-            .execute()
-        record = result.data
-    except Exception:
-        record = None
-
-    if record is None:
-        # First request for this user
-        supabase_admin.table("user_usage").insert({
-            "user_id": user_id,
-            "request_count": 1,
-            "last_request": _utc_now().isoformat(),
-        }).execute()
-        return
+    limit = ANON_LOCAL_LIMIT if tier == "local" else ANON_LIMIT
+    allowed = await usage_counters.check_and_increment(
+        supabase_admin, _table("anon", tier), "anon_id", anon_id, limit,
+        extra={"ip_address": ip}, charge=charge,
+    )
+    if not allowed:
+        raise HTTPException(status_code=403, detail="FREE_LIMIT_REACHED")
 
-    # Day reset
-    if is_new_day(record["last_request"]):
-        supabase_admin.table("user_usage").update({
-            "request_count": 1,
-            "last_request": _utc_now().isoformat(),
-        }).eq("user_id", user_id).execute()
-        return
 
-    # Limit check
-    if record["request_count"] >= USER_LIMIT:
-        raise HTTPException(status_code=403, detail="USER_LIMIT_REACHED")
+# ─── Authenticated user limit logic ─────────────────────────────────────────
 
-    # Increment
-    supabase_admin.table("user_usage").update({
-        "request_count": record["request_count"] + 1,
-        "last_request": _utc_now().isoformat(),
-    }).eq("user_id", user_id).execute()
+async def _check_user_limit(user_id: str, supabase_admin, tier: str = "llm", charge: bool = True):
+    if supabase_admin is None:
+        return  # Graceful no-op if DB not configured
+
+    limit = USER_LOCAL_LIMIT if tier == "local" else USER_LIMIT
+    allowed = await usage_counters.check_and_increment(
+        supabase_admin, _table("user", tier), "user_id", user_id, limit,
+        charge=charge,
+    )
+    if not allowed:
+        raise HTTPException(status_code=403, detail="USER_LIMIT_REACHED")